@@ -0,0 +1,7 @@
+import os
+
+# Benchmarks run offline: send floggit output to stdout instead of Cloud
+# Logging, and give the agent module the config it reads at import time.
+os.environ.setdefault('NO_GOOGLE_LOGGING', '1')
+os.environ.setdefault('KG_MCP_SERVER', 'http://localhost:8081/mcp')
+os.environ.setdefault('DEFAULT_GRAPH_ID', 'benchmark')
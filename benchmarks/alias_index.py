@@ -0,0 +1,139 @@
+"""Measures fuzzy entity name matching (AliasIndex) against exact matching (EntityMatcher).
+
+    python -m benchmarks.alias_index --players 10000 100000 --aliases 3
+
+For each synthetic scouting graph, builds both matchers (time and peak Python
+memory), then asks questions naming a random entity by its full name, changed
+in one of these ways:
+
+    exact        as is
+    typo         one letter deleted, inserted, replaced or transposed
+    accents      letters replaced by accented ones ("Jose" -> "José")
+    punctuation  words joined with hyphens, in upper case, or possessive
+    lowercase    all lower case, without punctuation
+
+and reports, per change, the share of questions for which each matcher found
+the entity (recall), and how many entities it matched on average, plus the
+lookup latency of each matcher.
+"""
+import argparse
+import random
+import statistics
+import time
+import tracemalloc
+
+from kaybee_agent.alias_index import AliasIndex
+from kaybee_agent.entity_matcher import EntityMatcher
+from .synthetic import make_scouting_graph
+
+CHANGES = ['exact', 'typo', 'accents', 'punctuation', 'lowercase']
+ACCENTS = {'a': 'á', 'e': 'é', 'i': 'í', 'o': 'ó', 'u': 'ú', 'n': 'ñ'}
+TEMPLATES = [
+    'How has {} been doing this season?',
+    'What do our scouts think of {}?',
+    'Compare {} with the best shortstop in AA.',
+]
+
+
+def _change(name: str, change: str, rng: random.Random) -> str:
+    if change == 'typo':
+        # In a word of letters: numbers in names must match exactly.
+        spans = [(i, i + len(w)) for i, w in _words(name) if w.isalpha() and len(w) > 3]
+        start, end = rng.choice(spans)
+        i = rng.randrange(start + 1, end - 1)
+        kind = rng.choice(['delete', 'insert', 'replace', 'transpose'])
+        if kind == 'delete':
+            return name[:i] + name[i + 1:]
+        if kind == 'insert':
+            return name[:i] + rng.choice('aeiourst') + name[i:]
+        if kind == 'replace':
+            return name[:i] + rng.choice([c for c in 'aeiourst' if c != name[i].lower()]) + name[i + 1:]
+        return name[:i] + name[i + 1] + name[i] + name[i + 2:]
+    if change == 'accents':
+        return ''.join(ACCENTS.get(c, c) if rng.random() < 0.5 else c for c in name)
+    if change == 'punctuation':
+        return rng.choice([name.replace(' ', '-'), name.upper(), f"{name}'s"])
+    if change == 'lowercase':
+        return name.lower()
+    return name
+
+
+def _words(name: str) -> list[tuple[int, str]]:
+    words, i = [], 0
+    for word in name.split(' '):
+        words.append((i, word))
+        i += len(word) + 1
+    return words
+
+
+def _peak(func):
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        result = func()
+        return result, time.perf_counter() - start, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _percentiles(samples: list[float]) -> str:
+    quantiles = statistics.quantiles(samples, n=100, method='inclusive')
+    return f'p50={quantiles[49]:.3f}ms p99={quantiles[98]:.3f}ms'
+
+
+def run(num_players: int, args) -> None:
+    graph = make_scouting_graph(num_players, aliases=args.aliases)
+    entities = graph['entities']
+    # Traced once for memory, then timed untraced.
+    _, _, matcher_bytes = _peak(lambda: EntityMatcher(entities))
+    _, _, index_bytes = _peak(lambda: AliasIndex(entities, min_score=args.min_score))
+    start = time.perf_counter()
+    matcher = EntityMatcher(entities)
+    matcher_s = time.perf_counter() - start
+    start = time.perf_counter()
+    index = AliasIndex(entities, min_score=args.min_score)
+    index_s = time.perf_counter() - start
+    print(f'{num_players} players: {len(entities)} entities, {len(index)} distinct names')
+    print(f'  build   exact: {matcher_s:.2f}s {matcher_bytes / 2**20:.0f}MB'
+          f'   fuzzy: {index_s:.2f}s {index_bytes / 2**20:.0f}MB')
+
+    rng = random.Random(0)
+    people = [e for e in entities.values() if e['properties'].get('role') or 'position' in e['properties']]
+    latencies = {'exact': [], 'fuzzy': []}
+    print(f"  {'change':<12} {'exact':>7} {'fuzzy':>7} {'exact_n':>8} {'fuzzy_n':>8}")
+    for change in CHANGES:
+        found = {'exact': 0, 'fuzzy': 0}
+        matched = {'exact': 0, 'fuzzy': 0}
+        for _ in range(args.queries):
+            entity = rng.choice(people)
+            query = rng.choice(TEMPLATES).format(_change(entity['entity_names'][0], change, rng))
+
+            start = time.perf_counter()
+            exact = matcher.match(query)
+            latencies['exact'].append(1000 * (time.perf_counter() - start))
+            start = time.perf_counter()
+            # As kg_service does: exact matches, plus fuzzy ones.
+            fuzzy = exact | index.match(query).keys()
+            latencies['fuzzy'].append(latencies['exact'][-1] + 1000 * (time.perf_counter() - start))
+
+            for name, ids in (('exact', exact), ('fuzzy', fuzzy)):
+                found[name] += entity['entity_id'] in ids
+                matched[name] += len(ids)
+        print(f"  {change:<12} {found['exact'] / args.queries:>7.1%} {found['fuzzy'] / args.queries:>7.1%}"
+              f" {matched['exact'] / args.queries:>8.1f} {matched['fuzzy'] / args.queries:>8.1f}")
+    print(f"  lookup  exact: {_percentiles(latencies['exact'])}   exact+fuzzy: {_percentiles(latencies['fuzzy'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--players', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--aliases', type=int, default=3, help='Names per entity (1-3).')
+    parser.add_argument('--queries', type=int, default=500, help='Questions per kind of change.')
+    parser.add_argument('--min-score', type=float, default=0.85)
+    args = parser.parse_args()
+    for num_players in args.players:
+        run(num_players, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Compares cold-start time and memory of JSON graphs against memory-mapped `.kbg` graphs.
+
+    python -m benchmarks.graph_binary --entities 200000 --relationships 1000000
+
+Each format is loaded in a fresh subprocess, which opens the graph, builds the
+entity matcher over its names (as kg_service does before a graph's first
+retrieval) and answers one 2-hop subgraph query. The time to each step and
+the peak RSS it added over the imported modules are reported.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from kaybee_agent.graph_binary import write_binary_graph
+from .synthetic import make_graph
+
+_LOAD = '''
+import json, resource, sys, time
+from kaybee_agent.entity_matcher import EntityMatcher
+from kaybee_agent.graph_binary import BinaryGraph
+from kaybee_agent.graph_index import GraphIndex
+baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+if sys.argv[1] == "json":
+    with open(sys.argv[2]) as f:
+        g = json.load(f)
+    index, names = GraphIndex(g), g["entities"]
+else:
+    g = BinaryGraph(sys.argv[2])
+    index, names = g.index(), g.aliases
+opened = time.perf_counter() - start
+matcher = EntityMatcher(names)
+matcher.prepare()
+matched = time.perf_counter() - start
+index.subgraph(matcher.match("how is player 0 doing?"), num_hops=2)
+queried = time.perf_counter() - start
+print(json.dumps({"open_s": opened, "matcher_s": matched, "first_query_s": queried,
+                  "added_rss_mb": (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline_rss) / 1024}))
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--entities', type=int, default=200_000)
+    parser.add_argument('--relationships', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    graph = make_graph(args.entities, args.relationships)
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {'json': os.path.join(tmp, 'graph.json'), 'kbg': os.path.join(tmp, 'graph.kbg')}
+        with open(paths['json'], 'w') as f:
+            json.dump(graph, f)
+        write_binary_graph(graph, paths['kbg'])
+        del graph
+
+        for fmt, path in paths.items():
+            out = subprocess.run(
+                    [sys.executable, '-c', _LOAD, fmt, path],
+                    capture_output=True, text=True, check=True).stdout
+            result = json.loads(out.splitlines()[-1])
+            print(f'{fmt:>5}: {os.path.getsize(path) / 2**20:.1f} MB on disk, ' + ', '.join(
+                f'{k}={v:.4g}' for k, v in result.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Compares GraphIndex subgraph extraction against the original NetworkX implementation.
+
+    python -m benchmarks.graph_index --sizes 10000 100000 1000000
+
+The reference copies the whole graph per visited entity, so on 1M edges it takes
+several minutes per query; use --reference-queries to bound it.
+"""
+import argparse
+import random
+import time
+
+import networkx as nx
+
+from kaybee_agent.graph_index import GraphIndex
+from .synthetic import make_graph
+
+
+def networkx_subgraph(entity_ids: set[str], graph: dict, num_hops: int = 2) -> dict:
+    '''The NetworkX-based `_get_knowledge_subgraph` this index replaced, kept as the reference.'''
+    mdg = nx.MultiDiGraph()
+    mdg.add_nodes_from((k, v) for k, v in graph["entities"].items())
+    mdg.add_edges_from(
+        (rel["source_entity_id"], rel["target_entity_id"], {"relationship": rel["relationship"]})
+        for rel in graph.get("relationships", [])
+    )
+
+    nbrs1 = {
+            nbr for entity_id in entity_ids
+            for nbr in mdg.to_undirected().neighbors(entity_id)
+            if nbr not in entity_ids
+    }
+    if num_hops > 1:
+        nbrs2 = {
+                nbr for entity_id in nbrs1
+                for nbr in mdg.to_undirected().neighbors(entity_id)
+                if nbr not in entity_ids and nbr not in nbrs1
+        }
+        outer_nbrs = nbrs2
+    else:
+        nbrs2 = set()
+        outer_nbrs = nbrs1
+
+    valence_entities = {
+            entity_id for entity_id in outer_nbrs
+            if set(mdg.to_undirected().neighbors(entity_id)) - entity_ids - nbrs1 - nbrs2
+    }
+
+    subgraph_json = nx.node_link_data(mdg.subgraph(entity_ids | nbrs1 | nbrs2), edges="links")
+    return {
+        'entities': {
+            node['entity_id']: dict(**node, has_external_neighbor=(node['entity_id'] in valence_entities))
+            for node in subgraph_json['nodes']
+        },
+        'relationships': [
+            {
+                'source_entity_id': link['source'],
+                'target_entity_id': link['target'],
+                'relationship': link['relationship']
+            } for link in subgraph_json['links']
+        ]
+    }
+
+
+def _same(a: dict, b: dict) -> bool:
+    # NetworkX orders subgraph nodes by set iteration, so compare relationships as multisets.
+    def key(r: dict) -> tuple:
+        return r['source_entity_id'], r['target_entity_id'], r['relationship']
+
+    return (a['entities'] == b['entities']
+            and sorted(map(key, a['relationships'])) == sorted(map(key, b['relationships'])))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000],
+                        help='Numbers of relationships to benchmark.')
+    parser.add_argument('--entities-per-edge', type=float, default=0.2)
+    parser.add_argument('--seeds', type=int, default=3, help='Seed entities per query.')
+    parser.add_argument('--queries', type=int, default=5)
+    parser.add_argument('--reference-queries', type=int, default=1,
+                        help='How many of the queries to also run (and check) through NetworkX.')
+    parser.add_argument('--num-hops', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    print(f"{'edges':>10} {'build_ms':>10} {'index_ms':>10} {'networkx_ms':>12} {'speedup':>8}")
+    for num_edges in args.sizes:
+        g = make_graph(num_entities=int(num_edges * args.entities_per_edge), num_relationships=num_edges)
+        queries = [set(rng.sample(list(g['entities']), args.seeds)) for _ in range(args.queries)]
+
+        start = time.perf_counter()
+        index = GraphIndex(g)
+        build_ms = 1000 * (time.perf_counter() - start)
+
+        index_ms = networkx_ms = 0.0
+        for entity_ids in queries:
+            start = time.perf_counter()
+            index.subgraph(entity_ids=entity_ids, num_hops=args.num_hops)
+            index_ms += 1000 * (time.perf_counter() - start)
+
+        for entity_ids in queries[:args.reference_queries]:
+            start = time.perf_counter()
+            expected = networkx_subgraph(entity_ids=entity_ids, graph=g, num_hops=args.num_hops)
+            networkx_ms += 1000 * (time.perf_counter() - start)
+
+            result = index.subgraph(entity_ids=entity_ids, num_hops=args.num_hops)
+            assert _same(result, expected), f'Mismatch for seeds {entity_ids}'
+
+        index_ms /= len(queries)
+        networkx_ms /= min(len(queries), args.reference_queries)
+        print(f"{num_edges:>10} {build_ms:>10.1f} {index_ms:>10.2f} {networkx_ms:>12.1f} {networkx_ms / index_ms:>7.0f}x")
+
+
+if __name__ == '__main__':
+    main()
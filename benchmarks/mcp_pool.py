@@ -0,0 +1,180 @@
+"""Compares knowledge graph MCP tool calls with and without the session pool, against the offline stand-in server.
+
+    python -m benchmarks.mcp_pool --calls 200 --concurrency 8 --graphs 4
+
+Starts `kaybee_agent.offline_mcp` on synthetic graphs and makes
+`search_knowledge_graph` calls for random graphs, three ways:
+
+    fresh    a new session per call: connect, initialize, list tools, call
+    listed   one session per graph, listing tools before every call (what
+             McpToolset does on each model call)
+    pooled   McpSessionPool: pooled sessions and the cached tool list
+
+Each call's answer is checked to come from the graph it was routed to.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import AsyncExitStack
+
+from mcp import ClientSession
+from mcp.client.streamable_http import streamablehttp_client
+
+from kaybee_agent.mcp_pool import GRAPH_ID_HEADER, McpSessionPool
+from .synthetic import make_scouting_graph
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _graph_ids(args) -> list[str]:
+    return [f'graph{i}' for i in range(args.graphs)]
+
+
+def _write_graphs(root: str, args) -> dict[str, str]:
+    """Writes the graphs, returning a player name found only in each."""
+    names = {}
+    for i, graph_id in enumerate(_graph_ids(args)):
+        graph = make_scouting_graph(args.players, seed=i)
+        player = f'{graph_id} Prospect'
+        graph['entities'][player] = {'entity_id': player, 'entity_names': [player], 'properties': {}}
+        names[graph_id] = player
+        with open(os.path.join(root, f'{graph_id}.json'), 'w') as f:
+            json.dump(graph, f)
+    return names
+
+
+async def _wait_for_server(url: str, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            async with streamablehttp_client(url) as (read, write, _):
+                async with ClientSession(read, write) as session:
+                    await session.initialize()
+                    return
+        except Exception:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+
+def _check(graph_id: str, player: str, result) -> None:
+    text = result.content[0].text if result.content else ''
+    if result.isError or player not in text:
+        raise AssertionError(f'Call for {graph_id} was not answered from {graph_id}: {text[:200]}')
+
+
+async def run_fresh(url: str, graph_id: str, player: str) -> None:
+    async with streamablehttp_client(url, headers={GRAPH_ID_HEADER: graph_id}) as (read, write, _):
+        async with ClientSession(read, write) as session:
+            await session.initialize()
+            await session.list_tools()
+            _check(graph_id, player, await session.call_tool('search_knowledge_graph', {'query': player}))
+
+
+class _Listed:
+    """One session per graph, listing tools before each call."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.stack = AsyncExitStack()
+        self.sessions: dict[str, ClientSession] = {}
+
+    async def open(self, graph_ids: list[str]) -> None:
+        # In the caller's task: a session must be closed by the task that opened it.
+        for graph_id in graph_ids:
+            read, write, _ = await self.stack.enter_async_context(
+                    streamablehttp_client(self.url, headers={GRAPH_ID_HEADER: graph_id}))
+            session = self.sessions[graph_id] = await self.stack.enter_async_context(
+                    ClientSession(read, write))
+            await session.initialize()
+
+    async def call(self, graph_id: str, player: str) -> None:
+        session = self.sessions[graph_id]
+        await session.list_tools()
+        _check(graph_id, player, await session.call_tool('search_knowledge_graph', {'query': player}))
+
+
+async def run_pooled(pool: McpSessionPool, graph_id: str, player: str) -> None:
+    await pool.list_tools()
+    session = await pool.session({GRAPH_ID_HEADER: graph_id})
+    _check(graph_id, player, await session.call_tool('search_knowledge_graph', {'query': player}))
+
+
+async def measure(mode: str, url: str, names: dict[str, str], args) -> dict:
+    rng = random.Random(0)
+    calls = [rng.choice(list(names)) for _ in range(args.calls)]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    pool = McpSessionPool(url)
+    listed = _Listed(url)
+
+    async def one(graph_id: str) -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            if mode == 'fresh':
+                await run_fresh(url, graph_id, names[graph_id])
+            elif mode == 'listed':
+                await listed.call(graph_id, names[graph_id])
+            else:
+                await run_pooled(pool, graph_id, names[graph_id])
+            latencies.append(1000 * (time.perf_counter() - start))
+
+    start = time.perf_counter()
+    try:
+        if mode == 'listed':
+            async with listed.stack:
+                await listed.open(list(names))
+                await asyncio.gather(*(one(graph_id) for graph_id in calls))
+        else:
+            await asyncio.gather(*(one(graph_id) for graph_id in calls))
+    finally:
+        await pool.close()
+    wall = time.perf_counter() - start
+    quantiles = statistics.quantiles(latencies, n=100, method='inclusive')
+    return {'calls_per_s': len(calls) / wall, 'p50_ms': quantiles[49], 'p99_ms': quantiles[98],
+            **({'pool': pool.stats()} if mode == 'pooled' else {})}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--graphs', type=int, default=4)
+    parser.add_argument('--players', type=int, default=1000)
+    parser.add_argument('--modes', nargs='+', choices=['fresh', 'listed', 'pooled'],
+                        default=['fresh', 'listed', 'pooled'])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        names = _write_graphs(root, args)
+        port = _free_port()
+        env = {**os.environ, 'KG_STORE': 'fs', 'KG_STORE_ROOT': root, 'DEFAULT_GRAPH_ID': 'graph0'}
+        server = subprocess.Popen(
+                [sys.executable, '-m', 'kaybee_agent.offline_mcp', '--port', str(port)],
+                env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        url = f'http://127.0.0.1:{port}/mcp'
+        try:
+            asyncio.run(_wait_for_server(url))
+            for mode in args.modes:
+                result = asyncio.run(measure(mode, url, names, args))
+                print(f'{mode:>7}: ' + ', '.join(
+                    f'{k}={v:.1f}' if isinstance(v, float) else f'{k}={v}' for k, v in result.items()))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""Measures property queries over a PropertyIndex against a scan of the entity dicts.
+
+    python -m benchmarks.property_index --players 100000 1000000
+
+For each synthetic scouting graph (whose players also get a throwing hand,
+except one in five, so that some entities lack some properties), builds the
+index (time and peak memory), then runs each query below both ways, checks
+that they agree, and reports the latency of each:
+
+    select     "left-handed pitchers under 22 with ERA < 3", best ERA first
+    top_k      the 20 shortstops with the highest ERA
+    group_by   count, mean ERA and youngest age per position
+    group_in   count and mean ERA per age, of pitchers and catchers
+    missing    players whose throwing hand isn't known
+"""
+import argparse
+import random
+import statistics
+import time
+import tracemalloc
+
+from kaybee_agent.property_index import PropertyIndex, parse_aggregate, parse_filter
+from .synthetic import make_scouting_graph
+
+QUERIES = {
+    'select': dict(filters=['position == P', 'throws == L', 'age < 22', 'era < 3'], sort_by='era'),
+    'top_k': dict(filters=['position == SS'], sort_by='era', descending=True),
+    'group_by': dict(group_by='position', aggregates=['count', 'mean(era)', 'min(age)']),
+    'group_in': dict(filters=['position in P, C'], group_by='age', aggregates=['count', 'mean(era)']),
+    'missing': dict(filters=['throws missing', 'position exists']),
+}
+
+
+def add_throwing_hands(graph: dict, seed: int = 0) -> None:
+    rng = random.Random(seed)
+    for entity in graph['entities'].values():
+        if 'position' in entity['properties'] and rng.random() < 0.8:
+            entity['properties']['throws'] = rng.choice('LRR')
+
+
+def run_index(index: PropertyIndex, query: dict, limit: int):
+    filters = [parse_filter(f) for f in query.get('filters', [])]
+    if 'aggregates' in query:
+        return index.aggregate(
+                filters, [parse_aggregate(a) for a in query['aggregates']],
+                group_by=query.get('group_by'), limit=None)
+    return index.query(filters, sort_by=query.get('sort_by'), descending=query.get('descending', False), limit=limit)
+
+
+def run_scan(entities: dict, query: dict, limit: int):
+    '''The same query, one entity dict at a time.'''
+    tests = {
+        '==': lambda v, x: str(v).casefold() == x.casefold() if isinstance(v, str) else v == float(x),
+        '<': lambda v, x: v < float(x),
+        'in': lambda v, x: str(v).casefold() in {y.casefold() for y in x},
+    }
+    filters = [parse_filter(f) for f in query.get('filters', [])]
+
+    def matches(properties: dict) -> bool:
+        for name, operator, value in filters:
+            if operator == 'exists' or operator == 'missing':
+                if (name in properties) != (operator == 'exists'):
+                    return False
+            elif name not in properties or not tests[operator](properties[name], value):
+                return False
+        return True
+
+    rows = [e for e in entities.values() if matches(e['properties'])]
+    if 'aggregates' in query:
+        groups = {}
+        for e in rows:
+            groups.setdefault(e['properties'].get(query['group_by']), []).append(e['properties'])
+        return {key: (len(members), _mean([p['era'] for p in members if 'era' in p]))
+                for key, members in groups.items()}
+    if sort_by := query.get('sort_by'):
+        rows.sort(key=lambda e: e['properties'][sort_by], reverse=query.get('descending', False))
+    return len(rows), rows[:limit]
+
+
+def _mean(values: list[float]):
+    return statistics.fmean(values) if values else None
+
+
+def _agree(query: dict, indexed, scanned, entities: dict) -> bool:
+    if 'aggregates' in query:
+        values = {v[query['group_by']]: (v['count'], v['mean(era)']) for v in indexed['values']}
+        return values.keys() == scanned.keys() and all(
+            values[k][0] == scanned[k][0] and (values[k][1] == scanned[k][1] or abs(values[k][1] - scanned[k][1]) < 1e-9)
+            for k in values)
+    # Ties may be broken differently; compare what was sorted on.
+    key = query.get('sort_by') or 'entity_id'
+    return indexed[0] == scanned[0] and (
+        [entities[e]['properties'].get(key, e) for e in indexed[1]]
+        == [e['properties'].get(key, e['entity_id']) for e in scanned[1]])
+
+
+def _percentiles(samples: list[float]) -> str:
+    quantiles = statistics.quantiles(samples, n=100, method='inclusive')
+    return f'p50={quantiles[49]:8.2f}ms p99={quantiles[98]:8.2f}ms'
+
+
+def run(num_players: int, args) -> None:
+    graph = make_scouting_graph(num_players, relationships_per_player=1)
+    add_throwing_hands(graph)
+    entities = graph['entities']
+    # Traced once for memory, then timed untraced.
+    tracemalloc.start()
+    PropertyIndex(entities)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    start = time.perf_counter()
+    index = PropertyIndex(entities)
+    build_s = time.perf_counter() - start
+    column_bytes = sum(c.values.nbytes + c.present.nbytes for c in index.columns.values())
+    print(f'{num_players} players: {len(index)} entities, {len(index.columns)} properties')
+    print(f'  build {build_s:.2f}s, peak {peak / 2**20:.0f}MB, columns {column_bytes / 2**20:.0f}MB')
+
+    for name, query in QUERIES.items():
+        indexed = run_index(index, query, args.limit)
+        scanned = run_scan(entities, query, args.limit)
+        if not _agree(query, indexed, scanned, entities):
+            raise AssertionError(f'{name}: index and scan disagree')
+        latencies = {'index': [], 'scan': []}
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            run_index(index, query, args.limit)
+            latencies['index'].append(1000 * (time.perf_counter() - start))
+        for _ in range(args.scan_repeat):
+            start = time.perf_counter()
+            run_scan(entities, query, args.limit)
+            latencies['scan'].append(1000 * (time.perf_counter() - start))
+        count = indexed[0] if isinstance(indexed, tuple) else indexed['count']
+        speedup = statistics.median(latencies['scan']) / statistics.median(latencies['index'])
+        print(f"  {name:<9} {count:>8} matches  index {_percentiles(latencies['index'])}"
+              f"  scan p50={statistics.median(latencies['scan']):8.1f}ms  x{speedup:.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--players', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=50, help='Timed runs of each indexed query.')
+    parser.add_argument('--scan-repeat', type=int, default=3, help='Timed runs of each scan.')
+    args = parser.parse_args()
+    for num_players in args.players:
+        run(num_players, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""Times the knowledge graph retrieval hot path, stage by stage, on synthetic scouting graphs.
+
+    python -m benchmarks.retrieval --players 10000 100000
+    python -m benchmarks.retrieval --save-baseline .benchmarks/retrieval.json
+    python -m benchmarks.retrieval --compare .benchmarks/retrieval.json
+
+Graphs are written to a temporary filesystem graph store and read back through
+kg_service. Stages:
+
+    fetch       reading and parsing the graph (cold cache)
+    derive      building its adjacency index and entity matcher (and, with
+                --fuzzy, its alias index)
+    match       `_match_entities`, as a turn matches the entities in its query
+    subgraph    `_extract_neighborhood`, with the configured limits (memo cleared)
+    serialize   building the KB context string
+
+Each stage reports p50/p99 latency and the peak Python memory it allocates
+(traced separately, once, so tracing doesn't skew the timings). With
+--compare, the run fails if any p50/p99 is more than --tolerance slower than
+the baseline.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from .synthetic import make_queries, make_scouting_graph
+
+STAGES = ['fetch', 'derive', 'match', 'subgraph', 'serialize']
+
+
+def _percentiles(samples: list[float]) -> dict:
+    if len(samples) == 1:
+        return {'p50_ms': samples[0], 'p99_ms': samples[0]}
+    quantiles = statistics.quantiles(samples, n=100, method='inclusive')
+    return {'p50_ms': quantiles[49], 'p99_ms': quantiles[98]}
+
+
+def _peak_bytes(func) -> int:
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(num_players: int, args: argparse.Namespace, store_root: str) -> dict:
+    # kg_service reads its configuration at import time.
+    from kaybee_agent import kg_service
+    from kaybee_agent.context_builder import build_context
+    from kaybee_agent.graph_binary import write_binary_graph
+
+    graph = make_scouting_graph(
+            num_players, num_teams=args.teams, aliases=args.aliases,
+            relationships_per_player=args.relationships_per_player, hub_skew=args.hub_skew)
+    queries = make_queries(graph, args.queries)
+    graph_id = f'bench{num_players}'
+    with open(os.path.join(store_root, f'{graph_id}.json'), 'w') as f:
+        json.dump(graph, f)
+    if kg_service.KG_STORE_FORMAT == 'binary':
+        write_binary_graph(graph, os.path.join(store_root, f'{graph_id}.kbg'))
+    del graph
+
+    def fetch():
+        kg_service._graph_cache.clear()
+        return kg_service._fetch_cached_graph(graph_id)
+
+    def derive(entry):
+        entry.derived.clear()
+        kg_service.get_graph_index(entry)
+        kg_service.get_entity_matcher(entry)
+        if kg_service.KG_FUZZY_MATCH:
+            kg_service.get_alias_index(entry)
+
+    def extract(entry, entity_ids):
+        # Extracted anew each time, as for a turn about new entities.
+        kg_service._neighborhood_memo.clear()
+        return kg_service._extract_neighborhood(entry, entity_ids)
+
+    samples = {stage: [] for stage in STAGES}
+
+    def timed(stage, func, *a, **kw):
+        start = time.perf_counter()
+        result = func(*a, **kw)
+        samples[stage].append(1000 * (time.perf_counter() - start))
+        return result
+
+    for _ in range(args.cold_loads):
+        entry = timed('fetch', fetch)
+        timed('derive', derive, entry)
+
+    last = None
+    for query in queries:
+        entity_ids = timed('match', kg_service._match_entities, query, entry)
+        nbhd = timed('subgraph', extract, entry, entity_ids)
+        timed('serialize', build_context, nbhd)
+        last = (query, entity_ids, nbhd)
+
+    query, entity_ids, nbhd = last
+    peaks = {
+        'fetch': _peak_bytes(fetch),
+        'derive': _peak_bytes(lambda: derive(entry)),
+        'match': _peak_bytes(lambda: kg_service._match_entities(query, entry)),
+        'subgraph': _peak_bytes(lambda: extract(entry, entity_ids)),
+        'serialize': _peak_bytes(lambda: build_context(nbhd)),
+    }
+    return {
+        'entities': len(entry.graph['entities']),
+        'relationships': len(entry.graph['relationships']),
+        'stages': {
+            stage: {**_percentiles(samples[stage]), 'peak_mb': peaks[stage] / 2**20}
+            for stage in STAGES
+        },
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for size, result in results.items():
+        for stage, stats in result['stages'].items():
+            before = baseline.get(size, {}).get('stages', {}).get(stage)
+            if before is None:
+                continue
+            for metric in ('p50_ms', 'p99_ms'):
+                if stats[metric] > before[metric] * (1 + tolerance) and stats[metric] - before[metric] > 0.05:
+                    regressions.append(
+                        f'{size} players, {stage} {metric}: {before[metric]:.2f} -> {stats[metric]:.2f}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--players', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--teams', type=int, default=30)
+    parser.add_argument('--aliases', type=int, default=2, help='Names per entity (1-3).')
+    parser.add_argument('--relationships-per-player', type=float, default=5.0)
+    parser.add_argument('--hub-skew', type=float, default=1.2,
+                        help='Pareto shape of relationship endpoints; lower makes bigger hubs.')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--cold-loads', type=int, default=3, help='Times to fetch and parse each graph.')
+    parser.add_argument('--format', choices=['json', 'binary'], default='json')
+    parser.add_argument('--fuzzy', action='store_true', help='Also match entity names fuzzily (KG_FUZZY_MATCH).')
+    parser.add_argument('--save-baseline', metavar='PATH')
+    parser.add_argument('--compare', metavar='PATH')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Allowed slowdown over the baseline, as a fraction.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as store_root:
+        os.environ.update(
+                KG_STORE='fs', KG_STORE_ROOT=store_root, KG_STORE_FORMAT=args.format,
+                KG_FUZZY_MATCH='1' if args.fuzzy else '0')
+        results = {}
+        for num_players in args.players:
+            result = results[str(num_players)] = run(num_players, args, store_root)
+            print(f"{num_players} players: {result['entities']} entities, {result['relationships']} relationships")
+            print(f"  {'stage':<10} {'p50_ms':>9} {'p99_ms':>9} {'peak_mb':>9}")
+            for stage, stats in result['stages'].items():
+                print(f"  {stage:<10} {stats['p50_ms']:>9.2f} {stats['p99_ms']:>9.2f} {stats['peak_mb']:>9.1f}")
+
+    if args.save_baseline:
+        Path(args.save_baseline).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
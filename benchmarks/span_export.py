@@ -0,0 +1,109 @@
+"""Measures span export throughput against fake (offline) logging, storage and trace backends.
+
+    python -m benchmarks.span_export --spans 2000 --latency-ms 5
+"""
+import argparse
+import json
+import random
+import time
+
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor, SpanExportResult
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+from kaybee_agent.local_backends import FakeLoggingClient, FakeStorageClient, FakeTraceClient
+from tracing import CloudTraceLoggingSpanExporter
+
+
+class LegacyExporter(CloudTraceLoggingSpanExporter):
+    """The exporter's original export loop: one to_json round trip and one log call per span,
+    offloading all attributes of an oversized span (and still logging them)."""
+
+    def export(self, spans):
+        for span in spans:
+            span_context = span.get_span_context()
+            span_id = format(span_context.span_id, "x")
+            span_dict = json.loads(span.to_json())
+            span_dict["trace"] = f"projects/{self.project_id}/traces/{format(span_context.trace_id, 'x')}"
+            span_dict["span_id"] = span_id
+            span_dict = self._process_large_attributes(span_dict=span_dict, span_id=span_id)
+            self.logger.log_struct(span_dict, labels={"type": "agent_telemetry"}, severity="INFO")
+        self.client.batch_write_spans(request=None)
+        return SpanExportResult.SUCCESS
+
+    def _process_large_attributes(self, span_dict, span_id):
+        attributes = span_dict["attributes"]
+        if len(json.dumps(attributes).encode()) > 255 * 1024:
+            attributes_retain = dict(attributes.items())
+            blob = self.bucket.blob(f"spans/{span_id}.json")
+            blob.upload_from_string(json.dumps(dict(attributes.items())), "application/json")
+            attributes_retain["uri_payload"] = f"gs://{self.bucket_name}/spans/{span_id}.json"
+            span_dict["attributes"] = attributes_retain
+        return span_dict
+
+
+def make_spans(num_spans: int, large_fraction: float, distinct_large: int = 5, seed: int = 0) -> list:
+    """Makes spans with LLM-request-like attributes; oversized ones repeat a few distinct prompts."""
+    rng = random.Random(seed)
+    prompts = [
+        json.dumps([{"role": "user", "text": f"prompt {i} " + " ".join(
+            rng.choice(["pitcher", "ERA", "prospect", "left-handed", "velocity"]) for _ in range(60_000))}])
+        for i in range(distinct_large)
+    ]
+    collector = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(collector))
+    tracer = provider.get_tracer(__name__)
+    for i in range(num_spans):
+        with tracer.start_as_current_span(f"call_llm {i}") as span:
+            span.set_attribute("gen_ai.system", "gcp.vertex.agent")
+            span.set_attribute("gcp.vertex.agent.invocation_id", f"e-{i}")
+            if rng.random() < large_fraction:
+                span.set_attribute("gcp.vertex.agent.llm_request", rng.choice(prompts))
+            else:
+                span.set_attribute("gcp.vertex.agent.llm_request", "x" * rng.randint(200, 20_000))
+            span.set_attribute("tags", ("scouting", "kaybee"))
+    return list(collector.get_finished_spans())
+
+
+def run(exporter_class, spans, batch_size: int, latency: float) -> dict:
+    logging_client = FakeLoggingClient(latency=latency, keep_entries=False, measure_bytes=True)
+    storage_client = FakeStorageClient(latency=latency)
+    trace_client = FakeTraceClient(latency=latency)
+    exporter = exporter_class(
+        project_id="benchmark",
+        client=trace_client,
+        logging_client=logging_client,
+        storage_client=storage_client,
+    )
+    start = time.perf_counter()
+    for i in range(0, len(spans), batch_size):
+        exporter.export(spans[i : i + batch_size])
+    elapsed = time.perf_counter() - start
+    exporter.shutdown()
+    return {
+        "spans_per_s": len(spans) / elapsed,
+        "logging_calls": logging_client.calls,
+        "storage_calls": storage_client.calls,
+        "bytes_uploaded": storage_client.bytes_uploaded,
+        "bytes_logged": logging_client.bytes_logged,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--spans", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=512, help="BatchSpanProcessor's max export batch size.")
+    parser.add_argument("--large-fraction", type=float, default=0.02, help="Fraction of spans over 250 KB.")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="Simulated latency of each API call.")
+    args = parser.parse_args()
+
+    spans = make_spans(args.spans, args.large_fraction)
+    for name, exporter_class in [("legacy", LegacyExporter), ("batched", CloudTraceLoggingSpanExporter)]:
+        result = run(exporter_class, spans, args.batch_size, args.latency_ms / 1000)
+        print(f"{name:>8}: " + ", ".join(
+            f"{k}={v:.0f}" if isinstance(v, float) else f"{k}={v}" for k, v in result.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Measures server cold start, phase by phase, and checks it against a budget.
+
+    KAYBEE_OFFLINE=1 python -m benchmarks.startup --runs 3 --modes lazy eager
+    KAYBEE_OFFLINE=1 python -m benchmarks.startup --modes lazy --budget-ms 15000
+    python -m benchmarks.startup --graph-id my-graph
+
+Each run starts `uvicorn server:app` in a fresh process and polls /startup
+until the server answers; the time from spawning the process to that first
+answer is `ready_ms`. The phases are the ones server.py and the warm-up record
+(see kaybee_agent.startup). With --budget-ms, the run fails if the median
+`ready_ms` of any mode is over budget, so it can gate CI.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def measure(lazy: bool, graph_id: str, timeout: float) -> dict:
+    port = _free_port()
+    env = {**os.environ, 'KAYBEE_LAZY_STARTUP': '1' if lazy else '0', 'DEFAULT_GRAPH_ID': graph_id}
+    start = time.perf_counter()
+    server = subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', 'server:app', '--port', str(port)],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    try:
+        while True:
+            if server.poll() is not None:
+                raise RuntimeError(f'Server exited during startup:\n{server.stderr.read()[-2000:]}')
+            if time.perf_counter() - start > timeout:
+                raise RuntimeError(f'Server not ready after {timeout} s')
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}/startup', timeout=1) as response:
+                    report = json.load(response)
+                break
+            except (urllib.error.URLError, ConnectionError, socket.timeout):
+                time.sleep(0.05)
+        return {**report, 'ready_ms': 1000 * (time.perf_counter() - start)}
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--modes', nargs='+', choices=['lazy', 'eager'], default=['lazy', 'eager'])
+    parser.add_argument('--graph-id', default=os.environ.get('KAYBEE_OFFLINE') and 'offline',
+                        help='The graph the warm-up preloads (DEFAULT_GRAPH_ID).')
+    parser.add_argument('--timeout', type=float, default=120, help='Seconds to wait for each server.')
+    parser.add_argument('--budget-ms', type=float, help='Fail if a median ready_ms is over this.')
+    parser.add_argument('--json', metavar='PATH', help='Also write the results here.')
+    args = parser.parse_args()
+
+    results = {}
+    for mode in args.modes:
+        runs = [measure(mode == 'lazy', args.graph_id or os.environ['DEFAULT_GRAPH_ID'], args.timeout) for _ in range(args.runs)]
+        phases = sorted({name for run in runs for name in run['phases']})
+        results[mode] = {
+            'ready_ms': statistics.median(run['ready_ms'] for run in runs),
+            'phases': {
+                name: statistics.median(run['phases'][name] for run in runs if name in run['phases'])
+                for name in phases
+            },
+            'warm_up_errors': runs[-1]['warm_up_errors'],
+        }
+        print(f"{mode}: ready in {results[mode]['ready_ms']:.0f} ms (median of {args.runs})")
+        for name, ms in results[mode]['phases'].items():
+            print(f'  {name:<24} {ms:>9.1f} ms')
+        for step, error in results[mode]['warm_up_errors'].items():
+            print(f'  warm-up step {step} failed: {error}')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.budget_ms is not None:
+        over = {mode: r['ready_ms'] for mode, r in results.items() if r['ready_ms'] > args.budget_ms}
+        for mode, ready_ms in over.items():
+            print(f'OVER BUDGET {mode}: {ready_ms:.0f} ms > {args.budget_ms:.0f} ms')
+        if over:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
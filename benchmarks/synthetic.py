@@ -0,0 +1,144 @@
+"""Synthetic knowledge graphs and queries for benchmarks and offline runs.
+
+    python -m benchmarks.synthetic --players 10000 --graph-id offline --root .kg_store
+"""
+import argparse
+import json
+import os
+import random
+
+RELATIONSHIPS = ['plays_for', 'teammate_of', 'coached_by', 'scouted_by', 'plays_in']
+
+
+def make_graph(num_entities: int, num_relationships: int, seed: int = 0) -> dict:
+    """Generates a random knowledge graph with a skewed (hub-heavy) degree distribution."""
+    rng = random.Random(seed)
+    entity_ids = [f'e{i}' for i in range(num_entities)]
+    entities = {
+        entity_id: {
+            'entity_id': entity_id,
+            'entity_names': [f'Player {i}', f'P{i}'],
+            'properties': {'position': rng.choice(['P', 'C', 'SS', 'CF']), 'age': rng.randint(16, 40)},
+        } for i, entity_id in enumerate(entity_ids)
+    }
+    # Pareto-distributed endpoints so that a few entities (teams, leagues) become hubs.
+    weights = [rng.paretovariate(1.2) for _ in entity_ids]
+    sources = rng.choices(entity_ids, weights=weights, k=num_relationships)
+    targets = rng.choices(entity_ids, weights=weights, k=num_relationships)
+    relationships = [
+        {
+            'source_entity_id': source,
+            'target_entity_id': target,
+            'relationship': rng.choice(RELATIONSHIPS),
+        } for source, target in zip(sources, targets)
+    ]
+    return {'entities': entities, 'relationships': relationships}
+
+
+FIRST_NAMES = [
+    'Aaron', 'Carlos', 'Diego', 'Ethan', 'Hiroshi', 'Jacob', 'Jose', 'Juan', 'Kyle', 'Luis',
+    'Marcus', 'Mike', 'Nolan', 'Pedro', 'Rafael', 'Ryan', 'Shohei', 'Tyler', 'Victor', 'Yusei',
+]
+LAST_NAMES = [
+    'Alvarez', 'Brown', 'Castillo', 'Davis', 'Garcia', 'Harper', 'Johnson', 'Kikuchi', 'Lopez',
+    'Martinez', 'Nakamura', 'Ortiz', 'Perez', 'Ramirez', 'Rodriguez', 'Smith', 'Suzuki',
+    'Thompson', 'Torres', 'Williams',
+]
+POSITIONS = ['P', 'C', '1B', '2B', '3B', 'SS', 'LF', 'CF', 'RF', 'DH']
+
+
+def make_scouting_graph(
+        num_players: int, num_teams: int = 30, num_leagues: int = 3,
+        num_coaches: int = 60, num_scouts: int = 40, aliases: int = 2,
+        relationships_per_player: float = 5.0, hub_skew: float = 1.2,
+        seed: int = 0) -> dict:
+    """Generates a scouting knowledge graph: players, teams, leagues, coaches and scouts.
+
+    Every player plays for a team and every team plays in a league, so teams
+    and leagues are hubs. Players also get about `relationships_per_player`
+    relationships to other entities in all, with Pareto(`hub_skew`)-weighted
+    endpoints (lower is more skewed), so some players become hubs too. Each
+    entity has up to `aliases` names (full name, last name, nickname).
+    """
+    rng = random.Random(seed)
+    entities, relationships = {}, []
+    seen_names = set()
+
+    def add(entity_id: str, names: list[str], properties: dict) -> str:
+        entities[entity_id] = {
+            'entity_id': entity_id, 'entity_names': names[:max(aliases, 1)], 'properties': properties}
+        return entity_id
+
+    def person_names(i: int) -> list[str]:
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        name = f'{first} {last}'
+        if name in seen_names:
+            name = f'{name} {i}'
+        seen_names.add(name)
+        return [name, name.split(' ', 1)[1], f'{first[0]}{last[0]}{i}']
+
+    def relate(source: str, relationship: str, target: str) -> None:
+        relationships.append({
+            'source_entity_id': source, 'target_entity_id': target, 'relationship': relationship})
+
+    leagues = [add(f'league{i}', [f'League {i}', f'L{i}'], {'level': rng.choice(['AAA', 'AA', 'MLB'])})
+               for i in range(num_leagues)]
+    teams = []
+    for i in range(num_teams):
+        teams.append(add(f'team{i}', [f'Team {i}', f'T{i}', f'The {i}s'], {'city': f'City {i}'}))
+        relate(teams[-1], 'plays_in', rng.choice(leagues))
+    coaches = [add(f'coach{i}', person_names(i), {'role': 'coach'}) for i in range(num_coaches)]
+    scouts = [add(f'scout{i}', person_names(i), {'role': 'scout'}) for i in range(num_scouts)]
+
+    players = []
+    for i in range(num_players):
+        players.append(add(f'player{i}', person_names(i), {
+            'position': rng.choice(POSITIONS), 'age': rng.randint(16, 40), 'era': round(rng.uniform(1, 7), 2)}))
+        relate(players[-1], 'plays_for', rng.choice(teams))
+
+    people = players + coaches + scouts
+    weights = [rng.paretovariate(hub_skew) for _ in people]
+    num_extra = max(int(num_players * (relationships_per_player - 1)), 0)
+    for source, target in zip(
+            rng.choices(players, k=num_extra), rng.choices(people, weights=weights, k=num_extra)):
+        relate(source, {'coach': 'coached_by', 'scout': 'scouted_by'}.get(
+            entities[target]['properties'].get('role'), 'teammate_of'), target)
+    return {'entities': entities, 'relationships': relationships}
+
+
+def make_queries(graph: dict, num_queries: int, seed: int = 0) -> list[str]:
+    """Generates scout questions naming zero to three entities of the graph by one of their names."""
+    rng = random.Random(seed)
+    entities = list(graph['entities'].values())
+    templates = [
+        'How has {} been doing this season?',
+        'Compare {} and {} for a trade.',
+        'Who coached {} before joining {}, and what about {}?',
+        'Any left-handed pitchers with a good ERA?',
+    ]
+    queries = []
+    for _ in range(num_queries):
+        template = rng.choice(templates)
+        names = [rng.choice(e['entity_names']) for e in rng.sample(entities, template.count('{}'))]
+        queries.append(template.format(*names))
+    return queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--players', type=int, default=10_000)
+    parser.add_argument('--graph-id', default='offline')
+    parser.add_argument('--root', default='.kg_store', help='Filesystem graph store to write {graph_id}.json to.')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    graph = make_scouting_graph(args.players, seed=args.seed)
+    os.makedirs(args.root, exist_ok=True)
+    path = os.path.join(args.root, f'{args.graph_id}.json')
+    with open(path, 'w') as f:
+        json.dump(graph, f)
+    print(f"Wrote {len(graph['entities'])} entities and {len(graph['relationships'])} relationships to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,308 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Buffered feedback ingestion: requests enqueue records, a background task writes them in batches.
+
+Records wait in a bounded in-memory queue (FEEDBACK_QUEUE_SIZE). When it's
+full, `submit` raises `FeedbackQueueFull` and the server answers 503, pushing
+back on clients instead of growing without bound. The flusher writes up to
+FEEDBACK_BATCH_SIZE records per Cloud Logging call: full batches as soon as
+they fill, and the rest every FEEDBACK_FLUSH_SECONDS.
+
+If a write fails, the batch is spilled to a JSON Lines file in
+FEEDBACK_SPILL_DIR (up to FEEDBACK_SPILL_MAX_BYTES in all), and later batches
+go straight to disk until FEEDBACK_RETRY_SECONDS have passed (doubling on each
+further failure, up to 5 minutes). Once a write succeeds again, spilled
+batches are replayed, oldest first; files left by an earlier process are
+replayed at startup. Workers sharing FEEDBACK_SPILL_DIR claim each file with
+an atomic rename before replaying it, so only one of them writes it; files
+claimed by a worker that has since died are released at startup. A spilled
+file that can't be read or parsed is renamed to `.bad` and left for
+inspection, rather than retried forever.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+import uuid
+import weakref
+from collections import deque
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+from opentelemetry import metrics
+
+FEEDBACK_QUEUE_SIZE = int(os.environ.get("FEEDBACK_QUEUE_SIZE", 10_000))
+FEEDBACK_BATCH_SIZE = int(os.environ.get("FEEDBACK_BATCH_SIZE", 200))
+FEEDBACK_FLUSH_SECONDS = float(os.environ.get("FEEDBACK_FLUSH_SECONDS", 1.0))
+FEEDBACK_SPILL_DIR = os.environ.get(
+    "FEEDBACK_SPILL_DIR", os.path.join(tempfile.gettempdir(), "kaybee-feedback")
+)
+FEEDBACK_SPILL_MAX_BYTES = int(os.environ.get("FEEDBACK_SPILL_MAX_BYTES", 64 * 1024 * 1024))
+FEEDBACK_RETRY_SECONDS = float(os.environ.get("FEEDBACK_RETRY_SECONDS", 5.0))
+_MAX_RETRY_SECONDS = 300.0
+
+_meter = metrics.get_meter(__name__)
+_records = _meter.create_counter(
+    "feedback.records", unit="1", description="Feedback records, by outcome."
+)
+_flush_duration = _meter.create_histogram(
+    "feedback.flush.duration", unit="ms", description="Time to write one batch of feedback."
+)
+_buffers: "weakref.WeakSet[FeedbackBuffer]" = weakref.WeakSet()
+_meter.create_observable_gauge(
+    "feedback.queue_depth",
+    callbacks=[lambda options: [metrics.Observation(sum(b.queue_depth() for b in list(_buffers)))]],
+    unit="1",
+    description="Feedback records waiting to be written.",
+)
+
+
+class FeedbackQueueFull(Exception):
+    """Raised when the feedback queue has no room for the submitted records."""
+
+
+class FeedbackBuffer:
+    """A bounded queue of feedback records, flushed in batches to a Cloud Logging logger."""
+
+    def __init__(
+        self,
+        get_logger: Callable[[], Any],
+        max_queue: int = FEEDBACK_QUEUE_SIZE,
+        batch_size: int = FEEDBACK_BATCH_SIZE,
+        flush_seconds: float = FEEDBACK_FLUSH_SECONDS,
+        spill_dir: str = FEEDBACK_SPILL_DIR,
+        spill_max_bytes: int = FEEDBACK_SPILL_MAX_BYTES,
+        retry_seconds: float = FEEDBACK_RETRY_SECONDS,
+    ) -> None:
+        """
+        :param get_logger: Returns the Cloud Logging logger to write to (called in the flusher's thread)
+        :param max_queue: Most records held in memory
+        :param batch_size: Most records per Cloud Logging write
+        :param flush_seconds: Longest a record waits for its batch to fill
+        :param spill_dir: Where batches that could not be written are kept
+        :param spill_max_bytes: Most bytes kept in spill_dir; batches beyond it are dropped
+        :param retry_seconds: How long to spill to disk after a failed write before trying again
+        """
+        self.get_logger = get_logger
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.spill_dir = Path(spill_dir)
+        self.spill_max_bytes = spill_max_bytes
+        self.retry_seconds = retry_seconds
+        self._queue: deque[dict] = deque()
+        self._wake: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._closing = False
+        self._sink_down_until = 0.0
+        self._backoff = retry_seconds
+        self.stats = {
+            "accepted": 0, "rejected": 0, "written": 0, "spilled": 0, "replayed": 0, "dropped": 0,
+            "quarantined": 0,
+        }
+        _buffers.add(self)
+
+    def submit(self, records: list[dict]) -> None:
+        """Enqueues the records, all or none; raises FeedbackQueueFull if they don't fit."""
+        if self._closing or len(self._queue) + len(records) > self.max_queue:
+            self.stats["rejected"] += len(records)
+            _records.add(len(records), {"outcome": "rejected"})
+            raise FeedbackQueueFull(f"Feedback queue is full ({len(self._queue)} records waiting)")
+        self._queue.extend(records)
+        self.stats["accepted"] += len(records)
+        _records.add(len(records), {"outcome": "accepted"})
+        if self._wake is not None and len(self._queue) >= self.batch_size:
+            self._wake.set()
+
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    def start(self) -> None:
+        """Starts the flusher on the running event loop."""
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="feedback-flusher")
+
+    async def close(self) -> None:
+        """Stops taking records, and writes (or spills) everything still queued."""
+        self._closing = True
+        if self._task is None:
+            self.start()
+        self._wake.set()
+        await self._task
+        self._task = None
+
+    async def _run(self) -> None:
+        try:
+            await asyncio.to_thread(self._release_dead_claims)
+            await asyncio.to_thread(self._replay)
+        except Exception:
+            logging.exception("Replaying spilled feedback at startup failed")
+        while True:
+            try:
+                if await self._run_once():
+                    return
+            except Exception:
+                # The flusher must outlive any one failure, or the queue fills
+                # up and every submission is rejected.
+                logging.exception("Feedback flusher failed, retrying")
+                await asyncio.sleep(self.flush_seconds)
+
+    async def _run_once(self) -> bool:
+        """Waits for a batch (or the flush interval) and writes what's queued; returns True when closed."""
+        if len(self._queue) < self.batch_size and not self._closing:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_seconds)
+            except TimeoutError:
+                pass
+            self._wake.clear()
+        # Write what's queued, leaving a partial batch for the next interval
+        # unless it is the first batch written after waking up.
+        while self._queue:
+            batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+            try:
+                await asyncio.to_thread(self._flush, batch)
+            except Exception:
+                logging.exception(f"Lost {len(batch)} feedback records")
+            if len(self._queue) < self.batch_size and not self._closing:
+                break
+        return self._closing and not self._queue
+
+    def _flush(self, batch: list[dict]) -> None:
+        if time.monotonic() < self._sink_down_until:
+            self._spill(batch)
+            return
+        if not self._write(batch):
+            self._spill(batch)
+            return
+        self.stats["written"] += len(batch)
+        _records.add(len(batch), {"outcome": "written"})
+        # The batch is written: a failed replay must not count it as lost.
+        try:
+            self._replay()
+        except Exception:
+            logging.exception("Replaying spilled feedback failed")
+
+    def _write(self, batch: list[dict]) -> bool:
+        start = time.perf_counter()
+        try:
+            log_batch = self.get_logger().batch()
+            for record in batch:
+                log_batch.log_struct(record, severity="INFO")
+            # With partial success, one bad entry doesn't drop the rest of the batch.
+            log_batch.commit(partial_success=True)
+        except Exception as e:
+            logging.warning(f"Writing {len(batch)} feedback records failed, spilling to disk: {e!r}")
+            self._sink_down_until = time.monotonic() + self._backoff
+            self._backoff = min(2 * self._backoff, _MAX_RETRY_SECONDS)
+            return False
+        finally:
+            _flush_duration.record(1000 * (time.perf_counter() - start))
+        self._backoff = self.retry_seconds
+        return True
+
+    def _spilled_bytes(self) -> int:
+        return sum(
+            path.stat().st_size
+            for pattern in ("*.jsonl", "*.replaying")
+            for path in self.spill_dir.glob(pattern)
+        )
+
+    def _spill(self, batch: list[dict]) -> None:
+        content = "".join(json.dumps(record, default=str) + "\n" for record in batch)
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        if self._spilled_bytes() + len(content) > self.spill_max_bytes:
+            logging.error(f"Feedback spill directory is full, dropping {len(batch)} records")
+            self.stats["dropped"] += len(batch)
+            _records.add(len(batch), {"outcome": "dropped"})
+            return
+        # Named to sort oldest first; written under a temporary name so a
+        # replay never reads a partial file.
+        name = f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}"
+        tmp = self.spill_dir / f"{name}.tmp"
+        tmp.write_text(content)
+        tmp.rename(self.spill_dir / f"{name}.jsonl")
+        self.stats["spilled"] += len(batch)
+        _records.add(len(batch), {"outcome": "spilled"})
+
+    def _replay(self) -> None:
+        """Writes spilled batches, oldest first, stopping at the first failed write."""
+        if not self.spill_dir.is_dir():
+            return
+        for path in sorted(self.spill_dir.glob("*.jsonl")):
+            if time.monotonic() < self._sink_down_until:
+                return
+            if (claimed := self._claim(path)) is None:
+                continue
+            try:
+                batch = [json.loads(line) for line in claimed.read_text().splitlines() if line]
+            except (OSError, ValueError) as e:
+                self._quarantine(claimed, e)
+                continue
+            if not self._write(batch):
+                self._release(claimed, path)
+                return
+            try:
+                claimed.unlink()
+            except OSError as e:
+                # Written, but it would be written again once the claim is released.
+                self._quarantine(claimed, e)
+            self.stats["replayed"] += len(batch)
+            _records.add(len(batch), {"outcome": "replayed"})
+
+    def _claim(self, path: Path) -> Path | None:
+        """Renames a spilled file to this process's claim on it; None if another worker claimed it first."""
+        claimed = path.with_name(f"{path.stem}.{os.getpid()}.replaying")
+        try:
+            path.rename(claimed)
+        except FileNotFoundError:
+            return None
+        return claimed
+
+    def _release(self, claimed: Path, path: Path) -> None:
+        """Gives up a claim, leaving the spilled file for the next replay."""
+        try:
+            claimed.rename(path)
+        except OSError as e:
+            logging.error(f"Could not release spilled feedback {claimed}: {e!r}")
+
+    def _release_dead_claims(self) -> None:
+        """Releases the spilled files claimed by workers that are no longer running."""
+        if not self.spill_dir.is_dir():
+            return
+        for claimed in self.spill_dir.glob("*.replaying"):
+            name, _, pid = claimed.stem.rpartition(".")
+            if not pid.isdigit():
+                continue
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                self._release(claimed, claimed.with_name(f"{name}.jsonl"))
+            except OSError:
+                pass  # alive, but another user's
+
+    def _quarantine(self, path: Path, error: Exception) -> None:
+        """Renames a spilled file that can't be replayed to `.bad`, so replays skip it."""
+        try:
+            path.rename(path.with_name(path.name.split(".")[0] + ".bad"))
+        except OSError as e:
+            # Still claimed, so no replay picks it up again while this process runs.
+            logging.error(f"Could not quarantine spilled feedback {path}, skipping it: {e!r}")
+            return
+        logging.error(f"Quarantined spilled feedback {path} as .bad: {error!r}")
+        self.stats["quarantined"] += 1
@@ -12,6 +12,17 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from .agent import root_agent
+# Applies offline-mode defaults before the agent reads its configuration.
+from . import offline  # noqa: F401
 
 __all__ = ["root_agent"]
+
+
+def __getattr__(name):
+    # The agents (and their tools and graph service) are built on first use,
+    # so importing a light submodule such as `startup` or `gcs` doesn't build
+    # them. ADK's agent loader asks for `root_agent` by attribute.
+    if name == "root_agent":
+        from .agent import root_agent
+        return root_agent
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
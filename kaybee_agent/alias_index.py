@@ -0,0 +1,216 @@
+import math
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+from typing import Optional
+
+_POSSESSIVE = re.compile(r"['’`]s\b")
+_APOSTROPHES = re.compile(r"['’`]")
+_NON_WORD = re.compile(r'[\W_]+')
+
+
+def normalize(text: str) -> str:
+    '''Folds case and accents, drops apostrophes and turns other punctuation into spaces.
+
+    So "José Ramírez", "jose  ramirez" and "Jose-Ramirez" all become "jose ramirez",
+    "O'Neil" becomes "oneil", and "Ohtani's" becomes "ohtani".
+    '''
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    text = text.casefold()
+    text = _APOSTROPHES.sub('', _POSSESSIVE.sub('', text))
+    return ' '.join(_NON_WORD.sub(' ', text).split())
+
+
+def _grams(word: str) -> set[str]:
+    padded = f' {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    '''Optimal string alignment distance (a transposition is one edit), or `limit + 1` if over `limit`.'''
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    if a == b:
+        return 0
+    if limit == 1:
+        return 1 if _one_edit_apart(a, b) else 2
+    before, prev = None, list(range(len(b) + 1))
+    for i, ca in enumerate(a, start=1):
+        row = [i]
+        for j, cb in enumerate(b, start=1):
+            d = min(prev[j] + 1, row[j - 1] + 1, prev[j - 1] + (ca != cb))
+            if before is not None and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                d = min(d, before[j - 2] + 1)
+            row.append(d)
+        if min(row) > limit:
+            return limit + 1
+        before, prev = prev, row
+    return prev[-1]
+
+
+def _one_edit_apart(a: str, b: str) -> bool:
+    # In linear time, for the common case of a single typo.
+    if len(a) < len(b):
+        a, b = b, a
+    i = next((i for i, (ca, cb) in enumerate(zip(a, b)) if ca != cb), len(b))
+    if len(a) != len(b):
+        return a[i + 1:] == b[i:]
+    return a[i + 1:] == b[i + 1:] or (a[i + 2:] == b[i + 2:] and a[i] == b[i + 1] and a[i + 1] == b[i])
+
+
+class AliasIndex:
+    """Fuzzy index over the normalized names of knowledge graph entities.
+
+    `match` finds the entities named in a query despite misspellings, missing
+    accents or different punctuation, scoring each match 1 - (edit distance /
+    length) between the name and the words of the normalized query it lines
+    up with. Names equal to those words score 1.0; fuzzy matches need at least
+    `min_score`, and words with digits in them must match exactly.
+
+    Lookups stay sublinear in the number of names. Each name is keyed by its
+    rarest word; each query word is looked up, exactly and within an edit or
+    two, among the distinct words of all names (through an index of their
+    character trigrams, so only words sharing enough trigrams are compared);
+    and only the names keyed by the words found are scored.
+    """
+
+    def __init__(self, entities: Optional[dict] = None, min_score: float = 0.85):
+        self.min_score = min_score
+        self._names: list[str] = []
+        self._name_ids: dict[str, int] = {}
+        self._name_entities: list[set[str]] = []
+        self._entity_names: dict[str, list[int]] = {}
+        self._words: list[str] = []
+        self._word_ids: dict[str, int] = {}
+        self._word_names: list[int] = []  # how many names have each word
+        self._word_postings: dict[tuple[str, int], list[int]] = defaultdict(list)
+        self._keyed: dict[int, list[tuple[int, int]]] = defaultdict(list)  # word -> (name, position)
+        self._lock = threading.Lock()
+
+        entities = entities or {}
+        # Count the words of all names first, to key each name by its rarest word in the whole graph.
+        for name in {normalize(n) for data in entities.values() for n in data['entity_names']}:
+            for word in set(name.split()):
+                self._word_names[self._word_id(word)] += 1
+        for entity_id, entity_data in entities.items():
+            self._add(entity_id, entity_data['entity_names'], count_words=False)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def _word_id(self, word: str) -> int:
+        if (word_id := self._word_ids.get(word)) is None:
+            word_id = self._word_ids[word] = len(self._words)
+            self._words.append(word)
+            self._word_names.append(0)
+            for gram in _grams(word):
+                self._word_postings[(gram, len(word))].append(word_id)
+        return word_id
+
+    def add(self, entity_id: str, entity_names: list[str]) -> None:
+        '''Adds (or replaces) an entity's names.'''
+        with self._lock:
+            self._add(entity_id, entity_names)
+
+    def _add(self, entity_id: str, entity_names: list[str], count_words: bool = True) -> None:
+        self._remove(entity_id)
+        name_ids = self._entity_names[entity_id] = []
+        for entity_name in entity_names:
+            if not (name := normalize(entity_name)):
+                continue
+            if (name_id := self._name_ids.get(name)) is None:
+                name_id = self._name_ids[name] = len(self._names)
+                self._names.append(name)
+                self._name_entities.append(set())
+                word_ids = [self._word_id(word) for word in name.split()]
+                if count_words:
+                    for word_id in set(word_ids):
+                        self._word_names[word_id] += 1
+                # The rarest word, and of those the longest (the likeliest to be found fuzzily).
+                position = min(range(len(word_ids)), key=lambda i: (
+                        self._word_names[word_ids[i]], -len(self._words[word_ids[i]])))
+                self._keyed[word_ids[position]].append((name_id, position))
+            self._name_entities[name_id].add(entity_id)
+            name_ids.append(name_id)
+
+    def remove(self, entity_id: str) -> None:
+        with self._lock:
+            self._remove(entity_id)
+
+    def _remove(self, entity_id: str) -> None:
+        # Names stay indexed; they simply stop producing this entity.
+        for name_id in self._entity_names.pop(entity_id, []):
+            self._name_entities[name_id].discard(entity_id)
+
+    def _similar_words(self, word: str, min_score: float) -> set[int]:
+        '''The indexed words equal to `word`, or within the edits a name containing it could need.'''
+        found = {word_id} if (word_id := self._word_ids.get(word)) is not None else set()
+        if not word.isalpha():
+            # Numbers (jersey numbers, years, team numbers) only match exactly.
+            return found
+        # At least one edit, so a misspelled word can still be found in a longer name.
+        limit = max(1, math.floor((1 - min_score) * len(word) / min_score + 1e-9))
+        grams = _grams(word)
+        # A word within `limit` edits shares all but at most 4 * limit of these trigrams
+        # (a transposition breaks 4), so it has one of the 4 * limit + 1 rarest.
+        if len(grams) <= 4 * limit:
+            return found
+        lengths = range(max(len(word) - limit, 1), len(word) + limit + 1)
+        postings = self._word_postings
+
+        def frequency(gram: str) -> int:
+            return sum(len(postings.get((gram, n), ())) for n in lengths)
+
+        candidates = set()
+        for gram in sorted(grams, key=frequency)[:4 * limit + 1]:
+            for n in lengths:
+                candidates.update(postings.get((gram, n), ()))
+        candidates -= found
+        found.update(
+                candidate for candidate in candidates
+                if _edit_distance(word, self._words[candidate], limit) <= limit)
+        return found
+
+    def match(self, query: str, min_score: Optional[float] = None) -> dict[str, float]:
+        '''Returns the entities named anywhere in the query, with the best score of each.'''
+        if min_score is None:
+            min_score = self.min_score
+        words = normalize(query).split()
+        # Under the lock, as add and remove change the sets of entities iterated here.
+        with self._lock:
+            return self._match(words, min_score)
+
+    def _match(self, words: list[str], min_score: float) -> dict[str, float]:
+        found: dict[str, float] = {}
+        scored = set()
+        for i, word in enumerate(words):
+            for word_id in self._similar_words(word, min_score):
+                for name_id, position in self._keyed.get(word_id, ()):
+                    name = self._names[name_id]
+                    start, end = i - position, i - position + name.count(' ') + 1
+                    if start < 0 or end > len(words) or (name_id, start) in scored:
+                        continue
+                    scored.add((name_id, start))
+                    if not (entity_ids := self._name_entities[name_id]):
+                        continue
+                    if (score := self._score(' '.join(words[start:end]), name, min_score)) is None:
+                        continue
+                    for entity_id in entity_ids:
+                        if score > found.get(entity_id, 0.0):
+                            found[entity_id] = score
+        return found
+
+    @staticmethod
+    def _score(text: str, name: str, min_score: float) -> Optional[float]:
+        if text == name:
+            return 1.0
+        if [w for w in text.split() if not w.isalpha()] != [w for w in name.split() if not w.isalpha()]:
+            return None
+        length = max(len(text), len(name))
+        limit = math.floor((1 - min_score) * length + 1e-9)
+        if (distance := _edit_distance(text, name, limit)) > limit:
+            return None
+        return 1 - distance / length
@@ -1,8 +1,14 @@
+import argparse
 import asyncio
-from floggit import flog
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from dataclasses import asdict, dataclass, field
 import os
-import random
 from dotenv import load_dotenv
+from typing import Optional
 
 from google.adk.agents import Agent
 from google.adk.runners import Runner
@@ -12,29 +18,51 @@ from google.genai import types
 
 from google.adk.tools import google_search
 from google.adk.tools.agent_tool import AgentTool
-from google.adk.tools.mcp_tool.mcp_toolset import (
-        McpToolset, StreamableHTTPConnectionParams)
 
-from kg_service import _fetch_knowledge_graph, _get_knowledge_subgraph
+from .kg_service import asample_entity
+from .mcp_pool import PooledMcpToolset
 
 session_service = InMemorySessionService()
 APP_NAME = 'kaybee_agent'
 
 load_dotenv()
 
-@flog
-def get_random_entity(tool_context: ToolContext):
-    user_id = tool_context._invocation_context.user_id
-    g = _fetch_knowledge_graph(graph_id=user_id)
-    entity_id = random.choice(list(g['entities'].keys()))
-    entity = g['entities'][entity_id]
-    nbhd = _get_knowledge_subgraph(
-            entity_ids={entity_id}, graph=g, num_hops=1)
+# Which entities to curate first; see kaybee_agent.entity_sampler.
+KG_CURATION_POLICY = os.environ.get('KG_CURATION_POLICY', 'stale+low_degree')
+
+# How many draws get_random_entity makes to find an entity no other session is curating.
+_MAX_SAMPLE_ATTEMPTS = 10
 
-    return {
-        'entity': entity,
-        'entity_neighborhood': nbhd
-    }
+# Entities being curated right now, per graph, so that concurrent sessions
+# don't curate the same one, and the entities each session claimed.
+_claims_lock = threading.Lock()
+_in_flight: dict[str, set[str]] = defaultdict(set)
+_session_claims: dict[str, list[tuple[str, str]]] = defaultdict(list)
+
+async def get_random_entity(tool_context: ToolContext):
+    user_id = tool_context._invocation_context.user_id
+    session_id = tool_context._invocation_context.session.id
+    for _ in range(_MAX_SAMPLE_ATTEMPTS):
+        # Loading a cold graph and sampling run on kg_service's executors, off the event loop.
+        sample = await asample_entity(graph_id=user_id, policy=KG_CURATION_POLICY)
+        if sample is None:
+            return {'error': 'The knowledge graph has no entities yet.'}
+        entity_id = sample['entity']['entity_id']
+        with _claims_lock:
+            if entity_id not in _in_flight[user_id]:
+                _in_flight[user_id].add(entity_id)
+                _session_claims[session_id].append((user_id, entity_id))
+                return sample
+    return {'error': 'Every entity sampled is already being curated; try again later.'}
+
+
+def _release_claims(session_id: str) -> list[str]:
+    '''Releases the entities a session claimed, returning their IDs.'''
+    with _claims_lock:
+        claims = _session_claims.pop(session_id, [])
+        for graph_id, entity_id in claims:
+            _in_flight[graph_id].discard(entity_id)
+    return [entity_id for _, entity_id in claims]
 
 
 search_agent = Agent(
@@ -59,47 +87,129 @@ agent = Agent(
     tools=[
         get_random_entity,
         AgentTool(agent=search_agent),
-        McpToolset(
-            connection_params=StreamableHTTPConnectionParams(
-                url=os.environ['KG_MCP_SERVER']
-            )
-        ),
+        PooledMcpToolset(),
     ],
 )
 
-async def call_agent(user_id: str):
-    session = await session_service.create_session(
-            app_name=APP_NAME, user_id=user_id)
+runner = Runner(
+    agent=agent,
+    app_name=APP_NAME,
+    session_service=session_service
+)
+
+# Sessions run from within a conversation (see curate_in_background), kept
+# referenced until they finish.
+_background_sessions: set[asyncio.Task] = set()
 
-    runner = Runner(
-        agent=agent,
-        app_name=APP_NAME,
-        session_service=session_service
-    )
 
-    user_content = types.Content(role='user', parts=[types.Part(text='Go')])
-    result = runner.run_async(
-            user_id=user_id, session_id=session.id, new_message=user_content)
+@dataclass
+class SessionResult:
+    session_id: str
+    entities: list[str]
+    tool_calls: dict[str, int]
+    seconds: float
+    error: Optional[str] = None
 
-    # Need this line.... Is there a good replacement?
-    async for event in result:
-        pass
 
+@dataclass
+class CurationSummary:
+    graph_id: str
+    sessions: int = 0
+    failed: int = 0
+    timed_out: int = 0
+    entities_touched: list[str] = field(default_factory=list)
+    tool_calls: dict[str, int] = field(default_factory=dict)
+    wall_seconds: float = 0.0
 
-async def main(knowledge: str, tool_context: ToolContext):
+
+async def call_agent(
+        user_id: str, query: str = 'Go',
+        timeout: Optional[float] = None) -> SessionResult:
+    """Runs one curation session on the graph of `user_id`, giving up after `timeout` seconds."""
+    # The graph the session's knowledge graph tool calls go to (see mcp_pool).
+    session = await session_service.create_session(
+            app_name=APP_NAME, user_id=user_id, state={'graph_id': user_id})
+    start = time.perf_counter()
+    tool_calls = defaultdict(int)
+    error = None
+
+    user_content = types.Content(role='user', parts=[types.Part(text=query)])
+    try:
+        async with asyncio.timeout(timeout):
+            async for event in runner.run_async(
+                    user_id=user_id, session_id=session.id, new_message=user_content):
+                for call in event.get_function_calls():
+                    tool_calls[call.name] += 1
+    except TimeoutError:
+        error = f'timed out after {timeout}s'
+    except Exception as e:
+        logging.exception(f'Curation session {session.id} failed')
+        error = repr(e)
+    finally:
+        entities = _release_claims(session.id)
+        await session_service.delete_session(
+                app_name=APP_NAME, user_id=user_id, session_id=session.id)
+
+    return SessionResult(
+            session_id=session.id, entities=entities, tool_calls=dict(tool_calls),
+            seconds=time.perf_counter() - start, error=error)
+
+
+async def curate(
+        graph_id: str, num_sessions: int, concurrency: int = 4,
+        timeout: Optional[float] = 300) -> CurationSummary:
+    """Runs `num_sessions` curation sessions on a graph, at most `concurrency` at a time."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_one() -> SessionResult:
+        async with semaphore:
+            return await call_agent(user_id=graph_id, timeout=timeout)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(run_one() for _ in range(num_sessions)))
+
+    summary = CurationSummary(graph_id=graph_id, sessions=len(results))
+    tool_calls = defaultdict(int)
+    touched = {}
+    for result in results:
+        summary.failed += result.error is not None
+        summary.timed_out += bool(result.error and result.error.startswith('timed out'))
+        touched.update(dict.fromkeys(result.entities))
+        for name, count in result.tool_calls.items():
+            tool_calls[name] += count
+    summary.entities_touched = list(touched)
+    summary.tool_calls = dict(tool_calls)
+    summary.wall_seconds = time.perf_counter() - start
+    return summary
+
+
+async def curate_in_background(knowledge: str, tool_context: ToolContext):
     '''Curates/updates knowledge store with facts contained in the conversation.
 
     Args:
         knowledge (str): Any potentially new or updated knowledge encountered in the conversation.
     '''
-    app_name = tool_context._invocation_context.app_name
     user_id = tool_context._invocation_context.user_id
-    session_id = tool_context._invocation_context.session.id
 
-    agent_call = call_agent(
-            app_name=app_name, user_id=user_id, session_id=session_id, query=knowledge)
-    asyncio.create_task(agent_call)
+    task = asyncio.create_task(call_agent(user_id=user_id, query=knowledge))
+    _background_sessions.add(task)
+    task.add_done_callback(_background_sessions.discard)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs a batch of curation sessions on a knowledge graph.')
+    parser.add_argument('graph_id')
+    parser.add_argument('-n', '--sessions', type=int, default=1, help='Number of curation sessions.')
+    parser.add_argument('-c', '--concurrency', type=int, default=4, help='Sessions run at once.')
+    parser.add_argument('--timeout', type=float, default=300, help='Seconds before a session is abandoned.')
+    args = parser.parse_args()
+
+    summary = asyncio.run(curate(
+            graph_id=args.graph_id, num_sessions=args.sessions,
+            concurrency=args.concurrency, timeout=args.timeout))
+    print(json.dumps(asdict(summary), indent=2))
+
 
-# If running this code as a standalone Python script, you'll need to use asyncio.run() or manage the event loop.
+# python -m kaybee_agent.bot <graph_id> -n 100 -c 8
 if __name__ == "__main__":
-    asyncio.run(call_agent(user_id='107435368347260378300'))
+    main()
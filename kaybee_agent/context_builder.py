@@ -0,0 +1,136 @@
+"""Builds the knowledge graph context added to a user turn, within a token budget.
+
+Facts (an entity's aliases and properties, or a relationship) are ranked by
+relevance to the query: hop distance from the matched (seed) entities first,
+then entities before the relationships at the same distance (those closer to a
+seed first), then degree within the neighborhood. The highest-ranked facts are emitted first, one compact line
+each, until the budget runs out; the rest are counted as dropped.
+"""
+import json
+import os
+from collections import defaultdict, deque
+from dataclasses import dataclass
+
+from opentelemetry import metrics
+
+KG_CONTEXT_TOKEN_BUDGET = int(os.environ.get('KG_CONTEXT_TOKEN_BUDGET', 2000))
+
+# Gemini averages about 4 characters per token on English text.
+CHARS_PER_TOKEN = 4
+
+_meter = metrics.get_meter(__name__)
+_context_tokens = _meter.create_histogram(
+        'kb_context.tokens', unit='1', description='Estimated tokens of KB context per turn.')
+_dropped_facts = _meter.create_histogram(
+        'kb_context.dropped_facts', unit='1', description='KB facts left out of a turn by the token budget.')
+
+_UNREACHABLE = float('inf')
+
+
+@dataclass
+class KBContext:
+    text: str
+    tokens: int
+    facts: int
+    dropped: int
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def build_context(nbhd: dict, token_budget: int = KG_CONTEXT_TOKEN_BUDGET) -> KBContext:
+    """Serializes the highest-ranked facts of a neighborhood that fit in `token_budget` tokens.
+
+    Args:
+        nbhd (dict): A neighborhood from `kg_service.get_relevant_neighborhood`.
+            Without `seed_entity_ids`, every entity ranks as a seed.
+        token_budget (int): Estimated tokens the context may take.
+    """
+    entities = nbhd['entities']
+    relationships = nbhd['relationships']
+    hops = _hop_distances(nbhd)
+    degree = defaultdict(int)
+    for rel in relationships:
+        degree[rel['source_entity_id']] += 1
+        degree[rel['target_entity_id']] += 1
+
+    ranked = []
+    for order, (entity_id, entity) in enumerate(entities.items()):
+        if line := _entity_line(entity):
+            ranked.append(((hops[entity_id], 0, hops[entity_id], -degree[entity_id], order), line))
+    for order, rel in enumerate(relationships):
+        source, target = rel['source_entity_id'], rel['target_entity_id']
+        line = f"{_name(entities, source)} {rel['relationship']} {_name(entities, target)}"
+        ranked.append((
+            (max(hops[source], hops[target]), 1, min(hops[source], hops[target]),
+             -(degree[source] + degree[target]), order),
+            line))
+    ranked.sort(key=lambda fact: fact[0])
+
+    # Parallel relationships of the same type read the same, so only the first counts.
+    seen = set()
+    ranked = [fact for fact in ranked if not (fact[1] in seen or seen.add(fact[1]))]
+
+    lines, tokens = [], 0
+    for _, line in ranked:
+        cost = estimate_tokens(line) + 1
+        if tokens + cost <= token_budget:
+            lines.append(line)
+            tokens += cost
+    facts, dropped = len(lines), len(ranked) - len(lines)
+
+    if lines:
+        if dropped:
+            lines.append(f'[{dropped} more facts omitted; search the knowledge graph for details]')
+        text = '(FYI, according to the Knowledge Graph:\n' + '\n'.join(lines) + ')'
+    else:
+        text = ''
+    context = KBContext(text=text, tokens=estimate_tokens(text), facts=facts, dropped=dropped)
+    _context_tokens.record(context.tokens)
+    _dropped_facts.record(context.dropped)
+    return context
+
+
+def _hop_distances(nbhd: dict) -> dict[str, float]:
+    '''Breadth-first distances from the seed entities, over the neighborhood's relationships.'''
+    seeds = nbhd.get('seed_entity_ids')
+    if seeds is None:
+        return defaultdict(int)
+
+    adjacency = defaultdict(list)
+    for rel in nbhd['relationships']:
+        adjacency[rel['source_entity_id']].append(rel['target_entity_id'])
+        adjacency[rel['target_entity_id']].append(rel['source_entity_id'])
+
+    hops = defaultdict(lambda: _UNREACHABLE, {entity_id: 0 for entity_id in seeds})
+    queue = deque(seeds)
+    while queue:
+        entity_id = queue.popleft()
+        for nbr in adjacency[entity_id]:
+            if nbr not in hops:
+                hops[nbr] = hops[entity_id] + 1
+                queue.append(nbr)
+    return hops
+
+
+def _name(entities: dict, entity_id: str) -> str:
+    names = entities.get(entity_id, {}).get('entity_names')
+    return names[0] if names else entity_id
+
+
+def _entity_line(entity: dict) -> str:
+    '''E.g. "Shohei Ohtani (aka Shotime): position=pitcher; bats=L"; empty if there is nothing to say.'''
+    names = entity.get('entity_names') or [entity.get('id', '')]
+    line = names[0]
+    if len(names) > 1:
+        line += f" (aka {', '.join(names[1:])})"
+    if not (properties := entity.get('properties')):
+        return line if len(names) > 1 else ''
+    if isinstance(properties, dict):
+        line += ': ' + '; '.join(
+            f'{key}={value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)}'
+            for key, value in properties.items())
+    else:
+        line += f': {properties}'
+    return line
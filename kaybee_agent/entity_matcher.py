@@ -0,0 +1,122 @@
+import threading
+from collections import deque
+from typing import Optional
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == '_'
+
+
+class EntityMatcher:
+    """Aho-Corasick automaton over the lowercased names of knowledge graph entities.
+
+    `match` finds every entity with a name occurring in the query in a single
+    pass over the query. By default an entity matches if any of its names is a
+    (case-insensitive) substring of the query; with `word_boundary=True` a name
+    must also not start or end inside a longer word.
+    """
+
+    def __init__(self, entities: Optional[dict] = None, word_boundary: bool = False):
+        self.word_boundary = word_boundary
+        self._goto: list[dict[str, int]] = [{}]
+        self._depth: list[int] = [0]
+        self._outputs: list[set[str]] = [set()]
+        self._fail: list[int] = [0]
+        self._output_link: list[int] = [0]
+        self._always: set[str] = set()  # entities with an empty name, which is in every query
+        self._end_nodes: dict[str, list[int]] = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+
+        for entity_id, entity_data in (entities or {}).items():
+            self.add(entity_id, entity_data['entity_names'])
+
+    def add(self, entity_id: str, entity_names: list[str]) -> None:
+        '''Adds (or replaces) an entity's names. Failure links are rebuilt lazily on the next match.'''
+        with self._lock:
+            self._remove(entity_id)
+            end_nodes = self._end_nodes[entity_id] = []
+            for entity_name in entity_names:
+                node = 0
+                for ch in entity_name.lower():
+                    if (child := self._goto[node].get(ch)) is None:
+                        child = self._goto[node][ch] = len(self._goto)
+                        self._goto.append({})
+                        self._depth.append(self._depth[node] + 1)
+                        self._outputs.append(set())
+                        self._fail.append(0)
+                        self._output_link.append(0)
+                    node = child
+                if node:
+                    self._outputs[node].add(entity_id)
+                    end_nodes.append(node)
+                else:
+                    self._always.add(entity_id)
+            self._dirty = True
+
+    def remove(self, entity_id: str) -> None:
+        with self._lock:
+            self._remove(entity_id)
+
+    def _remove(self, entity_id: str) -> None:
+        # Trie nodes are left in place; they simply stop producing this entity.
+        for node in self._end_nodes.pop(entity_id, []):
+            self._outputs[node].discard(entity_id)
+        self._always.discard(entity_id)
+
+    def _build_links(self) -> None:
+        goto, fail, outputs, output_link = self._goto, self._fail, self._outputs, self._output_link
+        queue = deque(goto[0].values())
+        for child in queue:
+            fail[child] = output_link[child] = 0
+        while queue:
+            node = queue.popleft()
+            for ch, child in goto[node].items():
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                f = goto[f].get(ch, 0)
+                fail[child] = f
+                output_link[child] = f if outputs[f] else output_link[f]
+                queue.append(child)
+        self._dirty = False
+
+    def prepare(self) -> None:
+        '''Builds the failure links now, rather than in the first match after names were added.'''
+        if self._dirty:
+            with self._lock:
+                if self._dirty:
+                    self._build_links()
+
+    def match(self, query: str, word_boundary: Optional[bool] = None) -> set[str]:
+        '''Returns the IDs of all entities with a name found in the query.'''
+        if word_boundary is None:
+            word_boundary = self.word_boundary
+        text = query.lower()
+        # Under the lock: a matcher carried over to a newer graph version gets
+        # names added while readers of the older version may still be matching.
+        with self._lock:
+            if self._dirty:
+                self._build_links()
+            goto, fail, outputs, output_link = self._goto, self._fail, self._outputs, self._output_link
+            found = set(self._always)
+            node = 0
+            for end, ch in enumerate(text, start=1):
+                while node and ch not in goto[node]:
+                    node = fail[node]
+                node = goto[node].get(ch, 0)
+
+                out = node if outputs[node] else output_link[node]
+                while out:
+                    if not word_boundary or self._on_word_boundary(text, end - self._depth[out], end):
+                        found |= outputs[out]
+                    out = output_link[out]
+        return found
+
+    @staticmethod
+    def _on_word_boundary(text: str, start: int, end: int) -> bool:
+        starts_clean = (start == 0 or not _is_word_char(text[start - 1])
+                        or not _is_word_char(text[start]))
+        ends_clean = (end == len(text) or not _is_word_char(text[end])
+                      or not _is_word_char(text[end - 1]))
+        return starts_clean and ends_clean
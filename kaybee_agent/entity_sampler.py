@@ -0,0 +1,114 @@
+"""Weighted random sampling of a graph's entities, for picking what to curate next.
+
+A policy is one or more weighting factors joined by "+", multiplied together:
+
+    uniform      every entity alike
+    low_degree   1 / (1 + degree), favoring sparsely connected entities
+    stale        entities sampled (in this process) in the last
+                 KG_REVISIT_AFTER_SECONDS get weight KG_REVISIT_WEIGHT, and the
+                 others 1, so curation spreads over the graph before it comes
+                 back to an entity, and comes back once it is stale again
+
+e.g. "stale+low_degree". Weights live in a Fenwick tree, so drawing an entity
+and reweighting a visited one are both O(log n).
+"""
+import os
+import random
+import threading
+import time
+from array import array
+from typing import Mapping, Optional
+
+from .graph_index import GraphIndex
+
+KG_REVISIT_WEIGHT = float(os.environ.get('KG_REVISIT_WEIGHT', 0.01))
+KG_REVISIT_AFTER_SECONDS = float(os.environ.get('KG_REVISIT_AFTER_SECONDS', 24 * 60 * 60))
+
+POLICY_FACTORS = ('uniform', 'low_degree', 'stale')
+
+
+class EntitySampler:
+    """Draws entity IDs of one graph version with probability proportional to their policy weight."""
+
+    def __init__(self, index: GraphIndex, policy: str = 'uniform', visited: Mapping[str, float] = {}):
+        '''`visited` maps entity IDs to when they were last sampled, in `time.monotonic()` seconds.'''
+        factors = set(policy.split('+'))
+        if unknown := factors - set(POLICY_FACTORS):
+            raise ValueError(f'Unknown sampling policy factors: {sorted(unknown)}')
+        self.index = index
+        self.policy = policy
+        self._stale = 'stale' in factors
+        self._lock = threading.Lock()
+
+        n = index.num_entities
+        if 'low_degree' in factors:
+            self._base = array('d', (1 / (1 + index.degree(i)) for i in range(n)))
+        else:
+            self._base = array('d', [1.0]) * n
+        self._weights = array('d', self._base)
+        # Entities down-weighted as visited, and when, oldest first.
+        self._visited: dict[int, float] = {}
+        if self._stale:
+            for entity_id, visited_at in sorted(visited.items(), key=lambda item: item[1]):
+                if (i := index.node_ids.get(entity_id)) is not None and i < n:
+                    self._weights[i] = self._base[i] * KG_REVISIT_WEIGHT
+                    self._visited[i] = visited_at
+
+        # Fenwick tree: _tree[k] sums the weights of entities (k - lowbit(k), k], 1-based.
+        self._tree = array('d', [0.0]) + self._weights
+        for k in range(1, n + 1):
+            if (parent := k + (k & -k)) <= n:
+                self._tree[parent] += self._tree[k]
+        self._top = 1 << n.bit_length() >> 1 if n else 0
+        self._expire()
+
+    def total(self) -> float:
+        total, k = 0.0, len(self._weights)
+        while k:
+            total += self._tree[k]
+            k -= k & -k
+        return total
+
+    def sample(self, rng: Optional[random.Random] = None) -> Optional[str]:
+        '''Returns a random entity ID, or None if the graph has no entities.'''
+        n = len(self._weights)
+        if not n:
+            return None
+        with self._lock:
+            self._expire()
+            target = (rng or random).random() * self.total()
+            # Descend the tree to the first entity whose prefix sum exceeds target.
+            k, step = 0, self._top
+            while step:
+                if k + step <= n and self._tree[k + step] <= target:
+                    k += step
+                    target -= self._tree[k]
+                step >>= 1
+        return self.index.entity_ids[min(k, n - 1)]
+
+    def mark_visited(self, entity_id: str) -> None:
+        '''Lowers the weight of a curated entity under the "stale" policy, until it is stale again.'''
+        i = self.index.node_ids.get(entity_id)
+        if not self._stale or i is None or i >= len(self._weights):
+            return
+        with self._lock:
+            self._visited.pop(i, None)
+            self._visited[i] = time.monotonic()
+            self._update(i, self._base[i] * KG_REVISIT_WEIGHT)
+
+    def _expire(self) -> None:
+        # Restores the weight of entities visited long enough ago to be stale again.
+        cutoff = time.monotonic() - KG_REVISIT_AFTER_SECONDS
+        while self._visited:
+            i, visited_at = next(iter(self._visited.items()))
+            if visited_at > cutoff:
+                break
+            del self._visited[i]
+            self._update(i, self._base[i])
+
+    def _update(self, i: int, weight: float) -> None:
+        delta, self._weights[i] = weight - self._weights[i], weight
+        k = i + 1
+        while k <= len(self._weights):
+            self._tree[k] += delta
+            k += k & -k
@@ -0,0 +1,120 @@
+"""Process-wide Google Cloud Storage access shared by the graph reader and the span exporter.
+
+One client (and so one authorized HTTP session with a sized connection pool)
+is created per project, the default project included whether or not it is
+named, bucket existence checks are cached for
+GCS_BUCKET_TTL_SECONDS, and every request is counted and timed per call site.
+"""
+import functools
+import inspect
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Optional
+
+import google.auth
+import requests.adapters
+from google.auth.transport.requests import AuthorizedSession
+from google.cloud import storage
+from opentelemetry import metrics
+
+GCS_POOL_MAXSIZE = int(os.environ.get('GCS_POOL_MAXSIZE', 32))
+GCS_BUCKET_TTL_SECONDS = float(os.environ.get('GCS_BUCKET_TTL_SECONDS', 300))
+
+_meter = metrics.get_meter(__name__)
+_request_counter = _meter.create_counter(
+        'gcs.requests', unit='1', description='GCS requests, by call site and operation.')
+_latency_histogram = _meter.create_histogram(
+        'gcs.request.duration', unit='ms', description='GCS request latency, by call site and operation.')
+
+_stats_lock = threading.Lock()
+_stats: dict[tuple[str, str], dict] = defaultdict(lambda: {'requests': 0, 'errors': 0, 'total_ms': 0.0})
+
+_bucket_lock = threading.Lock()
+_bucket_exists: dict[str, tuple[bool, float]] = {}
+
+_client_lock = threading.Lock()
+_clients: dict[Optional[str], storage.Client] = {}
+
+
+@functools.cache
+def _default_credentials() -> tuple:
+    return google.auth.default(scopes=storage.Client.SCOPE)
+
+
+def _http_session(credentials) -> dict:
+    # storage.Client takes its HTTP session as `_http`; if a release drops the
+    # argument, fall back to the client's own session (and default pool size).
+    if '_http' not in inspect.signature(storage.Client).parameters:
+        return {}
+    session = AuthorizedSession(credentials)
+    adapter = requests.adapters.HTTPAdapter(
+            pool_connections=GCS_POOL_MAXSIZE, pool_maxsize=GCS_POOL_MAXSIZE)
+    session.mount('https://', adapter)
+    return {'_http': session}
+
+
+def get_client(project: Optional[str] = None) -> storage.Client:
+    """Returns the shared storage client for the given (or the default) project."""
+    credentials, default_project = _default_credentials()
+    project = project or default_project
+    with _client_lock:
+        if (client := _clients.get(project)) is None:
+            client = _clients[project] = storage.Client(
+                    credentials=credentials, **({'project': project} if project else {}),
+                    **_http_session(credentials))
+    return client
+
+
+def get_bucket(bucket_name: str, client: Optional[storage.Client] = None) -> storage.Bucket:
+    """Returns a bucket handle. Unlike `Client.get_bucket`, this makes no request."""
+    return (client or get_client()).bucket(bucket_name)
+
+
+def bucket_exists(bucket: storage.Bucket, call_site: str) -> bool:
+    """Returns whether the bucket exists, checking GCS at most once per GCS_BUCKET_TTL_SECONDS."""
+    now = time.monotonic()
+    with _bucket_lock:
+        cached = _bucket_exists.get(bucket.name)
+    if cached is not None and now - cached[1] < GCS_BUCKET_TTL_SECONDS:
+        return cached[0]
+
+    with track(call_site, 'bucket_exists'):
+        exists = bucket.exists()
+    with _bucket_lock:
+        _bucket_exists[bucket.name] = (exists, now)
+    return exists
+
+
+@contextmanager
+def track(call_site: str, operation: str):
+    """Counts and times the GCS request made inside the block."""
+    attributes = {'call_site': call_site, 'operation': operation}
+    start = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except Exception:
+        failed = True
+        raise
+    finally:
+        elapsed_ms = 1000 * (time.perf_counter() - start)
+        _request_counter.add(1, attributes)
+        _latency_histogram.record(elapsed_ms, attributes)
+        with _stats_lock:
+            stats = _stats[(call_site, operation)]
+            stats['requests'] += 1
+            stats['errors'] += failed
+            stats['total_ms'] += elapsed_ms
+
+
+def gcs_stats() -> dict:
+    """Returns request counts and latency per `call_site.operation` since process start."""
+    with _stats_lock:
+        return {
+            f'{call_site}.{operation}': dict(
+                stats, mean_ms=stats['total_ms'] / stats['requests'])
+            for (call_site, operation), stats in _stats.items()
+        }
@@ -0,0 +1,308 @@
+"""Compact, memory-mappable binary format for knowledge graphs (`.kbg`).
+
+A `.kbg` file holds columnar tables over an interned string pool:
+
+    strings         UTF-8 string pool (entity IDs, aliases, relationship types)
+    nodes           string index of each node's entity ID; entities first (in
+                    `g['entities']` order), then dangling relationship endpoints
+    sorted nodes    node indices sorted by entity ID, for O(log n) lookup
+    aliases         CSR table of each entity's `entity_names`, as string indices
+    records         each entity's full JSON record, decoded only on access
+    relationships   source node, target node and type string, one column each
+    adjacency       CSR out/in relationship lists, as in `GraphIndex`
+
+Opening a file only maps it and reads the header, and since the pages come
+from the OS page cache, workers opening the same file share them.
+
+    python -m kaybee_agent.graph_binary convert <graph.json> <graph.kbg>
+    python -m kaybee_agent.graph_binary publish <graph_id>
+
+Publish again whenever `{graph_id}.json` changes (e.g. after curation): until
+then, kg_service finds the `.kbg` older than the JSON and serves the JSON.
+"""
+import argparse
+import bisect
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from collections.abc import Mapping, Sequence
+from typing import Iterator, Optional
+
+from .graph_index import GraphIndex
+
+MAGIC = b'KBGRAPH1'
+SECTIONS = [
+    ('str_offsets', 'Q'), ('str_data', 'B'),
+    ('node_str', 'I'), ('sorted_nodes', 'I'),
+    ('alias_offsets', 'Q'), ('alias_str', 'I'),
+    ('record_offsets', 'Q'), ('record_data', 'B'),
+    ('rel_source', 'I'), ('rel_target', 'I'), ('rel_type', 'I'),
+    ('out_offsets', 'Q'), ('out_edges', 'I'),
+    ('in_offsets', 'Q'), ('in_edges', 'I'),
+]
+_HEADER = struct.Struct(f'<8sQ{2 * len(SECTIONS)}Q')
+
+
+def write_binary_graph(graph: dict, path: str) -> None:
+    """Serializes a graph dict to a `.kbg` file (atomically replacing `path`)."""
+    if sys.byteorder != 'little':
+        raise RuntimeError('.kbg files are little-endian')
+
+    index = GraphIndex(graph)
+    strings: dict[str, int] = {}
+
+    def intern(s: str) -> int:
+        if (i := strings.get(s)) is None:
+            i = strings[s] = len(strings)
+        return i
+
+    node_str = array('I', (intern(entity_id) for entity_id in index.entity_ids))
+    sorted_nodes = array('I', sorted(range(index.num_nodes), key=index.entity_ids.__getitem__))
+
+    alias_offsets, alias_str = array('Q', [0]), array('I')
+    record_offsets, record_data = array('Q', [0]), bytearray()
+    for entity_data in graph['entities'].values():
+        alias_str.extend(intern(name) for name in entity_data['entity_names'])
+        alias_offsets.append(len(alias_str))
+        record_data += json.dumps(entity_data, separators=(',', ':')).encode()
+        record_offsets.append(len(record_data))
+
+    rel_type = array('I', (intern(rel['relationship']) for rel in graph.get('relationships', [])))
+
+    str_offsets, str_data = array('Q', [0]), bytearray()
+    for s in strings:  # dicts keep insertion order, i.e. string index order
+        str_data += s.encode()
+        str_offsets.append(len(str_data))
+
+    columns = {
+        'str_offsets': str_offsets, 'str_data': str_data,
+        'node_str': node_str, 'sorted_nodes': sorted_nodes,
+        'alias_offsets': alias_offsets, 'alias_str': alias_str,
+        'record_offsets': record_offsets, 'record_data': record_data,
+        'rel_source': array('I', index.rel_source), 'rel_target': array('I', index.rel_target),
+        'rel_type': rel_type,
+        'out_offsets': array('Q', index.out_offsets), 'out_edges': array('I', index.out_edges),
+        'in_offsets': array('Q', index.in_offsets), 'in_edges': array('I', index.in_edges),
+    }
+
+    layout, offset = [], _HEADER.size
+    for name, _ in SECTIONS:
+        offset += -offset % 8  # keep every column 8-byte aligned
+        size = len(memoryview(columns[name]).cast('B'))
+        layout += [offset, size]
+        offset += size
+
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix=f'{os.path.basename(path)}.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_HEADER.pack(MAGIC, len(graph['entities']), *layout))
+            for (name, _), section_offset in zip(SECTIONS, layout[::2]):
+                f.write(b'\0' * (section_offset - f.tell()))
+                f.write(memoryview(columns[name]).cast('B'))
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class BinaryGraph:
+    """A read-only, memory-mapped `.kbg` graph.
+
+    Behaves like a graph dict for reading: `g['entities']` is a mapping that
+    decodes entity records on access, and `g['relationships']` a sequence of
+    relationship dicts built on access.
+    """
+
+    def __init__(self, path: str):
+        if sys.byteorder != 'little':
+            raise RuntimeError('.kbg files are little-endian')
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buffer = memoryview(self._mmap)
+        magic, self.num_entities, *layout = _HEADER.unpack_from(buffer)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a .kbg graph')
+        for (name, fmt), offset, size in zip(SECTIONS, layout[::2], layout[1::2]):
+            setattr(self, name, buffer[offset:offset + size].cast(fmt))
+
+        self.size = len(self._mmap)
+        self.num_nodes = len(self.node_str)
+        self.entities = _Entities(self)
+        self.relationships = _Relationships(self)
+        self.node_entity_ids = _NodeEntityIds(self)
+        self.node_ids = _NodeIds(self)
+        self.aliases = _Aliases(self)
+
+    def __getitem__(self, key: str):
+        return {'entities': self.entities, 'relationships': self.relationships}[key]
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def string(self, i: int) -> str:
+        return bytes(self.str_data[self.str_offsets[i]:self.str_offsets[i + 1]]).decode()
+
+    def node(self, entity_id: str) -> Optional[int]:
+        '''Returns the node index of an entity ID (binary search over the sorted nodes).'''
+        sorted_nodes = self.sorted_nodes
+        lo = bisect.bisect_left(
+                range(self.num_nodes), entity_id,
+                key=lambda k: self.string(self.node_str[sorted_nodes[k]]))
+        if lo < self.num_nodes and self.string(self.node_str[sorted_nodes[lo]]) == entity_id:
+            return sorted_nodes[lo]
+        return None
+
+    def entity_names(self, i: int) -> list[str]:
+        return [self.string(s) for s in self.alias_str[self.alias_offsets[i]:self.alias_offsets[i + 1]]]
+
+    def record(self, i: int) -> dict:
+        return json.loads(bytes(self.record_data[self.record_offsets[i]:self.record_offsets[i + 1]]))
+
+    def index(self) -> GraphIndex:
+        """Returns a `GraphIndex` over the file's adjacency arrays, without copying them."""
+        index = GraphIndex.__new__(GraphIndex)
+        index.graph = self
+        index.entity_ids = self.node_entity_ids
+        index.num_entities = self.num_entities
+        index.node_ids = self.node_ids
+        index.num_nodes = self.num_nodes
+        index.rel_source, index.rel_target = self.rel_source, self.rel_target
+        index.out_offsets, index.out_edges = self.out_offsets, self.out_edges
+        index.in_offsets, index.in_edges = self.in_offsets, self.in_edges
+        index.relationship_types = _RelationshipTypes(self)
+        return index
+
+
+class _NodeEntityIds(Sequence):
+    def __init__(self, g: BinaryGraph):
+        self._g = g
+
+    def __len__(self) -> int:
+        return self._g.num_nodes
+
+    def __getitem__(self, i: int) -> str:
+        if not -self._g.num_nodes <= i < self._g.num_nodes:
+            raise IndexError(i)
+        return self._g.string(self._g.node_str[i])
+
+
+class _NodeIds(Mapping):
+    def __init__(self, g: BinaryGraph):
+        self._g = g
+
+    def __len__(self) -> int:
+        return self._g.num_nodes
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._g.node_entity_ids)
+
+    def __getitem__(self, entity_id: str) -> int:
+        if (i := self._g.node(entity_id)) is None:
+            raise KeyError(entity_id)
+        return i
+
+
+class _Entities(Mapping):
+    def __init__(self, g: BinaryGraph):
+        self._g = g
+
+    def __len__(self) -> int:
+        return self._g.num_entities
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(self._g.num_entities):
+            yield self._g.string(self._g.node_str[i])
+
+    def __getitem__(self, entity_id: str) -> dict:
+        i = self._g.node(entity_id)
+        if i is None or i >= self._g.num_entities:
+            raise KeyError(entity_id)
+        return self._g.record(i)
+
+    def items(self):
+        # In file order, rather than looking each entity ID up again.
+        for i in range(self._g.num_entities):
+            yield self._g.string(self._g.node_str[i]), self._g.record(i)
+
+
+class _Aliases(_Entities):
+    """Maps entity IDs to `{'entity_names': [...]}` from the alias table, without decoding records."""
+
+    def __getitem__(self, entity_id: str) -> dict:
+        i = self._g.node(entity_id)
+        if i is None or i >= self._g.num_entities:
+            raise KeyError(entity_id)
+        return {'entity_names': self._g.entity_names(i)}
+
+    def items(self):
+        for i in range(self._g.num_entities):
+            yield self._g.string(self._g.node_str[i]), {'entity_names': self._g.entity_names(i)}
+
+
+class _Relationships(Sequence):
+    def __init__(self, g: BinaryGraph):
+        self._g = g
+
+    def __len__(self) -> int:
+        return len(self._g.rel_source)
+
+    def __getitem__(self, r: int) -> dict:
+        g = self._g
+        if not -len(self) <= r < len(self):
+            raise IndexError(r)
+        return {
+            'source_entity_id': g.string(g.node_str[g.rel_source[r]]),
+            'target_entity_id': g.string(g.node_str[g.rel_target[r]]),
+            'relationship': g.string(g.rel_type[r]),
+        }
+
+
+class _RelationshipTypes(Sequence):
+    def __init__(self, g: BinaryGraph):
+        self._g = g
+
+    def __len__(self) -> int:
+        return len(self._g.rel_type)
+
+    def __getitem__(self, r: int) -> str:
+        return self._g.string(self._g.rel_type[r])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    convert = subparsers.add_parser('convert', help='Convert a local graph JSON file.')
+    convert.add_argument('source')
+    convert.add_argument('target')
+    publish = subparsers.add_parser(
+            'publish', help='Write {graph_id}.kbg next to {graph_id}.json in the configured graph store.')
+    publish.add_argument('graph_id')
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        with open(args.source) as f:
+            write_binary_graph(json.load(f), args.target)
+        return
+
+    from .graph_store import GraphStore, get_backend
+    backend = get_backend()
+    data = backend.read(GraphStore.legacy_name(args.graph_id))
+    if data is None:
+        sys.exit(f'No graph {args.graph_id} found')
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'graph.kbg')
+        write_binary_graph(json.loads(data), path)
+        with open(path, 'rb') as f:
+            backend.write(f'{args.graph_id}.kbg', f.read(), content_type='application/octet-stream')
+
+
+if __name__ == '__main__':
+    main()
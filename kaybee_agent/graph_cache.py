@@ -0,0 +1,274 @@
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Hashable, Optional
+
+
+@dataclass
+class CachedGraph:
+    """A parsed knowledge graph together with the storage version it was read at."""
+    graph_id: str
+    generation: Optional[int]
+    graph: dict
+    size: int
+    checked_at: float = field(default_factory=time.monotonic)
+    derived: dict[str, Any] = field(default_factory=dict, repr=False)
+    hits: int = 0
+    priority: float = 0.0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+    _building: dict[str, threading.Lock] = field(default_factory=dict, repr=False, compare=False)
+
+    def derive(self, name: str, build: Callable[[dict], Any]) -> Any:
+        '''Returns an artifact computed from this graph version, building it on first use.
+
+        Concurrent first uses of an artifact wait for one build; different
+        artifacts of the same graph are still built in parallel.
+        '''
+        if (value := self.derived.get(name)) is not None:
+            return value
+        with self._lock:
+            lock = self._building.setdefault(name, threading.Lock())
+        with lock:
+            if (value := self.derived.get(name)) is None:
+                value = self.derived[name] = build(self.graph)
+        return value
+
+
+class GraphCache:
+    """Bounded, per-process cache of parsed knowledge graphs, keyed by graph ID.
+
+    Graphs belong to tenants (by default, each graph is its own tenant; see
+    `tenant_of`), and a tenant may be given a byte quota, so that one large
+    tenant can't push every other tenant's graphs out of the worker.
+
+    Eviction is cost-aware (GreedyDual-Size-Frequency): each entry's priority is
+    its hit count per byte plus an aging clock, which is advanced to the
+    priority of each evicted entry. Small, frequently used graphs stay; large
+    or rarely used ones go first, and entries that were popular long ago
+    eventually age out. Entries are evicted from the over-quota tenant first,
+    then from any tenant while either the number of entries or their total
+    size (in serialized bytes) exceeds its limit.
+
+    Sizes, and so quotas, are the graphs' serialized bytes: the artifacts
+    derived from a graph (its index, matchers and so on) aren't charged to its
+    entry, and may take several times as much memory. The limits decide which
+    graphs stay, but don't bound the memory they take.
+    """
+
+    def __init__(
+            self, max_entries: int = 32, max_bytes: int = 256 * 1024 * 1024,
+            tenant_max_bytes: Optional[int] = None, tenant_quotas: Optional[dict[str, int]] = None,
+            tenant_of: Callable[[str], str] = lambda graph_id: graph_id):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.tenant_max_bytes = tenant_max_bytes
+        self.tenant_quotas = dict(tenant_quotas or {})
+        self.tenant_of = tenant_of
+        self._entries: dict[str, CachedGraph] = {}
+        self._bytes = 0
+        self._tenant_bytes: dict[str, int] = defaultdict(int)
+        self._tenant_entries: dict[str, int] = defaultdict(int)
+        self._clock = 0.0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.quota_evictions = 0
+
+    def quota(self, tenant: str) -> Optional[int]:
+        '''The most bytes the tenant's graphs may take, or None if only the global limit applies.'''
+        return self.tenant_quotas.get(tenant, self.tenant_max_bytes)
+
+    def get(self, graph_id: str, generation: Optional[int]) -> Optional[CachedGraph]:
+        '''Returns the cached graph if it is still at the given generation.'''
+        with self._lock:
+            entry = self._entries.get(graph_id)
+            if entry is None or entry.generation != generation:
+                self.misses += 1
+                return None
+            self._touch(entry)
+            entry.checked_at = time.monotonic()
+            self.hits += 1
+            return entry
+
+    def peek(self, graph_id: str) -> Optional[CachedGraph]:
+        '''Returns the cached graph, whatever its generation, without counting a lookup.'''
+        with self._lock:
+            return self._entries.get(graph_id)
+
+    def get_recent(self, graph_id: str, max_age: float) -> Optional[CachedGraph]:
+        '''Returns the cached graph, without revalidation, if it was checked within `max_age` seconds.'''
+        if max_age <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(graph_id)
+            if entry is None or time.monotonic() - entry.checked_at > max_age:
+                return None
+            self._touch(entry)
+            self.hits += 1
+            return entry
+
+    def put(self, graph_id: str, generation: Optional[int], graph: dict, size: int) -> CachedGraph:
+        entry = CachedGraph(
+                graph_id=graph_id, generation=generation, graph=graph, size=size)
+        with self._lock:
+            if (old := self._remove(graph_id)) is not None:
+                # A new version of a graph keeps the old one's popularity.
+                entry.hits = old.hits
+            self._entries[graph_id] = entry
+            self._bytes += size
+            tenant = self.tenant_of(graph_id)
+            self._tenant_bytes[tenant] += size
+            self._tenant_entries[tenant] += 1
+            self._touch(entry)
+            self._evict(entry)
+        return entry
+
+    def invalidate(self, graph_id: str) -> None:
+        with self._lock:
+            self._remove(graph_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._tenant_bytes.clear()
+            self._tenant_entries.clear()
+            self._clock = 0.0
+
+    def _touch(self, entry: CachedGraph) -> None:
+        entry.hits += 1
+        entry.priority = self._clock + entry.hits / max(entry.size, 1)
+
+    def _remove(self, graph_id: str) -> Optional[CachedGraph]:
+        if (old := self._entries.pop(graph_id, None)) is not None:
+            self._bytes -= old.size
+            tenant = self.tenant_of(graph_id)
+            self._tenant_bytes[tenant] -= old.size
+            self._tenant_entries[tenant] -= 1
+            if not self._tenant_entries[tenant]:
+                del self._tenant_bytes[tenant], self._tenant_entries[tenant]
+        return old
+
+    def _victim(self, keep: CachedGraph, tenant: Optional[str] = None) -> Optional[CachedGraph]:
+        # A linear scan: evictions happen on inserts only, and a worker holds
+        # at most hundreds of graphs.
+        candidates = (
+                entry for entry in self._entries.values()
+                if entry is not keep and (tenant is None or self.tenant_of(entry.graph_id) == tenant))
+        return min(candidates, key=lambda entry: entry.priority, default=None)
+
+    def _evict(self, keep: CachedGraph) -> None:
+        # Always keep the entry just inserted, even if it alone exceeds a limit.
+        tenant = self.tenant_of(keep.graph_id)
+        if (quota := self.quota(tenant)) is not None:
+            while self._tenant_bytes[tenant] > quota and (
+                    victim := self._victim(keep, tenant)) is not None:
+                self._evict_entry(victim)
+                self.quota_evictions += 1
+        while (len(self._entries) > self.max_entries or self._bytes > self.max_bytes) and (
+                victim := self._victim(keep)) is not None:
+            self._evict_entry(victim)
+
+    def _evict_entry(self, entry: CachedGraph) -> None:
+        self._remove(entry.graph_id)
+        self._clock = max(self._clock, entry.priority)
+        self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'tenants': len(self._tenant_entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'quota_evictions': self.quota_evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+    def tenant_stats(self) -> dict[str, dict]:
+        '''Returns each tenant's cached graphs, bytes and quota.'''
+        with self._lock:
+            return {
+                tenant: {
+                    'entries': self._tenant_entries[tenant],
+                    'bytes': self._tenant_bytes[tenant],
+                    'quota': self.quota(tenant),
+                }
+                for tenant in self._tenant_entries
+            }
+
+
+class ResultCache:
+    """Bounded LRU cache of results computed from a versioned graph.
+
+    Keys are scoped to a graph ID and tagged with the graph version they were
+    computed from; storing a result for a new version of a graph drops every
+    result of the older one.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple[str, Hashable], Any] = OrderedDict()
+        self._keys: dict[str, set[Hashable]] = {}
+        self._versions: dict[str, Hashable] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, graph_id: str, version: Hashable, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            if self._versions.get(graph_id) != version or (graph_id, key) not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((graph_id, key))
+            self.hits += 1
+            return self._entries[(graph_id, key)]
+
+    def put(self, graph_id: str, version: Hashable, key: Hashable, value: Any) -> Any:
+        with self._lock:
+            if graph_id in self._versions and self._versions[graph_id] != version:
+                self._invalidate(graph_id)
+            self._versions[graph_id] = version
+            self._entries[(graph_id, key)] = value
+            self._entries.move_to_end((graph_id, key))
+            self._keys.setdefault(graph_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                (old_graph_id, old_key), _ = self._entries.popitem(last=False)
+                self._keys[old_graph_id].discard(old_key)
+                self.evictions += 1
+        return value
+
+    def invalidate(self, graph_id: str) -> None:
+        with self._lock:
+            self._invalidate(graph_id)
+            self._versions.pop(graph_id, None)
+
+    def _invalidate(self, graph_id: str) -> None:
+        for key in self._keys.pop(graph_id, ()):
+            del self._entries[(graph_id, key)]
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._keys.clear()
+            self._versions.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
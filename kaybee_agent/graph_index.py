@@ -0,0 +1,188 @@
+import functools
+from array import array
+from collections.abc import Collection, Sequence
+from itertools import chain
+from typing import Iterable, Iterator, Optional
+
+
+class GraphIndex:
+    """Compact adjacency index over a knowledge graph dict.
+
+    Entity IDs are interned to integers (in `g['entities']` order, followed by
+    any relationship endpoints missing from `g['entities']`). Relationships are
+    stored in CSR form: for node `i`, `out_edges[out_offsets[i]:out_offsets[i+1]]`
+    are the indices (into `g['relationships']`) of the relationships leaving
+    `i`, and likewise for `in_offsets`/`in_edges`.
+    """
+
+    def __init__(self, graph: dict):
+        self.graph = graph
+        self.entity_ids: list[str] = list(graph['entities'])
+        self.num_entities = len(self.entity_ids)
+        self.node_ids: dict[str, int] = {
+                entity_id: i for i, entity_id in enumerate(self.entity_ids)}
+
+        relationships = graph.get('relationships', [])
+        self.rel_source = array('q', bytes(8 * len(relationships)))
+        self.rel_target = array('q', bytes(8 * len(relationships)))
+        for r, rel in enumerate(relationships):
+            self.rel_source[r] = self._intern(rel['source_entity_id'])
+            self.rel_target[r] = self._intern(rel['target_entity_id'])
+        self.num_nodes = len(self.entity_ids)
+
+        self.out_offsets, self.out_edges = _build_csr(self.num_nodes, self.rel_source)
+        self.in_offsets, self.in_edges = _build_csr(self.num_nodes, self.rel_target)
+
+    def _intern(self, entity_id: str) -> int:
+        if (i := self.node_ids.get(entity_id)) is None:
+            i = self.node_ids[entity_id] = len(self.entity_ids)
+            self.entity_ids.append(entity_id)
+        return i
+
+    def out_relationships(self, i: int) -> Iterable[int]:
+        return self.out_edges[self.out_offsets[i]:self.out_offsets[i + 1]]
+
+    def in_relationships(self, i: int) -> Iterable[int]:
+        return self.in_edges[self.in_offsets[i]:self.in_offsets[i + 1]]
+
+    def neighbors(self, i: int) -> Iterator[int]:
+        '''Yields the neighbors of node `i`, ignoring edge direction (possibly with repeats).'''
+        rel_target, rel_source = self.rel_target, self.rel_source
+        for r in self.out_relationships(i):
+            yield rel_target[r]
+        for r in self.in_relationships(i):
+            yield rel_source[r]
+
+    def degree(self, i: int) -> int:
+        return (self.out_offsets[i + 1] - self.out_offsets[i]
+                + self.in_offsets[i + 1] - self.in_offsets[i])
+
+    @functools.cached_property
+    def relationship_types(self) -> Sequence[str]:
+        return [rel['relationship'] for rel in self.graph.get('relationships', [])]
+
+    def subgraph(
+            self, entity_ids: set[str], num_hops: Optional[int] = 2,
+            max_fanout: Optional[int] = None, max_nodes: Optional[int] = None,
+            max_edges: Optional[int] = None,
+            relationship_types: Optional[Collection[str]] = None) -> dict:
+        '''Extracts the neighborhood of the given entities: their `entities` by ID and `relationships`.
+
+        A breadth-first search of `num_hops` hops from the given entities, which
+        takes at most `max_fanout` new neighbors from any one entity, follows only
+        `relationship_types` (if given), and stops expanding as soon as the
+        subgraph reaches `max_nodes` entities or `max_edges` relationships have
+        been traversed. At most `max_edges` relationships are returned, those
+        closest to the given entities first.
+
+        `has_external_neighbor` marks the entities with relationships (of any
+        type) to entities outside the subgraph.
+        '''
+        seeds = sorted(self.node_ids[e] for e in entity_ids if e in self.node_ids)
+        nodes = dict.fromkeys(seeds)  # in discovery order
+        allowed = None if relationship_types is None else set(relationship_types)
+        types = self.relationship_types if allowed is not None else None
+        rel_source, rel_target = self.rel_source, self.rel_target
+
+        # Expanded nodes none of whose neighbors were left out.
+        complete = set()
+        frontier, traversed, exhausted = seeds, 0, False
+        for _ in range(num_hops or 0):
+            next_frontier = []
+            for i in frontier:
+                taken, cut = 0, False
+                for r, nbr in chain(
+                        ((r, rel_target[r]) for r in self.out_relationships(i)),
+                        ((r, rel_source[r]) for r in self.in_relationships(i))):
+                    if types is not None and types[r] not in allowed:
+                        continue
+                    if max_edges is not None and traversed >= max_edges:
+                        cut = exhausted = True
+                        break
+                    traversed += 1
+                    if nbr in nodes:
+                        continue
+                    if max_nodes is not None and len(nodes) >= max_nodes:
+                        cut = exhausted = True
+                        break
+                    if max_fanout is not None and taken >= max_fanout:
+                        cut = True
+                        break
+                    taken += 1
+                    nodes[nbr] = None
+                    next_frontier.append(nbr)
+                if not cut and allowed is None:
+                    complete.add(i)
+                if exhausted:
+                    break
+            frontier = next_frontier
+            if exhausted or not frontier:
+                break
+
+        valence_nodes = {
+                i for i in nodes
+                if i not in complete and any(nbr not in nodes for nbr in self.neighbors(i))
+        }
+
+        return self._format(nodes, valence_nodes, max_edges=max_edges, allowed=allowed)
+
+    def _format(
+            self, nodes: dict[int, None], valence_nodes: set[int],
+            max_edges: Optional[int] = None, allowed: Optional[set[str]] = None) -> dict:
+        entities = self.graph['entities']
+        rel_target = self.rel_target
+        relationships = self.graph.get('relationships', [])
+        types = self.relationship_types if allowed is not None else None
+        if max_edges is None:
+            rel_ids = sorted(
+                    r for i in nodes for r in self.out_relationships(i)
+                    if rel_target[r] in nodes and (types is None or types[r] in allowed))
+        else:
+            # Take relationships in order of their later-discovered endpoint, so
+            # the budget goes to those closest to the given entities.
+            rank = {i: k for k, i in enumerate(nodes)}
+            rel_ids = []
+            for i, k in rank.items():
+                closing = sorted(chain(
+                        (r for r in self.out_relationships(i) if rank.get(rel_target[r], k + 1) <= k),
+                        (r for r in self.in_relationships(i) if rank.get(self.rel_source[r], k) < k)))
+                rel_ids += [r for r in closing if types is None or types[r] in allowed]
+                if len(rel_ids) >= max_edges:
+                    break
+            rel_ids = sorted(rel_ids[:max_edges])
+
+        subgraph_entities = {}
+        for i in sorted(nodes):
+            entity_id = self.entity_ids[i]
+            subgraph_entities[entity_id] = {
+                **entities.get(entity_id, {}),
+                'id': entity_id,
+                'has_external_neighbor': i in valence_nodes,
+            }
+
+        return {
+            'entities': subgraph_entities,
+            'relationships': [
+                {
+                    'source_entity_id': relationships[r]['source_entity_id'],
+                    'target_entity_id': relationships[r]['target_entity_id'],
+                    'relationship': relationships[r]['relationship'],
+                } for r in rel_ids
+            ]
+        }
+
+
+def _build_csr(num_nodes: int, endpoints: array) -> tuple[array, array]:
+    '''Groups edge indices by endpoint with a counting sort, preserving edge order within each group.'''
+    offsets = array('q', bytes(8 * (num_nodes + 1)))
+    for node in endpoints:
+        offsets[node + 1] += 1
+    for i in range(num_nodes):
+        offsets[i + 1] += offsets[i]
+
+    edges = array('q', bytes(8 * len(endpoints)))
+    cursor = array('q', offsets[:-1])
+    for r, node in enumerate(endpoints):
+        edges[cursor[node]] = r
+        cursor[node] += 1
+    return offsets, edges
@@ -0,0 +1,310 @@
+"""Versioned knowledge graph storage: compacted snapshots plus an append-only delta log.
+
+Layout, for a graph `g`:
+
+    g.json                          legacy single-document graph
+    g/snapshots/000000000042.json   the full graph as of delta 42
+    g/deltas/000000000043.json      a list of ops applied on top of it
+
+A graph's version is the sequence number of the last delta applied to it.
+Readers holding a cached graph catch up by reading only the deltas after their
+version. Ops are:
+
+    {"op": "upsert_entity", "entity": {...}}
+    {"op": "delete_entity", "entity_id": "..."}        (also drops its relationships)
+    {"op": "upsert_relationship", "relationship": {...}}
+    {"op": "delete_relationship", "relationship": {...}}
+
+Relationships are identified by (source_entity_id, target_entity_id, relationship).
+
+    python -m kaybee_agent.graph_store migrate <graph_id> [--root DIR]
+    python -m kaybee_agent.graph_store compact <graph_id> [--root DIR] [--prune]
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Iterable, Optional
+
+from google.api_core.exceptions import NotFound, PreconditionFailed
+
+from . import gcs
+
+_SEQ_DIGITS = 12
+
+
+class GCSBackend:
+    """Graph storage in a GCS bucket."""
+
+    def __init__(self, bucket_name: str):
+        self.bucket = gcs.get_bucket(bucket_name)
+
+    def stat(self, name: str) -> Optional[int]:
+        '''Returns the object's generation, or None if it doesn't exist.'''
+        with gcs.track('graph_store', 'stat'):
+            blob = self.bucket.get_blob(name)
+        return blob.generation if blob is not None else None
+
+    def read(self, name: str, generation: Optional[int] = None) -> Optional[bytes]:
+        try:
+            with gcs.track('graph_store', 'read'):
+                return self.bucket.blob(name, generation=generation).download_as_bytes()
+        except NotFound:
+            return None
+
+    def download(self, name: str, path: str, generation: Optional[int] = None) -> None:
+        with gcs.track('graph_store', 'download'):
+            self.bucket.blob(name, generation=generation).download_to_filename(path)
+
+    def write(
+            self, name: str, data: bytes, if_absent: bool = False,
+            content_type: str = 'application/json') -> bool:
+        '''Writes the object; with `if_absent`, returns False instead if it already exists.'''
+        try:
+            with gcs.track('graph_store', 'write'):
+                self.bucket.blob(name).upload_from_string(
+                        data, content_type,
+                        if_generation_match=0 if if_absent else None)
+        except PreconditionFailed:
+            return False
+        return True
+
+    def list(self, prefix: str, start_offset: Optional[str] = None) -> list[str]:
+        with gcs.track('graph_store', 'list'):
+            return sorted(blob.name for blob in self.bucket.list_blobs(
+                prefix=prefix, start_offset=start_offset))
+
+    def delete(self, name: str) -> None:
+        with gcs.track('graph_store', 'delete'):
+            self.bucket.blob(name).delete()
+
+
+class FilesystemBackend:
+    """Graph storage in a local directory, with the same layout as the bucket."""
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def stat(self, name: str) -> Optional[int]:
+        try:
+            return (self.root / name).stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def read(self, name: str, generation: Optional[int] = None) -> Optional[bytes]:
+        try:
+            return (self.root / name).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def download(self, name: str, path: str, generation: Optional[int] = None) -> None:
+        shutil.copyfile(self.root / name, path)
+
+    def write(
+            self, name: str, data: bytes, if_absent: bool = False,
+            content_type: str = 'application/json') -> bool:
+        path = self.root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first so readers never see a partial object.
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        try:
+            if if_absent:
+                try:
+                    os.link(tmp, path)
+                except FileExistsError:
+                    return False
+            else:
+                os.replace(tmp, path)
+                tmp = None
+        finally:
+            if tmp is not None:
+                os.unlink(tmp)
+        return True
+
+    def list(self, prefix: str, start_offset: Optional[str] = None) -> list[str]:
+        directory = self.root / prefix if prefix.endswith('/') else (self.root / prefix).parent
+        if not directory.is_dir():
+            return []
+        names = (
+            str((directory / entry).relative_to(self.root))
+            for entry in os.listdir(directory) if not entry.startswith('.tmp-'))
+        return sorted(
+                name for name in names
+                if name.startswith(prefix) and (start_offset is None or name >= start_offset))
+
+    def delete(self, name: str) -> None:
+        (self.root / name).unlink(missing_ok=True)
+
+
+def empty_graph() -> dict:
+    return {'entities': {}, 'relationships': []}
+
+
+def _relationship_key(rel: dict) -> tuple:
+    return (rel['source_entity_id'], rel['target_entity_id'], rel['relationship'])
+
+
+def apply_ops(graph: dict, ops: Iterable[dict]) -> dict:
+    """Returns a new graph with the ops applied; `graph` itself is left untouched."""
+    entities = dict(graph['entities'])
+    relationships = list(graph.get('relationships', []))
+    relationship_keys = None  # built on the first relationship upsert
+    for op in ops:
+        match op['op']:
+            case 'upsert_entity':
+                entities[op['entity']['entity_id']] = op['entity']
+            case 'delete_entity':
+                entity_id = op['entity_id']
+                entities.pop(entity_id, None)
+                relationships = [
+                        rel for rel in relationships
+                        if entity_id not in (rel['source_entity_id'], rel['target_entity_id'])]
+                relationship_keys = None
+            case 'upsert_relationship':
+                if relationship_keys is None:
+                    relationship_keys = set(map(_relationship_key, relationships))
+                key = _relationship_key(op['relationship'])
+                if key not in relationship_keys:
+                    relationships.append(op['relationship'])
+                    relationship_keys.add(key)
+            case 'delete_relationship':
+                key = _relationship_key(op['relationship'])
+                relationships = [rel for rel in relationships if _relationship_key(rel) != key]
+                relationship_keys = None
+            case unknown:
+                raise ValueError(f'Unknown graph op: {unknown}')
+    return {'entities': entities, 'relationships': relationships}
+
+
+class GraphStore:
+    """Reads and writes versioned graphs (snapshots plus delta log) over a storage backend."""
+
+    def __init__(self, backend: GCSBackend | FilesystemBackend):
+        self.backend = backend
+
+    @staticmethod
+    def legacy_name(graph_id: str) -> str:
+        return f'{graph_id}.json'
+
+    @staticmethod
+    def _name(graph_id: str, kind: str, seq: Optional[int] = None) -> str:
+        if seq is None:
+            return f'{graph_id}/{kind}/'
+        return f'{graph_id}/{kind}/{seq:0{_SEQ_DIGITS}d}.json'
+
+    @staticmethod
+    def _seq(name: str) -> int:
+        return int(name.rsplit('/', 1)[-1].removesuffix('.json'))
+
+    def load(self, graph_id: str) -> tuple[dict, int, int]:
+        """Loads the latest version of a graph.
+
+        Returns:
+            tuple: The graph, its version, and the number of bytes read.
+        """
+        snapshots = self.backend.list(self._name(graph_id, 'snapshots'))
+        if snapshots:
+            data = self.backend.read(snapshots[-1])
+            graph, version = json.loads(data), self._seq(snapshots[-1])
+        elif (data := self.backend.read(self.legacy_name(graph_id))) is not None:
+            graph, version = json.loads(data), 0
+        else:
+            data, graph, version = b'', empty_graph(), 0
+
+        size = len(data)
+        for seq, ops, delta_size in self.read_deltas(graph_id, after=version):
+            graph = apply_ops(graph, ops)
+            version = seq
+            size += delta_size
+        return graph, version, size
+
+    def read_deltas(self, graph_id: str, after: int) -> list[tuple[int, list[dict], int]]:
+        """Returns (version, ops, size in bytes) for each delta after the given version, in order."""
+        names = self.backend.list(
+                self._name(graph_id, 'deltas'),
+                start_offset=self._name(graph_id, 'deltas', after + 1))
+        deltas = []
+        for name in names:
+            if (data := self.backend.read(name)) is not None:
+                deltas.append((self._seq(name), json.loads(data), len(data)))
+        return deltas
+
+    def snapshot_version(self, graph_id: str) -> Optional[int]:
+        """Returns the version of the newest snapshot, or None if there is none."""
+        snapshots = self.backend.list(self._name(graph_id, 'snapshots'))
+        return self._seq(snapshots[-1]) if snapshots else None
+
+    def latest_version(self, graph_id: str) -> int:
+        deltas = self.backend.list(self._name(graph_id, 'deltas'))
+        snapshots = self.backend.list(self._name(graph_id, 'snapshots'))
+        return max((self._seq(name) for name in deltas + snapshots), default=0)
+
+    def append(self, graph_id: str, ops: list[dict], max_attempts: int = 10) -> int:
+        """Appends ops to the delta log and returns the new version."""
+        data = json.dumps(ops).encode()
+        version = self.latest_version(graph_id)
+        for _ in range(max_attempts):
+            version += 1
+            if self.backend.write(self._name(graph_id, 'deltas', version), data, if_absent=True):
+                return version
+            # Lost a race with another writer; the next version number may be free.
+        raise RuntimeError(f'Could not append to the delta log of graph {graph_id}')
+
+    def compact(self, graph_id: str, prune: bool = False) -> int:
+        """Writes a snapshot of the latest version, optionally deleting the deltas and snapshots it covers.
+
+        Readers whose cached version predates the snapshot can't catch up on deltas
+        once they are pruned; they find the newer snapshot and reload the graph.
+        """
+        graph, version, _ = self.load(graph_id)
+        self.backend.write(
+                self._name(graph_id, 'snapshots', version), json.dumps(graph).encode())
+        if prune:
+            for name in self.backend.list(self._name(graph_id, 'deltas')):
+                if self._seq(name) <= version:
+                    self.backend.delete(name)
+            for name in self.backend.list(self._name(graph_id, 'snapshots')):
+                if self._seq(name) < version:
+                    self.backend.delete(name)
+        return version
+
+    def migrate(self, graph_id: str) -> int:
+        """Turns a legacy `{graph_id}.json` graph into the initial snapshot, if there is none yet."""
+        if snapshots := self.backend.list(self._name(graph_id, 'snapshots')):
+            return self._seq(snapshots[-1])
+        data = self.backend.read(self.legacy_name(graph_id))
+        if data is None:
+            data = json.dumps(empty_graph()).encode()
+        self.backend.write(self._name(graph_id, 'snapshots', 0), data, if_absent=True)
+        return 0
+
+
+def get_backend() -> GCSBackend | FilesystemBackend:
+    """Returns the backend configured by KG_STORE ("gcs", the default, or "fs" under KG_STORE_ROOT)."""
+    if os.environ.get('KG_STORE', 'gcs') == 'fs':
+        return FilesystemBackend(os.environ.get('KG_STORE_ROOT', '.kg_store'))
+    return GCSBackend(os.environ.get('KNOWLEDGE_GRAPH_BUCKET'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['migrate', 'compact'])
+    parser.add_argument('graph_id')
+    parser.add_argument('--root', help='Use the filesystem backend rooted here instead of KG_STORE.')
+    parser.add_argument('--prune', action='store_true', help='After compacting, delete covered deltas and snapshots.')
+    args = parser.parse_args()
+
+    store = GraphStore(FilesystemBackend(args.root) if args.root else get_backend())
+    if args.command == 'migrate':
+        version = store.migrate(args.graph_id)
+    else:
+        version = store.compact(args.graph_id, prune=args.prune)
+    print(f'{args.graph_id}: snapshot at version {version}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,198 @@
+import asyncio
+import contextlib
+import contextvars
+import functools
 import json
 import logging
 import os
-import networkx as nx
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Executor, ThreadPoolExecutor
+from dataclasses import dataclass
 from dotenv import load_dotenv
-from typing import Optional
+from typing import Optional, Sequence
 
-from google.cloud import storage
 from floggit import flog
+from opentelemetry import metrics
+
+from . import telemetry
+
+from .alias_index import AliasIndex
+from .entity_matcher import EntityMatcher
+from .entity_sampler import KG_REVISIT_AFTER_SECONDS, EntitySampler
+from .graph_binary import BinaryGraph
+from .graph_cache import CachedGraph, GraphCache, ResultCache
+from .graph_index import GraphIndex
+from .graph_store import FilesystemBackend, GraphStore, apply_ops, empty_graph, get_backend
+from .property_index import PropertyIndex, parse_aggregate, parse_filter
 
 load_dotenv()
 
+# Graph IDs are "{tenant}{KG_TENANT_SEPARATOR}{graph}" when the separator is
+# set; otherwise every graph is its own tenant. Each tenant's cached graphs may
+# take at most KG_TENANT_MAX_BYTES, or its own quota from KG_TENANT_QUOTAS
+# ("tenant=bytes,..."); unset, only the cache's overall limits apply. Like
+# KG_CACHE_MAX_BYTES, quotas count the graphs' serialized bytes only, not the
+# indexes and matchers built from them, so they bound a tenant's share of the
+# cache rather than the memory it takes.
+KG_TENANT_SEPARATOR = os.environ.get('KG_TENANT_SEPARATOR', '')
+KG_TENANT_MAX_BYTES = int(os.environ['KG_TENANT_MAX_BYTES']) if os.environ.get('KG_TENANT_MAX_BYTES') else None
+KG_TENANT_QUOTAS = {
+        tenant: int(quota)
+        for tenant, quota in (
+            item.split('=', 1) for item in os.environ.get('KG_TENANT_QUOTAS', '').split(',') if item)}
+
+
+def tenant_of(graph_id: str) -> str:
+    if not KG_TENANT_SEPARATOR:
+        return graph_id
+    return graph_id.split(KG_TENANT_SEPARATOR, 1)[0]
+
+
+# Parsed graphs are kept per process and revalidated against the blob's
+# generation, so an unchanged graph costs one metadata request per turn (or
+# none, within KG_CACHE_TTL_SECONDS of the last check).
+_graph_cache = GraphCache(
+        max_entries=int(os.environ.get('KG_CACHE_MAX_ENTRIES', 32)),
+        max_bytes=int(os.environ.get('KG_CACHE_MAX_BYTES', 256 * 1024 * 1024)),
+        tenant_max_bytes=KG_TENANT_MAX_BYTES,
+        tenant_quotas=KG_TENANT_QUOTAS,
+        tenant_of=tenant_of)
+KG_CACHE_TTL_SECONDS = float(os.environ.get('KG_CACHE_TTL_SECONDS', 0))
+
+# Cache misses on the same graph version are single-flighted: concurrent first
+# turns wait for one download and parse instead of each doing their own.
+_loads_lock = threading.Lock()
+_loads: dict[tuple, list] = {}  # key -> [lock, number of threads using it]
+
+
+@contextlib.contextmanager
+def _single_flight(*key):
+    with _loads_lock:
+        load = _loads.setdefault(key, [threading.Lock(), 0])
+        load[1] += 1
+    try:
+        with load[0]:
+            yield
+    finally:
+        with _loads_lock:
+            load[1] -= 1
+            if not load[1]:
+                del _loads[key]
+
+
+def _cached_at(graph_id: str, generation: Optional[int]) -> Optional[CachedGraph]:
+    # The graph another thread loaded while this one waited for it, if any.
+    if (entry := _graph_cache.peek(graph_id)) is not None and entry.generation == generation:
+        telemetry.annotate(cache='joined')
+        return entry
+    return None
+
+# "json" reads the single-document {graph_id}.json; "delta" reads snapshots plus
+# the delta log (see graph_store), so cached graphs catch up on new deltas only;
+# "binary" memory-maps {graph_id}.kbg (see graph_binary), falling back to JSON
+# if there is none, or if it's older than the JSON.
+KG_STORE_FORMAT = os.environ.get('KG_STORE_FORMAT', 'json')
+# Where binary graphs from GCS are downloaded to, to be memory-mapped (and so
+# shared by all workers on the instance).
+KG_BINARY_CACHE_DIR = os.environ.get(
+        'KG_BINARY_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'kaybee-graphs'))
+# Binary graphs found older than their JSON graph, warned about once per version.
+_stale_binary_graphs: set[tuple[str, int]] = set()
+
+# Only match entity names that start and end on word boundaries (so e.g. "Al"
+# does not match inside "Alabama").
+KG_MATCH_WORD_BOUNDARY = os.environ.get('KG_MATCH_WORD_BOUNDARY', '').lower() in ('1', 'true')
+# Also match entity names misspelled, without accents or punctuated differently
+# (see alias_index), scoring at least KG_FUZZY_MIN_SCORE. Off by default: on
+# large graphs, building the alias index takes seconds, which a graph's first
+# turn would wait for unless the graph is preloaded (see preload_graph).
+KG_FUZZY_MATCH = os.environ.get('KG_FUZZY_MATCH', '').lower() in ('1', 'true')
+KG_FUZZY_MIN_SCORE = float(os.environ.get('KG_FUZZY_MIN_SCORE', 0.85))
+
+# Shape of the neighborhood retrieved per turn: hops around the entities
+# matched in the query, the most new neighbors taken from any one entity, the
+# entity and relationship budgets, and which relationship types to follow
+# (comma-separated; all if unset). Unset limits are unbounded.
+def _optional_int(name: str, default: Optional[int] = None) -> Optional[int]:
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+KG_NUM_HOPS = int(os.environ.get('KG_NUM_HOPS', 1))
+KG_MAX_FANOUT = _optional_int('KG_MAX_FANOUT')
+KG_MAX_NODES = _optional_int('KG_MAX_NODES', 1000)
+KG_MAX_EDGES = _optional_int('KG_MAX_EDGES', 5000)
+KG_RELATIONSHIP_TYPES = (
+        set(os.environ['KG_RELATIONSHIP_TYPES'].split(','))
+        if os.environ.get('KG_RELATIONSHIP_TYPES') else None)
+
+class MemoizedNeighborhood(dict):
+    """A neighborhood from the memo, with the artifacts built from it (such as its KB context).
+
+    Shared between the turns that match the same entities: treat it as read-only.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.derived: dict[str, object] = {}
+
+
+# Neighborhoods already extracted, keyed by the entities matched in the query,
+# so turns that keep asking about the same entities skip subgraph extraction
+# (and building their context, which goes with them).
+_neighborhood_memo = ResultCache(
+        max_entries=int(os.environ.get('KG_MEMO_MAX_ENTRIES', 1024)))
+
+# The async retrieval path keeps blocking GCS I/O and CPU-bound graph work off
+# the event loop, in separate bounded pools, and caps how many retrievals a
+# worker runs at once.
+_io_executor = ThreadPoolExecutor(
+        max_workers=int(os.environ.get('KG_IO_WORKERS', 8)),
+        thread_name_prefix='kg-io')
+_cpu_executor = ThreadPoolExecutor(
+        max_workers=int(os.environ.get('KG_CPU_WORKERS', 2)),
+        thread_name_prefix='kg-cpu')
+_retrieval_semaphore = asyncio.Semaphore(
+        int(os.environ.get('KG_MAX_CONCURRENT_RETRIEVALS', 16)))
+
+
+
+
+@dataclass
+class _Prefetch:
+    task: Optional[asyncio.Task]  # while in flight; dropped once done, with the graph it loaded
+    started_at: float
+    duration_ms: Optional[float] = None  # once it has succeeded
+    generation: Optional[int] = None  # of the graph it loaded
+    used: bool = False  # by a retrieval
+
+
+# Graphs being preloaded in the background (see prefetch_graph), or preloaded
+# but not yet used by any retrieval, by graph ID. Unused ones are forgotten
+# KG_PREFETCH_TTL_SECONDS after they're done, or once the graph cache no
+# longer holds the version they loaded.
+KG_PREFETCH_TTL_SECONDS = float(os.environ.get('KG_PREFETCH_TTL_SECONDS', 600))
+_prefetches: dict[str, _Prefetch] = {}
+_prefetch_stats = {
+        'started': 0, 'joined': 0, 'completed': 0, 'failed': 0, 'expired': 0,
+        'ready': 0, 'in_flight': 0, 'missed': 0, 'saved_ms': 0.0}
+
+_meter = metrics.get_meter(__name__)
+_prefetch_outcomes = _meter.create_counter(
+        'kb.prefetch', unit='1', description='Graph prefetches, by outcome.')
+_prefetch_saved = _meter.create_histogram(
+        'kb.prefetch.saved', unit='ms',
+        description='Graph loading time a prefetch took off the first retrieval from the graph.')
+
+# When entities were last sampled for curation, per graph and oldest first, so the
+# "stale" sampling policy keeps favoring unvisited ones across graph versions.
+# Visits are forgotten once they are stale (KG_REVISIT_AFTER_SECONDS).
+_visited_lock = threading.Lock()
+_visited_entities: dict[str, dict[str, float]] = defaultdict(dict)
+
+
 @flog
 def get_relevant_neighborhood(query: str, graph_id: str) -> dict:
     """
@@ -20,110 +203,560 @@ def get_relevant_neighborhood(query: str, graph_id: str) -> dict:
     Returns:
         dict: A relevant subgraph of the knowledge graph, including a surrounding neighborhood of the relevant entities (to help patching in a replacement subgraph).
     """
-    g = _fetch_knowledge_graph(graph_id=graph_id)
+    entry = _fetch_cached_graph(graph_id=graph_id)
+    return _get_neighborhood(query=query, entry=entry)
 
-    relevant_entity_ids = _get_relevant_entities(
-            query=query, entities=g['entities'])
-    neighborhood = _get_knowledge_subgraph(
-            entity_ids=relevant_entity_ids, graph=g, num_hops=1)
 
-    return neighborhood
+async def aget_relevant_neighborhood(query: str, graph_id: str) -> dict:
+    """Async version of `get_relevant_neighborhood`, which doesn't block the event loop."""
+    prefetched = await _await_prefetch(graph_id)
+    async with _retrieval_semaphore:
+        entry = await _run_in_executor(
+                _io_executor, _fetch_cached_graph, graph_id=graph_id)
+        _record_prefetch_saved(prefetched, entry)
+        return await _run_in_executor(
+                _cpu_executor, _get_neighborhood, query=query, entry=entry)
 
 
-@flog
-def _get_relevant_entities(query: str, entities: dict) -> set[str]:
-    '''Returns a set of entity IDs from the knowledge graph found in the given query.'''
-    relevant_entity_ids = set()
+async def astream_relevant_neighborhood(query: str, graph_id: str) -> tuple[dict, asyncio.Future]:
+    """Retrieves the neighborhood of a query in two steps, so callers can go on with the first.
+
+    Returns as soon as the entities in the query are matched: their own
+    subgraph (the entities and the relationships among them), and a future of
+    their full neighborhood, as `aget_relevant_neighborhood` returns it, which
+    is extracted in the background (and memoized, even if nobody waits for it).
+    """
+    prefetched = await _await_prefetch(graph_id)
+    # The retrieval holds its slot until the full neighborhood is extracted too,
+    # so background extractions count against KG_MAX_CONCURRENT_RETRIEVALS.
+    await _retrieval_semaphore.acquire()
+    try:
+        entry = await _run_in_executor(
+                _io_executor, _fetch_cached_graph, graph_id=graph_id)
+        _record_prefetch_saved(prefetched, entry)
+        seed_neighborhood = await _run_in_executor(
+                _cpu_executor, _get_seed_neighborhood, query=query, entry=entry)
+        future = asyncio.ensure_future(_run_in_executor(
+                _cpu_executor, _extract_neighborhood,
+                entry=entry, seed_entity_ids=set(seed_neighborhood['seed_entity_ids'])))
+    except BaseException:
+        _retrieval_semaphore.release()
+        raise
+
+    def done(future: asyncio.Future) -> None:
+        _retrieval_semaphore.release()
+        if not future.cancelled() and (e := future.exception()) is not None:
+            logging.warning(f'Extracting a neighborhood of graph {graph_id} failed: {e!r}')
+    future.add_done_callback(done)
+    return seed_neighborhood, future
+
+
+async def aquery_entities(
+        graph_id: str, filters: Sequence[str] = (), sort_by: Optional[str] = None,
+        descending: bool = False, limit: int = 20, group_by: Optional[str] = None,
+        aggregates: Sequence[str] = ()) -> dict:
+    """Filters, sorts and aggregates the entities of a graph by their properties (see property_index).
+
+    Returns the `count` of entities matching all `filters`, and either the first
+    `limit` of them (`entities`, sorted by `sort_by` if given) or, with
+    `aggregates` or `group_by`, the aggregate `values`, overall or for the
+    `limit` largest groups. Raises ValueError if a filter or aggregate can't be
+    parsed or doesn't fit its property.
+    """
+    prefetched = await _await_prefetch(graph_id)
+    async with _retrieval_semaphore:
+        entry = await _run_in_executor(
+                _io_executor, _fetch_cached_graph, graph_id=graph_id)
+        _record_prefetch_saved(prefetched, entry)
+        return await _run_in_executor(
+                _cpu_executor, _query_entities, entry=entry, filters=filters, sort_by=sort_by,
+                descending=descending, limit=limit, group_by=group_by, aggregates=aggregates)
+
+
+async def adescribe_entity_properties(graph_id: str) -> dict[str, dict]:
+    """Returns the type of each property of a graph's entities, how many have it, and its range or common values."""
+    async with _retrieval_semaphore:
+        entry = await _run_in_executor(
+                _io_executor, _fetch_cached_graph, graph_id=graph_id)
+        index = await _run_in_executor(_cpu_executor, get_property_index, entry=entry)
+        return await _run_in_executor(_cpu_executor, index.describe)
+
+
+async def _run_in_executor(executor: Executor, func, /, **kwargs):
+    # Like asyncio.to_thread, but on a dedicated pool (and keeping contextvars).
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(
+            executor, functools.partial(ctx.run, func, **kwargs))
+
+
+def _get_neighborhood(query: str, entry: CachedGraph) -> dict:
+    """Returns the neighborhood of the entities matched in the query.
+
+    Neighborhoods are memoized per graph version, and so shared between
+    callers: treat them as read-only.
+    """
+    return _extract_neighborhood(entry=entry, seed_entity_ids=_match_entities(query=query, entry=entry))
 
-    for entity_id, entity_data in entities.items():
-        for entity_name in entity_data['entity_names']:
-            if entity_name.lower() in query.lower():
-                relevant_entity_ids.add(entity_id)
-                break
 
+def _match_entities(query: str, entry: CachedGraph) -> set[str]:
+    # Not through floggit: logging the arguments would serialize every entity
+    # of the graph on each turn, which on large graphs takes longer than the
+    # rest of the turn's retrieval.
+    matcher = get_entity_matcher(entry)
+    with telemetry.stage('entity_match', graph_id=entry.graph_id) as stage:
+        relevant_entity_ids = matcher.match(query)
+        stage.set('matched', len(relevant_entity_ids), span_only=True)
+        if KG_FUZZY_MATCH:
+            scores = get_alias_index(entry).match(query)
+            if fuzzy_entity_ids := scores.keys() - relevant_entity_ids:
+                stage.set('fuzzy_matched', len(fuzzy_entity_ids), span_only=True)
+                stage.set('fuzzy_min_score', min(scores[e] for e in fuzzy_entity_ids), span_only=True)
+                relevant_entity_ids |= fuzzy_entity_ids
     return relevant_entity_ids
 
 
-def _get_bucket():
-    storage_client = storage.Client()
-    bucket_name = os.environ.get("KNOWLEDGE_GRAPH_BUCKET")
-    return storage_client.get_bucket(bucket_name)
+def _extract_neighborhood(entry: CachedGraph, seed_entity_ids: set[str]) -> dict:
+    seeds = sorted(seed_entity_ids)
+    # The search limits are fixed per process, so the hop count stands in for them.
+    key = (tuple(seeds), KG_NUM_HOPS)
+    index = get_graph_index(entry)
+    with telemetry.stage('subgraph', graph_id=entry.graph_id) as stage:
+        if (neighborhood := _neighborhood_memo.get(entry.graph_id, entry.generation, key)) is not None:
+            stage.set('memo', 'hit')
+            return neighborhood
+        stage.set('memo', 'miss')
+        # Not through floggit either, which would serialize the whole graph.
+        neighborhood = MemoizedNeighborhood(index.subgraph(
+                entity_ids=seed_entity_ids, num_hops=KG_NUM_HOPS,
+                max_fanout=KG_MAX_FANOUT, max_nodes=KG_MAX_NODES, max_edges=KG_MAX_EDGES,
+                relationship_types=KG_RELATIONSHIP_TYPES))
+        stage.set('entities', len(neighborhood['entities']), span_only=True)
+        stage.set('relationships', len(neighborhood['relationships']), span_only=True)
+    # The entities matched in the query, which the context builder ranks first.
+    neighborhood['seed_entity_ids'] = seeds
 
+    return _neighborhood_memo.put(entry.graph_id, entry.generation, key, neighborhood)
 
-def _fetch_knowledge_graph(graph_id: str) -> dict:
-    """Fetches the knowledge graph from the Google Cloud Storage bucket."""
-    bucket = _get_bucket()
-    blob = bucket.blob(f"{graph_id}.json")
-    if not blob.exists():
-        return {"entities": {}, "relationships": []}
+
+def _get_seed_neighborhood(query: str, entry: CachedGraph) -> dict:
+    """Returns the entities matched in the query and the relationships among them."""
+    seed_entity_ids = _match_entities(query=query, entry=entry)
+    with telemetry.stage('seed_subgraph', graph_id=entry.graph_id):
+        seed_neighborhood = get_graph_index(entry).subgraph(
+                entity_ids=seed_entity_ids, num_hops=0, max_edges=KG_MAX_EDGES,
+                relationship_types=KG_RELATIONSHIP_TYPES)
+    seed_neighborhood['seed_entity_ids'] = sorted(seed_entity_ids)
+    return seed_neighborhood
+
+
+def _query_entities(
+        entry: CachedGraph, filters: Sequence[str], sort_by: Optional[str], descending: bool,
+        limit: int, group_by: Optional[str], aggregates: Sequence[str]) -> dict:
+    index = get_property_index(entry)
+    with telemetry.stage('property_query', graph_id=entry.graph_id) as stage:
+        parsed = [parse_filter(f) for f in filters]
+        if aggregates or group_by is not None:
+            stage.set('query', 'aggregate')
+            result = index.aggregate(
+                    parsed, [parse_aggregate(a) for a in aggregates or ['count']],
+                    group_by=group_by, limit=limit)
+        else:
+            stage.set('query', 'select')
+            count, entity_ids = index.query(parsed, sort_by=sort_by, descending=descending, limit=limit)
+            entities = entry.graph['entities']
+            result = {'count': count, 'entities': [entities[entity_id] for entity_id in entity_ids]}
+        stage.set('matched', result['count'], span_only=True)
+    return result
+
+
+@functools.cache
+def get_graph_store() -> GraphStore:
+    return GraphStore(get_backend())
+
+
+def _fetch_cached_graph(graph_id: str) -> CachedGraph:
+    """Fetches the knowledge graph, downloading it only if its blob generation has changed."""
+    with telemetry.stage('graph_fetch', graph_id=graph_id) as stage:
+        stage.set('format', KG_STORE_FORMAT)
+        if entry := _graph_cache.get_recent(graph_id, max_age=KG_CACHE_TTL_SECONDS):
+            stage.set('cache', 'recent')
+            return entry
+        if KG_STORE_FORMAT == 'delta':
+            return _fetch_versioned_graph(graph_id)
+        if KG_STORE_FORMAT == 'binary':
+            return _fetch_binary_graph(graph_id)
+        return _fetch_json_graph(graph_id)
+
+
+def _fetch_json_graph(graph_id: str) -> CachedGraph:
+    backend = get_graph_store().backend
+    name = GraphStore.legacy_name(graph_id)
+    generation = backend.stat(name)
+    if entry := _graph_cache.get(graph_id, generation=generation):
+        telemetry.annotate(cache='hit')
+        return entry
+    telemetry.annotate(cache='miss')
+
+    with _single_flight(graph_id, generation):
+        if entry := _cached_at(graph_id, generation):
+            return entry
+        # Reading at the checked generation downloads exactly the version checked above.
+        if generation is None or (content := backend.read(name, generation=generation)) is None:
+            return _graph_cache.put(
+                    graph_id, generation=None, graph=empty_graph(), size=0)
+
+        with telemetry.stage('graph_parse', graph_id=graph_id) as stage:
+            stage.set('bytes', len(content), span_only=True)
+            graph = json.loads(content)
+        return _graph_cache.put(
+                graph_id, generation=generation, graph=graph, size=len(content))
+
+
+def _fetch_versioned_graph(graph_id: str) -> CachedGraph:
+    """Fetches a snapshot-plus-delta-log graph, catching a cached copy up on new deltas only."""
+    store = get_graph_store()
+    if (entry := _graph_cache.peek(graph_id)) is not None and not store.read_deltas(graph_id, after=entry.generation):
+        if (store.snapshot_version(graph_id) or 0) <= entry.generation and (
+                cached := _graph_cache.get(graph_id, generation=entry.generation)):
+            telemetry.annotate(cache='hit')
+            return cached
+    # The latest version isn't known until the deltas are read, so loads of a
+    # graph are single-flighted whatever the version; waiting threads then
+    # find it caught up.
+    with _single_flight(graph_id, 'delta'):
+        return _load_versioned_graph(graph_id)
+
+
+def _load_versioned_graph(graph_id: str) -> CachedGraph:
+    store = get_graph_store()
+    if (entry := _graph_cache.peek(graph_id)) is not None:
+        deltas = store.read_deltas(graph_id, after=entry.generation)
+        # No new deltas may also mean they were pruned by compaction into a newer snapshot.
+        stale = not deltas and (store.snapshot_version(graph_id) or 0) > entry.generation
+        version = deltas[-1][0] if deltas else entry.generation
+        if not stale and (cached := _graph_cache.get(graph_id, generation=version)):
+            telemetry.annotate(cache='hit')
+            return cached
+        # Catch up only if no deltas are missing (e.g. pruned by compaction).
+        if deltas and deltas[0][0] == entry.generation + 1:
+            telemetry.annotate(cache='catch_up')
+            ops = [op for _, delta_ops, _ in deltas for op in delta_ops]
+            caught_up = _graph_cache.put(
+                    graph_id, generation=version, graph=apply_ops(entry.graph, ops),
+                    size=entry.size + sum(size for _, _, size in deltas))
+            _carry_over_matcher(entry, caught_up, ops)
+            return caught_up
     else:
-        content = blob.download_as_text()
-        return json.loads(content)
+        _graph_cache.get(graph_id, generation=None)  # counts the miss
+
+    telemetry.annotate(cache='miss')
+    graph, version, size = store.load(graph_id)
+    return _graph_cache.put(graph_id, generation=version, graph=graph, size=size)
+
+
+def _fetch_binary_graph(graph_id: str) -> CachedGraph:
+    """Fetches a memory-mapped binary graph, or the JSON graph if no binary one was published.
+
+    The JSON graph is also served if it was written after the binary one
+    (e.g. by curation), until `graph_binary publish` converts it again.
+    """
+    backend = get_graph_store().backend
+    name = f'{graph_id}.kbg'
+    generation = backend.stat(name)
+    if generation is None:
+        return _fetch_json_graph(graph_id)
+    if (json_generation := backend.stat(GraphStore.legacy_name(graph_id))) is not None and json_generation > generation:
+        if (graph_id, generation) not in _stale_binary_graphs:
+            _stale_binary_graphs.add((graph_id, generation))
+            logging.warning(
+                    f'{name} is older than {GraphStore.legacy_name(graph_id)}; serving the JSON graph '
+                    f'until it is published again (python -m kaybee_agent.graph_binary publish {graph_id}).')
+        telemetry.annotate(stale_binary=True)
+        return _fetch_json_graph(graph_id)
+    if entry := _graph_cache.get(graph_id, generation=generation):
+        telemetry.annotate(cache='hit')
+        return entry
+    telemetry.annotate(cache='miss')
+
+    with _single_flight(graph_id, generation):
+        if entry := _cached_at(graph_id, generation):
+            return entry
+        if isinstance(backend, FilesystemBackend):
+            path = str(backend.root / name)
+        else:
+            path = os.path.join(KG_BINARY_CACHE_DIR, f'{name}.{generation}')
+            if not os.path.exists(path):
+                os.makedirs(KG_BINARY_CACHE_DIR, exist_ok=True)
+                # A file of its own, so concurrent downloads (by other workers too)
+                # never write to the same file, and only whole files are published.
+                fd, tmp = tempfile.mkstemp(dir=KG_BINARY_CACHE_DIR, prefix=f'{name}.{generation}.tmp-')
+                os.close(fd)
+                try:
+                    backend.download(name, tmp, generation=generation)
+                    os.replace(tmp, path)
+                except BaseException:
+                    os.unlink(tmp)
+                    raise
+                # Older generations can go; workers still mapping them keep their pages.
+                for stale in os.listdir(KG_BINARY_CACHE_DIR):
+                    if stale.startswith(f'{name}.') and stale != os.path.basename(path) and '.tmp-' not in stale:
+                        os.unlink(os.path.join(KG_BINARY_CACHE_DIR, stale))
+
+        with telemetry.stage('graph_parse', graph_id=graph_id):
+            graph = BinaryGraph(path)
+        return _graph_cache.put(graph_id, generation=generation, graph=graph, size=graph.size)
+
+
+def _carry_over_matcher(old: CachedGraph, new: CachedGraph, ops: list[dict]) -> None:
+    # Update the entity matcher and alias index incrementally rather than rebuilding them for the new version.
+    # They are shared with the old version, not copied: their add, remove and match take their
+    # locks, and a reader of the old version matching a newer entity is harmless, as the old version's
+    # index leaves out entity IDs it doesn't have.
+    for name in ('matcher', 'aliases'):
+        if (matcher := old.derived.get(name)) is None:
+            continue
+        for op in ops:
+            if op['op'] == 'upsert_entity':
+                matcher.add(op['entity']['entity_id'], op['entity']['entity_names'])
+            elif op['op'] == 'delete_entity':
+                matcher.remove(op['entity_id'])
+        new.derived[name] = matcher
+
+
+def _fetch_knowledge_graph(graph_id: str) -> dict:
+    """Fetches the knowledge graph from the Google Cloud Storage bucket.
+
+    The returned dict is shared with the graph cache and must not be mutated.
+    """
+    return _fetch_cached_graph(graph_id).graph
+
+
+def preload_graph(graph_id: str) -> CachedGraph:
+    """Fetches a graph and builds its index, entity matcher and alias index, e.g. before serving."""
+    entry = _fetch_cached_graph(graph_id)
+    get_graph_index(entry)
+    get_entity_matcher(entry)
+    if KG_FUZZY_MATCH:
+        get_alias_index(entry)
+    return entry
+
+
+async def apreload_graph(graph_id: str) -> CachedGraph:
+    """Async version of `preload_graph`: fetches on the I/O pool, and builds on the CPU pool."""
+    entry = await _run_in_executor(_io_executor, _fetch_cached_graph, graph_id=graph_id)
+    await _run_in_executor(_cpu_executor, get_graph_index, entry=entry)
+    await _run_in_executor(_cpu_executor, get_entity_matcher, entry=entry)
+    if KG_FUZZY_MATCH:
+        await _run_in_executor(_cpu_executor, get_alias_index, entry=entry)
+    return entry
+
+
+def prefetch_graph(graph_id: str) -> asyncio.Task:
+    """Starts preloading a graph in the background, e.g. when a session is created for it.
+
+    Prefetches of the same graph are shared, and retrievals from it wait for
+    the one in flight rather than fetching the graph again. The first
+    retrieval after a prefetch that gets the version it loaded reports the
+    loading time it was spared in the `kb.prefetch.saved` histogram: all of it
+    if the prefetch was done, or as much as had run if it had to wait for the
+    rest (in stage `prefetch_wait`).
+    """
+    _expire_prefetches()
+    if (prefetch := _prefetches.get(graph_id)) is not None and prefetch.task is not None:
+        _count_prefetch('joined')
+        return prefetch.task
+    task = asyncio.create_task(apreload_graph(graph_id), name=f'prefetch-{graph_id}')
+    prefetch = _prefetches[graph_id] = _Prefetch(task=task, started_at=time.perf_counter())
+    _count_prefetch('started')
+
+    def done(task: asyncio.Task) -> None:
+        # Only the timings are kept, not the task, whose result holds the graph
+        # (and its indexes) outside the graph cache's limits.
+        prefetch.task = None
+        if not task.cancelled() and (e := task.exception()) is None:
+            prefetch.duration_ms = 1000 * (time.perf_counter() - prefetch.started_at)
+            prefetch.generation = task.result().generation
+            _count_prefetch('completed')
+        else:
+            _count_prefetch('failed')
+            if not task.cancelled():
+                logging.warning(f'Prefetching graph {graph_id} failed: {e!r}')
+        # Kept until a retrieval uses it, unless one already has.
+        if _prefetches.get(graph_id) is prefetch and (prefetch.used or prefetch.duration_ms is None):
+            del _prefetches[graph_id]
+    task.add_done_callback(done)
+    return task
+
+
+def _expire_prefetches() -> None:
+    now = time.perf_counter()
+    for graph_id, prefetch in list(_prefetches.items()):
+        if prefetch.task is not None:
+            continue
+        done_at = prefetch.started_at + prefetch.duration_ms / 1000
+        entry = _graph_cache.peek(graph_id)
+        if (now - done_at > KG_PREFETCH_TTL_SECONDS
+                or entry is None or entry.generation != prefetch.generation):
+            del _prefetches[graph_id]
+            _count_prefetch('expired')
+
+
+def _count_prefetch(outcome: str) -> None:
+    _prefetch_stats[outcome] += 1
+    _prefetch_outcomes.add(1, {'outcome': outcome})
 
 
-def _knowledge_graph_to_nx(g: dict) -> "nx.MultiDiGraph":
-    """Converts the knowledge graph dictionary to a NetworkX MultiDiGraph."""
-    mdg = nx.MultiDiGraph()
-    mdg.add_nodes_from((k, v) for k, v in g["entities"].items())
-    mdg.add_edges_from(
-        (
-            rel["source_entity_id"],
-            rel["target_entity_id"],
-            {"relationship": rel["relationship"]},
-        )
-        for rel in g.get("relationships", [])
-    )
-    return mdg
+async def _await_prefetch(graph_id: str) -> Optional[tuple[str, float, Optional[int]]]:
+    # Returns, to the first retrieval after a successful prefetch, whether it
+    # was `ready` or `in_flight`, the loading time that spared, and the graph
+    # version it loaded (see _record_prefetch_saved).
+    _expire_prefetches()
+    prefetch = _prefetches.get(graph_id)
+    if prefetch is None:
+        return None
+    if prefetch.task is None:
+        del _prefetches[graph_id]
+        return 'ready', prefetch.duration_ms, prefetch.generation
+    if prefetch.task.get_loop() is not asyncio.get_running_loop():
+        return None
+    first, prefetch.used = not prefetch.used, True
+    saved_ms = 1000 * (time.perf_counter() - prefetch.started_at)
+    # A failed prefetch is logged by prefetch_graph; the retrieval fetches the graph itself.
+    with telemetry.stage('prefetch_wait', graph_id=graph_id):
+        await asyncio.wait([prefetch.task])
+    if not first or prefetch.duration_ms is None:
+        return None
+    return 'in_flight', saved_ms, prefetch.generation
+
+
+def _record_prefetch_saved(prefetched: Optional[tuple[str, float, Optional[int]]], entry: CachedGraph) -> None:
+    if prefetched is None:
+        return
+    state, saved_ms, generation = prefetched
+    if entry.generation != generation:
+        # Evicted or replaced by a newer version since: the retrieval loaded it itself.
+        _count_prefetch('missed')
+        return
+    _prefetch_stats[state] += 1
+    _prefetch_stats['saved_ms'] += saved_ms
+    _prefetch_saved.record(saved_ms, {'prefetch': state})
+
+
+def graph_cache_stats() -> dict:
+    """Returns hit/miss/eviction counters and current occupancy of the graph cache."""
+    return _graph_cache.stats()
+
+
+def prefetch_stats() -> dict:
+    """Returns prefetch outcome counters, and how many first retrievals found their graph ready or in flight."""
+    _expire_prefetches()
+    return dict(_prefetch_stats)
+
+
+def graph_tenant_stats() -> dict[str, dict]:
+    """Returns each tenant's cached graphs, bytes and quota."""
+    return _graph_cache.tenant_stats()
+
+
+def neighborhood_memo_stats() -> dict:
+    """Returns hit/miss/eviction counters and current occupancy of the neighborhood memo."""
+    return _neighborhood_memo.stats()
+
+
+def get_graph_index(entry: CachedGraph) -> GraphIndex:
+    """Returns the adjacency index of a cached graph, built once per graph version."""
+    def build(g) -> GraphIndex:
+        with telemetry.stage('graph_index', graph_id=entry.graph_id):
+            return g.index() if isinstance(g, BinaryGraph) else GraphIndex(g)
+    return entry.derive('index', build)
+
+
+def get_entity_matcher(entry: CachedGraph) -> EntityMatcher:
+    """Returns the entity name matcher of a cached graph, built once per graph version."""
+    def build(g) -> EntityMatcher:
+        with telemetry.stage('entity_matcher', graph_id=entry.graph_id):
+            matcher = EntityMatcher(
+                    g.aliases if isinstance(g, BinaryGraph) else g['entities'],
+                    word_boundary=KG_MATCH_WORD_BOUNDARY)
+            # Now, so that a preloaded matcher doesn't leave them to the first turn.
+            matcher.prepare()
+            return matcher
+    return entry.derive('matcher', build)
+
+
+def get_alias_index(entry: CachedGraph) -> AliasIndex:
+    """Returns the fuzzy entity name index of a cached graph, built once per graph version."""
+    def build(g) -> AliasIndex:
+        with telemetry.stage('alias_index', graph_id=entry.graph_id):
+            return AliasIndex(
+                    g.aliases if isinstance(g, BinaryGraph) else g['entities'],
+                    min_score=KG_FUZZY_MIN_SCORE)
+    return entry.derive('aliases', build)
+
+
+def get_property_index(entry: CachedGraph) -> PropertyIndex:
+    """Returns the columnar index of the entities' properties of a cached graph, built once per graph version."""
+    def build(g) -> PropertyIndex:
+        with telemetry.stage('property_index', graph_id=entry.graph_id):
+            return PropertyIndex(g['entities'])
+    return entry.derive('properties', build)
+
+
+def get_entity_sampler(entry: CachedGraph, policy: str = 'uniform') -> EntitySampler:
+    """Returns the entity sampler of a cached graph for a sampling policy, built once per graph version."""
+    def build(g) -> EntitySampler:
+        with _visited_lock:
+            visited = dict(_visited_entities[entry.graph_id])
+        return EntitySampler(get_graph_index(entry), policy=policy, visited=visited)
+    return entry.derive(f'sampler:{policy}', build)
 
 
 @flog
-def _get_knowledge_subgraph(entity_ids: set[str], graph: dict, num_hops: Optional[int] = 2) -> dict:
-    """Extracts a subgraph from the knowledge graph centered around the given entity IDs."""
+def sample_entity(graph_id: str, policy: str = 'uniform', num_hops: int = 1) -> Optional[dict]:
+    """Picks a random entity and extracts its neighborhood, using only indexed lookups.
 
-    mdg = _knowledge_graph_to_nx(graph)
+    The neighborhood is bounded by the same KG_MAX_* budgets as retrieval, so
+    sampling a hub doesn't return most of the graph.
 
-    # Relevant entities' 1-hop neighbors.
-    nbrs1 = {
-            nbr for entity_id in entity_ids
-            for nbr in mdg.to_undirected().neighbors(entity_id)
-            if nbr not in entity_ids
-    }
+    Args:
+        graph_id (str): The ID of the knowledge graph to sample.
+        policy (str): How to weight entities; see `entity_sampler`.
+        num_hops (int): The size of the neighborhood to return.
 
-    if num_hops > 1:
-        # Relevant entities' 2-hop neighbors.
-        nbrs2 = {
-                nbr for entity_id in nbrs1
-                for nbr in mdg.to_undirected().neighbors(entity_id)
-                if nbr not in entity_ids and nbr not in nbrs1
-        }
+    Returns:
+        dict: The entity and its neighborhood, or None if the graph has no entities.
+    """
+    entry = _fetch_cached_graph(graph_id=graph_id)
+    return _sample_entity(entry=entry, policy=policy, num_hops=num_hops)
 
-        outer_nbrs = nbrs2
-    else:
-        nbrs2 = set()
-        outer_nbrs = nbrs1
 
-    # outer neighbors connected to at least one external entity
-    valence_entities = {
-            entity_id for entity_id in outer_nbrs 
-            if set(mdg.to_undirected().neighbors(entity_id)) - entity_ids - nbrs1 - nbrs2
-    }
+async def asample_entity(graph_id: str, policy: str = 'uniform', num_hops: int = 1) -> Optional[dict]:
+    """Async version of `sample_entity`, which doesn't block the event loop."""
+    async with _retrieval_semaphore:
+        entry = await _run_in_executor(
+                _io_executor, _fetch_cached_graph, graph_id=graph_id)
+        return await _run_in_executor(
+                _cpu_executor, _sample_entity, entry=entry, policy=policy, num_hops=num_hops)
 
-    subgraph = mdg.subgraph(entity_ids|nbrs1|nbrs2)
-    subgraph_json = nx.node_link_data(subgraph, edges="links")
-
-    # Reformat
-    subgraph = {
-        'entities': {
-            node['entity_id']: dict(**node, has_external_neighbor=(node['entity_id'] in valence_entities))
-            for node in subgraph_json['nodes']
-        },
-        'relationships': [
-            {
-                'source_entity_id': link['source'],
-                'target_entity_id': link['target'],
-                'relationship': link['relationship']
-            } for link in subgraph_json['links']
-        ]
-    }
 
-    return subgraph
+def _sample_entity(entry: CachedGraph, policy: str, num_hops: int) -> Optional[dict]:
+    sampler = get_entity_sampler(entry, policy=policy)
+    if (entity_id := sampler.sample()) is None:
+        return None
+
+    sampler.mark_visited(entity_id)
+    now = time.monotonic()
+    with _visited_lock:
+        visited = _visited_entities[entry.graph_id]
+        visited.pop(entity_id, None)
+        visited[entity_id] = now
+        while visited and visited[oldest := next(iter(visited))] <= now - KG_REVISIT_AFTER_SECONDS:
+            del visited[oldest]
+
+    return {
+        'entity': entry.graph['entities'][entity_id],
+        'entity_neighborhood': get_graph_index(entry).subgraph(
+            entity_ids={entity_id}, num_hops=num_hops,
+            max_fanout=KG_MAX_FANOUT, max_nodes=KG_MAX_NODES, max_edges=KG_MAX_EDGES),
+    }
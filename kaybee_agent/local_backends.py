@@ -0,0 +1,170 @@
+"""In-process stand-ins for the Cloud Logging, Cloud Storage and Cloud Trace clients.
+
+They implement only the calls this repo makes, optionally sleep `latency`
+seconds per API call to mimic a round trip, and count the calls they serve,
+so code paths that talk to Google Cloud can be run and benchmarked offline.
+"""
+import json
+import threading
+import time
+from typing import Optional
+
+from google.api_core.exceptions import PreconditionFailed
+
+
+class _CallCounter:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _call(self) -> None:
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+
+class FakeLoggingClient(_CallCounter):
+    """Stands in for `google.cloud.logging.Client`; keeps every entry in `entries`."""
+
+    def __init__(self, latency: float = 0.0, keep_entries: bool = True, measure_bytes: bool = False):
+        super().__init__(latency)
+        self.keep_entries = keep_entries
+        self.measure_bytes = measure_bytes
+        self.entries: list[dict] = []
+        self.num_entries = 0
+        self.bytes_logged = 0
+
+    def logger(self, name: str) -> "FakeLogger":
+        return FakeLogger(self, name)
+
+    def _write(self, entries: list[dict]) -> None:
+        self._call()
+        size = sum(len(json.dumps(entry, default=str)) for entry in entries) if self.measure_bytes else 0
+        with self._lock:
+            self.num_entries += len(entries)
+            self.bytes_logged += size
+            if self.keep_entries:
+                self.entries.extend(entries)
+
+
+class FakeLogger:
+    def __init__(self, client: FakeLoggingClient, name: str):
+        self.client = client
+        self.name = name
+
+    def log_struct(self, info: dict, **kw) -> None:
+        self.client._write([dict(payload=info, **kw)])
+
+    def log_text(self, text: str, **kw) -> None:
+        self.client._write([dict(payload=text, **kw)])
+
+    def batch(self) -> "FakeBatch":
+        return FakeBatch(self)
+
+
+class FakeBatch:
+    def __init__(self, logger: FakeLogger):
+        self.logger = logger
+        self.entries: list[dict] = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.commit()
+
+    def log_struct(self, info: dict, **kw) -> None:
+        self.entries.append(dict(payload=info, **kw))
+
+    def log_text(self, text: str, **kw) -> None:
+        self.entries.append(dict(payload=text, **kw))
+
+    def commit(self, **kw) -> None:
+        if self.entries:
+            self.logger.client._write(self.entries)
+        self.entries = []
+
+
+class FakeStorageClient(_CallCounter):
+    """Stands in for `google.cloud.storage.Client`; every bucket is an in-memory dict of blobs."""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__(latency)
+        self.buckets: dict[str, dict[str, "FakeBlob"]] = {}
+        self.bytes_uploaded = 0
+
+    def bucket(self, bucket_name: str) -> "FakeBucket":
+        return FakeBucket(self, bucket_name)
+
+
+class FakeBucket:
+    def __init__(self, client: FakeStorageClient, name: str):
+        self.client = client
+        self.name = name
+
+    @property
+    def _blobs(self) -> dict:
+        return self.client.buckets.setdefault(self.name, {})
+
+    def exists(self) -> bool:
+        self.client._call()
+        return True
+
+    def blob(self, blob_name: str) -> "FakeBlob":
+        return self._blobs.get(blob_name) or FakeBlob(self, blob_name)
+
+    def get_blob(self, blob_name: str) -> Optional["FakeBlob"]:
+        self.client._call()
+        return self._blobs.get(blob_name)
+
+
+class FakeBlob:
+    def __init__(self, bucket: FakeBucket, name: str):
+        self.bucket = bucket
+        self.name = name
+        self.generation: Optional[int] = None
+        self.content_type: Optional[str] = None
+        self.content_encoding: Optional[str] = None
+        self._data: Optional[bytes] = None
+
+    def exists(self) -> bool:
+        self.bucket.client._call()
+        return self._data is not None
+
+    def upload_from_string(
+            self, data, content_type: str = "application/octet-stream",
+            if_generation_match: Optional[int] = None, **kw) -> None:
+        self.bucket.client._call()
+        current = self.bucket._blobs.get(self.name)
+        if if_generation_match is not None and if_generation_match != (
+                current.generation if current else 0):
+            raise PreconditionFailed(f"{self.bucket.name}/{self.name}")
+        self._data = data.encode() if isinstance(data, str) else bytes(data)
+        self.content_type = content_type
+        self.generation = time.time_ns()
+        self.bucket.client.bytes_uploaded += len(self._data)
+        self.bucket._blobs[self.name] = self
+
+    def download_as_bytes(self, **kw) -> bytes:
+        self.bucket.client._call()
+        if self._data is None:
+            raise FileNotFoundError(f"{self.bucket.name}/{self.name}")
+        return self._data
+
+    def download_as_text(self, **kw) -> str:
+        return self.download_as_bytes().decode()
+
+
+class FakeTraceClient(_CallCounter):
+    """Stands in for the Cloud Trace `TraceServiceClient` used by `CloudTraceSpanExporter`."""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__(latency)
+        self.num_spans = 0
+
+    def batch_write_spans(self, request=None, **kw) -> None:
+        self._call()
+        self.num_spans += len(request.spans) if request is not None else 0
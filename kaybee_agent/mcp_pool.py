@@ -0,0 +1,289 @@
+"""Long-lived MCP sessions to the knowledge graph server, shared by every agent invocation in a worker.
+
+ADK's McpToolset opens a session inside whichever invocation first needs it,
+lists the server's tools on every model call, and sends every call with the
+same fixed headers. `McpSessionPool` instead keeps one session per set of
+headers (i.e. per graph), each owned by a keeper task that
+
+- opens and closes the session's transport in one task (anyio requires it),
+- pings the server every KG_MCP_PING_SECONDS, to keep the connection alive
+  and to drop it as soon as the server stops answering, and
+- closes it after KG_MCP_IDLE_SECONDS unused.
+
+At most KG_MCP_MAX_SESSIONS sessions are kept, dropping the least recently
+used. The tool list is cached for KG_MCP_TOOLS_TTL_SECONDS.
+
+`PooledMcpToolset` is the agent-facing side: its tools send each call with
+`x-graph-id` set to the session state's `graph_id`, so one worker serves
+every graph (falling back to DEFAULT_GRAPH_ID). Pools are per server URL and
+process (`get_pool`), and closed by `close_pools` at shutdown.
+
+    python -m benchmarks.mcp_pool   # against the offline stand-in server
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Optional
+
+from google.adk.agents.readonly_context import ReadonlyContext
+from google.adk.tools.base_tool import BaseTool
+from google.adk.tools.base_toolset import BaseToolset
+from google.adk.tools.mcp_tool.mcp_tool import McpTool
+from google.adk.tools.tool_context import ToolContext
+from mcp import ClientSession
+from mcp.client.streamable_http import streamablehttp_client
+from mcp.types import Tool
+from opentelemetry import metrics
+
+KG_MCP_PING_SECONDS = float(os.environ.get('KG_MCP_PING_SECONDS', 30))
+KG_MCP_IDLE_SECONDS = float(os.environ.get('KG_MCP_IDLE_SECONDS', 600))
+KG_MCP_TOOLS_TTL_SECONDS = float(os.environ.get('KG_MCP_TOOLS_TTL_SECONDS', 300))
+KG_MCP_MAX_SESSIONS = int(os.environ.get('KG_MCP_MAX_SESSIONS', 64))
+KG_MCP_TIMEOUT_SECONDS = float(os.environ.get('KG_MCP_TIMEOUT_SECONDS', 30))
+
+GRAPH_ID_HEADER = 'x-graph-id'
+
+_meter = metrics.get_meter(__name__)
+_sessions_opened = _meter.create_counter(
+        'mcp_pool.sessions_opened', unit='1', description='MCP sessions opened, by result.')
+_sessions_closed = _meter.create_counter(
+        'mcp_pool.sessions_closed', unit='1', description='MCP sessions closed, by reason.')
+_acquire_duration = _meter.create_histogram(
+        'mcp_pool.acquire.duration', unit='ms', description='Time to get a pooled MCP session, by outcome.')
+
+
+class _Connection:
+    """One pooled session and the keeper task that owns it."""
+
+    def __init__(self, key: tuple, headers: dict[str, str]):
+        self.key = key
+        self.headers = headers
+        self.ready: asyncio.Future[ClientSession] = asyncio.get_running_loop().create_future()
+        self.closing = asyncio.Event()
+        self.last_used = time.monotonic()
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def alive(self) -> bool:
+        # A lost connection is found by the keeper's pings, which drop it (and
+        # end the keeper), so this needs no look at the transport itself.
+        if self.task is None or self.task.done() or self.closing.is_set():
+            return False
+        return not self.ready.done() or self.ready.exception() is None
+
+
+class McpSessionPool:
+    """Pooled sessions to one MCP server over streamable HTTP, keyed by request headers."""
+
+    def __init__(
+            self, url: str, headers: Optional[dict[str, str]] = None,
+            timeout: float = KG_MCP_TIMEOUT_SECONDS,
+            ping_seconds: float = KG_MCP_PING_SECONDS,
+            idle_seconds: float = KG_MCP_IDLE_SECONDS,
+            tools_ttl_seconds: float = KG_MCP_TOOLS_TTL_SECONDS,
+            max_sessions: int = KG_MCP_MAX_SESSIONS):
+        self.url = url
+        self.headers = dict(headers or {})
+        self.timeout = timeout
+        self.ping_seconds = ping_seconds
+        self.idle_seconds = idle_seconds
+        self.tools_ttl_seconds = tools_ttl_seconds
+        self.max_sessions = max_sessions
+        self._connections: OrderedDict[tuple, _Connection] = OrderedDict()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tools: Optional[list[Tool]] = None
+        self._tools_fetched = 0.0
+        self._tools_lock: Optional[asyncio.Lock] = None
+        self._stats = {'hits': 0, 'opened': 0, 'failed': 0, 'dropped': 0}
+
+    def _bind_loop(self) -> None:
+        # Sessions belong to the event loop that opened them; one left over
+        # from an earlier loop (e.g. a finished asyncio.run) is unusable.
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._connections.clear()
+            self._tools_lock = asyncio.Lock()
+
+    async def session(self, headers: Optional[dict[str, str]] = None) -> ClientSession:
+        """Returns an initialized session sending `headers` (over the pool's own), opening it if needed."""
+        self._bind_loop()
+        merged = {**self.headers, **(headers or {})}
+        key = tuple(sorted(merged.items()))
+        start = time.perf_counter()
+
+        conn = self._connections.get(key)
+        if conn is not None and not conn.alive:
+            self._drop(conn, 'unhealthy')
+            conn = None
+        outcome = 'hit' if conn is not None else 'open'
+        if conn is None:
+            conn = self._open(key, merged)
+        self._connections.move_to_end(key)
+        conn.last_used = time.monotonic()
+
+        try:
+            session = await asyncio.shield(conn.ready)
+        except Exception:
+            self._drop(conn, 'failed')
+            raise
+        finally:
+            _acquire_duration.record(1000 * (time.perf_counter() - start), {'outcome': outcome})
+        if outcome == 'hit':
+            self._stats['hits'] += 1
+        return session
+
+    # Lets McpTool use the pool as its session manager.
+    async def create_session(self, headers: Optional[dict[str, str]] = None) -> ClientSession:
+        return await self.session(headers)
+
+    async def list_tools(self) -> list[Tool]:
+        """The server's tools, fetched at most once per tools_ttl_seconds."""
+        self._bind_loop()
+        async with self._tools_lock:
+            if self._tools is None or time.monotonic() - self._tools_fetched > self.tools_ttl_seconds:
+                session = await self.session()
+                self._tools = (await session.list_tools()).tools
+                self._tools_fetched = time.monotonic()
+            return self._tools
+
+    async def check_health(self) -> dict[str, bool]:
+        """Pings every pooled session now, dropping those that don't answer."""
+        self._bind_loop()
+        results = {}
+        for conn in list(self._connections.values()):
+            name = conn.headers.get(GRAPH_ID_HEADER, '')
+            try:
+                session = await asyncio.wait_for(asyncio.shield(conn.ready), self.timeout)
+                await asyncio.wait_for(session.send_ping(), self.timeout)
+                results[name] = True
+            except Exception:
+                self._drop(conn, 'unhealthy')
+                results[name] = False
+        return results
+
+    def stats(self) -> dict:
+        return {**self._stats, 'sessions': len(self._connections)}
+
+    async def close(self) -> None:
+        """Closes every pooled session, waiting for their keepers to finish."""
+        conns = list(self._connections.values())
+        if self._loop is not asyncio.get_running_loop():
+            self._connections.clear()
+            return
+        for conn in conns:
+            self._drop(conn, 'closed')
+        await asyncio.gather(*(conn.task for conn in conns), return_exceptions=True)
+
+    def _open(self, key: tuple, headers: dict[str, str]) -> _Connection:
+        while len(self._connections) >= self.max_sessions:
+            self._drop(next(iter(self._connections.values())), 'evicted')
+        conn = self._connections[key] = _Connection(key, headers)
+        conn.task = asyncio.create_task(self._keep(conn), name=f'mcp-session-{len(self._connections)}')
+        return conn
+
+    def _drop(self, conn: _Connection, reason: str) -> None:
+        if self._connections.get(conn.key) is conn:
+            del self._connections[conn.key]
+            self._stats['dropped'] += reason != 'closed'
+            _sessions_closed.add(1, {'reason': reason})
+        conn.closing.set()
+
+    async def _keep(self, conn: _Connection) -> None:
+        """Opens the session, keeps it alive until it's dropped or idle, and closes it."""
+        try:
+            async with streamablehttp_client(
+                    url=self.url, headers=conn.headers, timeout=timedelta(seconds=self.timeout)
+            ) as (read, write, _):
+                async with ClientSession(read, write) as session:
+                    await asyncio.wait_for(session.initialize(), self.timeout)
+                    self._stats['opened'] += 1
+                    _sessions_opened.add(1, {'result': 'ok'})
+                    conn.ready.set_result(session)
+                    await self._watch(conn, session)
+        except Exception as e:
+            if not conn.ready.done():
+                self._stats['failed'] += 1
+                _sessions_opened.add(1, {'result': 'error'})
+                conn.ready.set_exception(e)
+            else:
+                logging.warning(f'MCP session to {self.url} ({conn.headers.get(GRAPH_ID_HEADER)}) lost: {e!r}')
+        finally:
+            self._drop(conn, 'lost')
+            if not conn.ready.done():
+                conn.ready.set_exception(ConnectionError(f'MCP session to {self.url} closed while opening'))
+
+    async def _watch(self, conn: _Connection, session: ClientSession) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(conn.closing.wait(), self.ping_seconds)
+                return
+            except TimeoutError:
+                pass
+            if time.monotonic() - conn.last_used > self.idle_seconds:
+                self._drop(conn, 'idle')
+                return
+            try:
+                await asyncio.wait_for(session.send_ping(), self.timeout)
+            except Exception as e:
+                logging.warning(f'MCP session to {self.url} failed its health check: {e!r}')
+                self._drop(conn, 'unhealthy')
+                return
+
+
+_pools: dict[str, McpSessionPool] = {}
+
+
+def get_pool(url: Optional[str] = None) -> McpSessionPool:
+    """The process's pool for an MCP server (by default KG_MCP_SERVER)."""
+    url = url or os.environ['KG_MCP_SERVER']
+    if url not in _pools:
+        # Calls without a graph (e.g. listing tools) share the default graph's session.
+        default_graph_id = os.environ.get('DEFAULT_GRAPH_ID')
+        _pools[url] = McpSessionPool(
+                url, headers={GRAPH_ID_HEADER: default_graph_id} if default_graph_id else None)
+    return _pools[url]
+
+
+async def close_pools() -> None:
+    for pool in list(_pools.values()):
+        await pool.close()
+
+
+class PooledMcpTool(McpTool):
+    """An MCP tool that calls the server for the graph of the invocation's session."""
+
+    def __init__(self, *, mcp_tool: Tool, pool: McpSessionPool):
+        super().__init__(mcp_tool=mcp_tool, mcp_session_manager=pool)
+
+    async def _get_headers(self, tool_context: ToolContext, credential) -> Optional[dict[str, str]]:
+        headers = await super()._get_headers(tool_context, credential) or {}
+        graph_id = tool_context.state.get('graph_id') or os.environ.get('DEFAULT_GRAPH_ID')
+        if graph_id:
+            headers[GRAPH_ID_HEADER] = graph_id
+        return headers
+
+
+class PooledMcpToolset(BaseToolset):
+    """The tools of an MCP server, called through a shared `McpSessionPool`."""
+
+    def __init__(self, pool: Optional[McpSessionPool] = None, tool_filter: Optional[list[str]] = None):
+        super().__init__(tool_filter=tool_filter)
+        self.pool = pool or get_pool()
+        self._tools: list[BaseTool] = []
+        self._tools_source: Optional[list[Tool]] = None
+
+    async def get_tools(self, readonly_context: Optional[ReadonlyContext] = None) -> list[BaseTool]:
+        mcp_tools = await self.pool.list_tools()
+        if mcp_tools is not self._tools_source:
+            self._tools = [PooledMcpTool(mcp_tool=tool, pool=self.pool) for tool in mcp_tools]
+            self._tools_source = mcp_tools
+        return [tool for tool in self._tools if self._is_tool_selected(tool, readonly_context)]
+
+    async def close(self) -> None:
+        # Runners close their toolsets when they're done; the pool outlives them
+        # (see close_pools).
+        pass
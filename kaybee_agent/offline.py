@@ -0,0 +1,99 @@
+"""Offline mode: runs the agent and server without Gemini, the MCP server, GCS or Cloud Logging.
+
+With KAYBEE_OFFLINE=1:
+
+- every `gemini-*` model resolves to `OfflineLlm`, a stub that answers after
+  OFFLINE_LLM_LATENCY_MS with OFFLINE_LLM_OUTPUT_TOKENS tokens, and calls
+  `search_knowledge_graph` first on a fraction OFFLINE_LLM_TOOL_CALL_RATE of
+  turns;
+- graphs are read from the filesystem graph store (KG_STORE=fs);
+- KG_MCP_SERVER defaults to the local stand-in, `python -m kaybee_agent.offline_mcp`;
+- floggit logs to stdout, and server.py sends logs and spans to no-op sinks.
+
+Explicitly set variables (or ones in .env) take precedence over these defaults.
+A synthetic graph to serve can be generated with `python -m benchmarks.synthetic`.
+"""
+import asyncio
+import os
+import random
+from typing import AsyncGenerator
+
+from dotenv import load_dotenv
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.adk.models.registry import LLMRegistry
+from google.genai import types
+
+load_dotenv()
+
+OFFLINE = os.environ.get('KAYBEE_OFFLINE', '').lower() in ('1', 'true')
+
+if OFFLINE:
+    for name, value in {
+        'NO_GOOGLE_LOGGING': '1',
+        'KG_STORE': 'fs',
+        'KG_STORE_ROOT': '.kg_store',
+        'KG_MCP_SERVER': 'http://localhost:8081/mcp',
+        'DEFAULT_GRAPH_ID': 'offline',
+        'GOOGLE_CLOUD_PROJECT': 'offline',
+    }.items():
+        os.environ.setdefault(name, value)
+
+OFFLINE_LLM_LATENCY_MS = float(os.environ.get('OFFLINE_LLM_LATENCY_MS', 500))
+OFFLINE_LLM_OUTPUT_TOKENS = int(os.environ.get('OFFLINE_LLM_OUTPUT_TOKENS', 100))
+OFFLINE_LLM_TOOL_CALL_RATE = float(os.environ.get('OFFLINE_LLM_TOOL_CALL_RATE', 0.0))
+
+_WORDS = ['prospect', 'velocity', 'slider', 'scouting', 'report', 'upside', 'contact', 'power']
+_STREAM_CHUNK_TOKENS = 10
+
+
+class OfflineLlm(BaseLlm):
+    """A stand-in for Gemini with configurable latency and output length."""
+
+    @classmethod
+    def supported_models(cls) -> list[str]:
+        return [r'gemini-.*']
+
+    async def generate_content_async(
+            self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        self._maybe_append_user_content(llm_request)
+        # The user's own text; parts after it are added context (see agent.process_user_input).
+        parts = llm_request.contents[-1].parts or []
+        query = (parts[0].text or '') if parts else ''
+        prompt_tokens = sum(
+                len(part.text or '') for content in llm_request.contents
+                for part in content.parts or []) // 4
+
+        if (query and 'search_knowledge_graph' in llm_request.tools_dict
+                and random.random() < OFFLINE_LLM_TOOL_CALL_RATE):
+            await asyncio.sleep(OFFLINE_LLM_LATENCY_MS / 1000)
+            yield LlmResponse(content=types.Content(role='model', parts=[types.Part(
+                    function_call=types.FunctionCall(
+                        name='search_knowledge_graph', args={'query': query}))]))
+            return
+
+        words = [random.choice(_WORDS) for _ in range(OFFLINE_LLM_OUTPUT_TOKENS)]
+        usage = types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=prompt_tokens,
+                candidates_token_count=len(words),
+                total_token_count=prompt_tokens + len(words))
+        if not stream:
+            await asyncio.sleep(OFFLINE_LLM_LATENCY_MS / 1000)
+        else:
+            # Spread the latency over the chunks, as a streamed answer would.
+            chunks = range(0, len(words), _STREAM_CHUNK_TOKENS)
+            for start in chunks:
+                await asyncio.sleep(OFFLINE_LLM_LATENCY_MS / 1000 / max(len(chunks), 1))
+                yield LlmResponse(
+                        content=types.Content(role='model', parts=[types.Part(
+                            text=' '.join(words[start:start + _STREAM_CHUNK_TOKENS]) + ' ')]),
+                        partial=True)
+        yield LlmResponse(
+                content=types.Content(role='model', parts=[types.Part(text=' '.join(words))]),
+                usage_metadata=usage)
+
+
+if OFFLINE:
+    LLMRegistry.register(OfflineLlm)
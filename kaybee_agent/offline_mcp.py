@@ -0,0 +1,68 @@
+"""Local stand-in for the knowledge graph MCP server, for offline mode (see `offline`).
+
+Serves `search_knowledge_graph` from the configured graph store (through
+kg_service) and accepts `curate_knowledge` without changing the graph. Like
+the real server, it reads the graph ID from the `x-graph-id` header.
+
+    python -m kaybee_agent.offline_mcp --port 8081
+"""
+import argparse
+import logging
+import os
+import threading
+from typing import Optional
+
+from mcp.server.fastmcp import Context, FastMCP
+
+from .kg_service import get_relevant_neighborhood
+
+mcp = FastMCP('kaybee-knowledge-graph-offline')
+
+_curations_lock = threading.Lock()
+_curations: dict[str, int] = {}
+
+
+def _graph_id(ctx: Optional[Context]) -> str:
+    request = ctx.request_context.request if ctx is not None else None
+    if request is not None and (graph_id := request.headers.get('x-graph-id')):
+        return graph_id
+    return os.environ['DEFAULT_GRAPH_ID']
+
+
+@mcp.tool()
+def search_knowledge_graph(query: str, ctx: Context) -> dict:
+    """Searches the knowledge graph for entities mentioned in the query, and their neighborhood.
+
+    Args:
+        query (str): The text to find entities in.
+    """
+    return get_relevant_neighborhood(query=query, graph_id=_graph_id(ctx))
+
+
+@mcp.tool()
+def curate_knowledge(knowledge: str, ctx: Context) -> dict:
+    """Records new or updated knowledge in the knowledge graph.
+
+    Args:
+        knowledge (str): The knowledge to record.
+    """
+    graph_id = _graph_id(ctx)
+    with _curations_lock:
+        _curations[graph_id] = _curations.get(graph_id, 0) + 1
+    logging.info(f'Offline curation for graph {graph_id}: {len(knowledge)} characters')
+    return {'status': 'success'}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    args = parser.parse_args()
+
+    mcp.settings.host = args.host
+    mcp.settings.port = args.port
+    mcp.run(transport='streamable-http')
+
+
+if __name__ == '__main__':
+    main()
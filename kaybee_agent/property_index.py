@@ -0,0 +1,352 @@
+"""Columnar index of entity properties, for filtering, sorting and aggregating entities in one pass.
+
+Each property of `g['entities'][*]['properties']` becomes a NumPy column over
+all entities, with a mask of the entities that have it:
+
+    number    float64, if every value is a number or a numeric string
+    bool      if every value is true or false
+    category  int32 codes into the sorted distinct values (as strings)
+
+Filters are strings of the form "property operator value", e.g. "age < 22",
+"position == P", "position in P, SS", "city contains York" or "throws exists":
+
+    == (or =), !=, <, <=, >, >=   compare (categories case-insensitively for == and !=)
+    in, not in                    one of a comma-separated list of values
+    contains                      a category value containing the text (case-insensitively)
+    exists, missing               has the property or not
+
+Comparisons and `in` only match entities that have the property. Aggregates
+are "count", or "count", "sum", "mean", "min" or "max" of a property, e.g.
+"mean(era)".
+"""
+import json
+import re
+from collections.abc import Iterable, Mapping, Sequence
+from typing import Any, Optional
+
+import numpy as np
+
+_FILTER = re.compile(
+        r'^\s*(?P<property>.+?)'
+        r'(?:\s*(?P<symbol>==|!=|<=|>=|=|<|>)|\s+(?P<word>not\s+in|in|contains|exists|missing)(?=\s|$))'
+        r'\s*(?P<value>.*?)\s*$', re.IGNORECASE | re.DOTALL)
+_AGGREGATE = re.compile(r'^\s*(?P<function>\w+)\s*(?:\(\s*(?P<property>.*?)\s*\))?\s*$')
+_FUNCTIONS = {'count': 'count', 'sum': 'sum', 'mean': 'mean', 'avg': 'mean', 'average': 'mean', 'min': 'min', 'max': 'max'}
+_TRUE, _FALSE = ('true', 'yes', '1'), ('false', 'no', '0')
+
+
+def parse_filter(text: str) -> tuple[str, str, Any]:
+    '''Parses "property operator value" into (property, operator, value); `in` values become lists.'''
+    if not (match := _FILTER.match(text)):
+        raise ValueError(f'Cannot parse filter {text!r}: expected "property operator value", e.g. "age < 22"')
+    operator = match['symbol'] or ' '.join(match['word'].lower().split())
+    if operator == '=':
+        operator = '=='
+    value = match['value']
+    if operator in ('exists', 'missing'):
+        if value:
+            raise ValueError(f'Cannot parse filter {text!r}: {operator} takes no value')
+        return match['property'], operator, None
+    if not value:
+        raise ValueError(f'Cannot parse filter {text!r}: missing value')
+    if operator in ('in', 'not in'):
+        return match['property'], operator, [_unquote(v) for v in value.strip('[]()').split(',') if v.strip()]
+    return match['property'], operator, _unquote(value)
+
+
+def parse_aggregate(text: str) -> tuple[str, Optional[str]]:
+    '''Parses "count" or "function(property)" into (function, property or None).'''
+    if not (match := _AGGREGATE.match(text)) or match['function'].lower() not in _FUNCTIONS:
+        raise ValueError(
+                f'Cannot parse aggregate {text!r}: expected "count" or one of '
+                f'count, sum, mean, min, max of a property, e.g. "mean(era)"')
+    function = _FUNCTIONS[match['function'].lower()]
+    if function != 'count' and not match['property']:
+        raise ValueError(f'Aggregate {text!r} needs a property, e.g. "{function}(age)"')
+    return function, match['property'] or None
+
+
+def _unquote(value: str) -> str:
+    value = value.strip()
+    if len(value) > 1 and value[0] == value[-1] and value[0] in '\'"':
+        return value[1:-1]
+    return value
+
+
+class _Column:
+    def __init__(self, num_rows: int, rows: list[int], values: list):
+        self.present = np.zeros(num_rows, dtype=bool)
+        self.present[rows] = True
+        self.categories: Optional[list[str]] = None
+        self.integral = False
+        if all(type(v) is bool for v in values):
+            self.kind = 'bool'
+            self.values = np.zeros(num_rows, dtype=bool)
+            self.values[rows] = values
+            return
+        try:
+            if any(type(v) is bool for v in values):
+                raise ValueError
+            numbers = np.array(values, dtype=np.float64)
+            if numbers.ndim != 1:
+                # Lists of numbers: like any other non-scalar, stored as JSON text.
+                raise ValueError
+        except (TypeError, ValueError):
+            self.kind = 'category'
+            strings = [v if isinstance(v, str) else json.dumps(v) for v in values]
+            self.categories = sorted(set(strings))
+            code_of = {category: code for code, category in enumerate(self.categories)}
+            self.values = np.full(num_rows, -1, dtype=np.int32)
+            self.values[rows] = [code_of[s] for s in strings]
+            self._folded = np.array([c.casefold() for c in self.categories], dtype=object)
+        else:
+            self.kind = 'number'
+            self.values = np.full(num_rows, np.nan)
+            self.values[rows] = numbers
+            self.integral = bool(np.all(numbers == np.round(numbers)))
+
+    def value(self, row: int) -> Any:
+        if not self.present[row]:
+            return None
+        if self.kind == 'category':
+            return self.categories[self.values[row]]
+        return self.scalar(self.values[row])
+
+    def scalar(self, value) -> Any:
+        if self.kind == 'bool':
+            return bool(value)
+        value = float(value)
+        return int(value) if self.integral and value.is_integer() else value
+
+    def mask(self, operator: str, value: Any) -> np.ndarray:
+        if operator == 'exists':
+            return self.present
+        if operator == 'missing':
+            return ~self.present
+        if self.kind == 'category':
+            # Evaluated once per distinct value, then looked up by code.
+            matches = self._category_matches(operator, value)
+            return self.present & matches[self.values]
+        if operator in ('in', 'not in'):
+            found = np.isin(self.values, [self._operand(v) for v in value])
+            return self.present & (found if operator == 'in' else ~found)
+        if operator == 'contains':
+            raise ValueError('contains only applies to text properties')
+        operand = self._operand(value)
+        compare = {'==': np.equal, '!=': np.not_equal, '<': np.less, '<=': np.less_equal,
+                   '>': np.greater, '>=': np.greater_equal}[operator]
+        return self.present & compare(self.values, operand)
+
+    def _operand(self, value: str):
+        if self.kind == 'bool':
+            if str(value).lower() in _TRUE:
+                return True
+            if str(value).lower() in _FALSE:
+                return False
+            raise ValueError(f'Expected true or false, got {value!r}')
+        try:
+            return float(value)
+        except ValueError:
+            raise ValueError(f'Expected a number, got {value!r}') from None
+
+    def _category_matches(self, operator: str, value: Any) -> np.ndarray:
+        folded = self._folded
+        if operator in ('==', '!='):
+            matches = folded == value.casefold()
+            return matches if operator == '==' else ~matches
+        if operator in ('in', 'not in'):
+            matches = np.isin(folded, [v.casefold() for v in value])
+            return matches if operator == 'in' else ~matches
+        if operator == 'contains':
+            text = value.casefold()
+            return np.fromiter((text in c for c in folded), dtype=bool, count=len(folded))
+        categories = np.array(self.categories, dtype=object)
+        compare = {'<': np.less, '<=': np.less_equal, '>': np.greater, '>=': np.greater_equal}[operator]
+        return compare(categories, value).astype(bool)
+
+    def sort_keys(self, rows: np.ndarray, descending: bool) -> np.ndarray:
+        '''Keys that sort `rows` ascending (or descending if asked), entities without the property last.'''
+        keys = self.values[rows].astype(np.float64)
+        if descending:
+            keys = -keys
+        keys[~self.present[rows]] = np.inf
+        return keys
+
+
+class PropertyIndex:
+    """Typed NumPy columns over the properties of a knowledge graph's entities.
+
+    Filters are evaluated as vectorized masks over whole columns, top-k sorts
+    with a partial sort of the matching rows, and group-by aggregates with
+    `bincount` and `ufunc.at`, so a query costs a few passes over the columns
+    it names, whatever the number of matches.
+    """
+
+    def __init__(self, entities: Mapping):
+        '''Indexes the `properties` of `entities` (a graph's `g['entities']`).
+
+        Entities whose `properties` aren't a mapping (e.g. free text) are
+        indexed as having none.
+        '''
+        self.entity_ids: list[str] = []
+        by_property: dict[str, tuple[list[int], list]] = {}
+        for row, (entity_id, entity_data) in enumerate(entities.items()):
+            self.entity_ids.append(entity_id)
+            if not isinstance(properties := entity_data.get('properties'), Mapping):
+                continue
+            for name, value in properties.items():
+                if value is None:
+                    continue
+                rows, values = by_property.setdefault(name, ([], []))
+                rows.append(row)
+                values.append(value)
+        self.columns = {
+                name: _Column(len(self.entity_ids), rows, values)
+                for name, (rows, values) in sorted(by_property.items())}
+        self._folded_names = {name.casefold(): name for name in self.columns}
+
+    def __len__(self) -> int:
+        return len(self.entity_ids)
+
+    def describe(self) -> dict[str, dict]:
+        '''Returns each property's type and how many entities have it, and for text, its most common values.'''
+        summary = {}
+        for name, column in self.columns.items():
+            info = {'type': column.kind, 'entities': int(column.present.sum())}
+            if column.kind == 'number' and info['entities']:
+                # NaN isn't valid JSON, and would make min and max NaN too.
+                values = column.values[column.present]
+                values = values[~np.isnan(values)]
+                info['min'], info['max'] = (
+                        (column.scalar(values.min()), column.scalar(values.max())) if len(values) else (None, None))
+            elif column.kind == 'category':
+                counts = np.bincount(column.values[column.present], minlength=len(column.categories))
+                top = np.argsort(-counts, kind='stable')[:10]
+                info['values'] = {column.categories[i]: int(counts[i]) for i in top if counts[i]}
+                info['distinct_values'] = len(column.categories)
+            summary[name] = info
+        return summary
+
+    def column(self, name: str) -> _Column:
+        name = name.strip()
+        if (column := self.columns.get(name)) is None:
+            if (folded := self._folded_names.get(name.casefold())) is None:
+                raise ValueError(f'Unknown property {name!r}; entities have {", ".join(self.columns) or "none"}')
+            column = self.columns[folded]
+        return column
+
+    def filter(self, filters: Iterable[tuple[str, str, Any]]) -> np.ndarray:
+        '''Returns the mask of the entities matching all filters (as `parse_filter` returns them).'''
+        mask = np.ones(len(self), dtype=bool)
+        for name, operator, value in filters:
+            column = self.column(name)
+            try:
+                mask &= column.mask(operator, value)
+            except ValueError as e:
+                raise ValueError(f'Cannot filter {name!r} ({column.kind}) with {operator}: {e}') from None
+        return mask
+
+    def query(
+            self, filters: Iterable[tuple[str, str, Any]] = (),
+            sort_by: Optional[str] = None, descending: bool = False,
+            limit: Optional[int] = 20) -> tuple[int, list[str]]:
+        '''Returns how many entities match the filters, and the IDs of the first `limit` of them.
+
+        Sorted by the `sort_by` property (entities without it last), or in graph order.
+        '''
+        rows = np.flatnonzero(self.filter(filters))
+        count = len(rows)
+        if sort_by is not None:
+            keys = self.column(sort_by).sort_keys(rows, descending)
+            if limit is not None and limit < count:
+                top = np.argpartition(keys, limit - 1)[:limit]
+                rows, keys = rows[top], keys[top]
+            rows = rows[np.argsort(keys, kind='stable')]
+        return count, [self.entity_ids[row] for row in rows[:limit]]
+
+    def aggregate(
+            self, filters: Iterable[tuple[str, str, Any]] = (),
+            aggregates: Sequence[tuple[str, Optional[str]]] = (('count', None),),
+            group_by: Optional[str] = None, limit: Optional[int] = 20) -> dict:
+        """Aggregates the entities matching the filters, overall or per value of the `group_by` property.
+
+        Returns `{'count': n, 'values': {...}}`, or with `group_by`,
+        `{'count': n, 'groups': n_groups, 'values': [{group_by: value, ...}, ...]}`
+        with the `limit` largest groups (entities without the property form a
+        group of None). Values are keyed by aggregate, e.g. 'mean(era)', and
+        are None where no entity has the property.
+        """
+        rows = np.flatnonzero(self.filter(filters))
+        columns = [(function, name, self.column(name) if name else None) for function, name in aggregates]
+        for function, name, column in columns:
+            if function in ('sum', 'mean', 'min', 'max') and column.kind != 'number':
+                raise ValueError(f'{function} needs a numeric property, and {name!r} is {column.kind}')
+        if group_by is None:
+            groups, num_groups = np.zeros(len(rows), dtype=np.intp), 1
+        else:
+            group_column = self.column(group_by)
+            present = group_column.present[rows]
+            if group_column.kind == 'category':
+                # Already dense codes: no need to find the distinct values.
+                group_values = np.arange(len(group_column.categories))
+                inverse = group_column.values[rows][present]
+            else:
+                group_values, inverse = np.unique(group_column.values[rows][present], return_inverse=True)
+            # Entities without the property go in one more group, after the others.
+            groups = np.full(len(rows), len(group_values), dtype=np.intp)
+            groups[present] = inverse
+            num_groups = len(group_values) + 1
+
+        counts = np.bincount(groups, minlength=num_groups)
+        results = []
+        for function, name, column in columns:
+            if column is None:
+                results.append(counts.astype(np.float64))
+                continue
+            has = column.present[rows]
+            group, value = groups[has], column.values[rows][has]
+            present_counts = np.bincount(group, minlength=num_groups)
+            if function == 'count':
+                result = present_counts.astype(np.float64)
+            elif function in ('sum', 'mean'):
+                result = np.bincount(group, weights=value, minlength=num_groups)
+                if function == 'mean':
+                    with np.errstate(invalid='ignore', divide='ignore'):
+                        result /= present_counts
+            else:
+                result = np.full(num_groups, np.inf if function == 'min' else -np.inf)
+                (np.minimum if function == 'min' else np.maximum).at(result, group, value)
+            if function != 'count':
+                result[present_counts == 0] = np.nan
+            results.append(result)
+
+        def values(i: int) -> dict:
+            values = {}
+            for (function, name, column), result in zip(columns, results):
+                value = result[i]
+                if np.isnan(value):
+                    value = None
+                elif function == 'count' or (function != 'mean' and column.integral):
+                    value = int(value)
+                else:
+                    value = float(value)
+                values[f'{function}({name})' if name else function] = value
+            return values
+
+        if group_by is None:
+            return {'count': len(rows), 'values': values(0)}
+
+        def group_value(i: int) -> Any:
+            if i == len(group_values):
+                return None
+            if group_column.kind == 'category':
+                return group_column.categories[group_values[i]]
+            return group_column.scalar(group_values[i])
+
+        # The largest groups first, leaving out empty ones.
+        order = np.argsort(-counts, kind='stable')[:np.count_nonzero(counts)][:limit]
+        return {
+            'count': len(rows),
+            'groups': int(np.count_nonzero(counts)),
+            'values': [{group_by: group_value(i), **values(i)} for i in order],
+        }
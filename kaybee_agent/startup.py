@@ -0,0 +1,166 @@
+"""Server startup: environment setup, lazy construction, warm-up and a timing report.
+
+With KAYBEE_LAZY_STARTUP=1, server.py defers building the agents and the
+Cloud Logging and trace clients (and the credential lookups they make):
+agents are built by the warm-up, and the clients on first use, off the
+request path. `setup_environment` also skips looking up the default
+credentials' project when GOOGLE_CLOUD_PROJECT is set.
+
+The warm-up (KAYBEE_WARMUP, on by default) runs before the server accepts
+connections, so Cloud Run's default startup probe holds traffic until it's
+done. It builds the agents and preloads DEFAULT_GRAPH_ID (graph, index and
+entity matcher) concurrently.
+
+Every phase is timed; `report()` is logged once the server is ready, served at
+/startup, and checked against a budget by `python -m benchmarks.startup`.
+"""
+import asyncio
+import importlib
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Generic, Optional, TypeVar
+
+import google.auth
+from dotenv import load_dotenv
+
+load_dotenv()
+
+KAYBEE_LAZY_STARTUP = os.environ.get('KAYBEE_LAZY_STARTUP', '').lower() in ('1', 'true')
+KAYBEE_WARMUP = os.environ.get('KAYBEE_WARMUP', '1').lower() not in ('0', 'false')
+
+_start = time.perf_counter()
+
+
+def _process_age_ms() -> Optional[float]:
+    """Milliseconds since the process started (interpreter startup included), on Linux."""
+    try:
+        with open('/proc/self/stat') as f:
+            # Fields after the parenthesized command name; starttime is field 22.
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, IndexError, ValueError):
+        return None
+    return 1000 * (uptime - start_ticks / os.sysconf('SC_CLK_TCK'))
+
+
+_before_start_ms = _process_age_ms()
+_phases_lock = threading.Lock()
+_phases: dict[str, float] = {}
+_ready_ms: Optional[float] = None
+_warm_up_errors: dict[str, str] = {}
+
+
+def setup_environment():
+    # Load environment variables from .env file in root directory
+    load_dotenv()
+
+    # The credential lookup can take seconds (e.g. probing the metadata
+    # server); lazy startup skips it when the project is configured anyway.
+    if KAYBEE_LAZY_STARTUP and os.environ.get("GOOGLE_CLOUD_PROJECT"):
+        os.environ.setdefault("GOOGLE_CLOUD_LOCATION", "global")
+        os.environ.setdefault("GOOGLE_GENAI_USE_VERTEXAI", "True")
+        return
+
+    # Use default project from credentials if not in .env
+    try:
+        _, project_id = google.auth.default()
+        os.environ.setdefault("GOOGLE_CLOUD_PROJECT", project_id)
+        os.environ.setdefault("GOOGLE_CLOUD_LOCATION", "global")
+        os.environ.setdefault("GOOGLE_GENAI_USE_VERTEXAI", "True")
+    except google.auth.exceptions.DefaultCredentialsError:
+        # This will happen in the test environment.
+        # The tests will set the required environment variables.
+        pass
+
+
+@contextmanager
+def phase(name: str):
+    """Records how long the block takes as startup phase `name`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        with _phases_lock:
+            _phases[name] = 1000 * (time.perf_counter() - start)
+
+
+T = TypeVar('T')
+
+
+class Lazy(Generic[T]):
+    """A value built by `factory` on first `get()`, once, whichever thread asks first."""
+
+    def __init__(self, factory: Callable[[], T], name: str):
+        self._factory = factory
+        self._name = name
+        self._lock = threading.Lock()
+        self._value: Optional[T] = None
+        self._built = False
+
+    def get(self) -> T:
+        if not self._built:
+            with self._lock:
+                if not self._built:
+                    with phase(f'lazy.{self._name}'):
+                        self._value = self._factory()
+                    self._built = True
+        return self._value
+
+
+def _load_agent() -> None:
+    importlib.import_module('kaybee_agent.agent')
+
+
+def _preload_graph(graph_id: str) -> None:
+    # Imported here: kg_service reads its configuration at import time.
+    from .kg_service import preload_graph
+    preload_graph(graph_id)
+
+
+async def _warm_up_step(name: str, func: Callable, *args) -> None:
+    try:
+        with phase(f'warm_up.{name}'):
+            await asyncio.to_thread(func, *args)
+    except Exception as e:
+        # The server still works cold; the first requests pay for this step instead.
+        _warm_up_errors[name] = repr(e)
+        logging.exception(f'Warm-up step {name} failed')
+
+
+async def warm_up() -> None:
+    """Builds the agents and preloads the default graph, concurrently."""
+    steps = [_warm_up_step('agent', _load_agent)]
+    if graph_id := os.environ.get('DEFAULT_GRAPH_ID'):
+        steps.append(_warm_up_step('graph', _preload_graph, graph_id))
+    with phase('warm_up'):
+        await asyncio.gather(*steps)
+
+
+def mark_ready() -> None:
+    global _ready_ms
+    _ready_ms = 1000 * (time.perf_counter() - _start)
+
+
+def report() -> dict:
+    """Startup timings in milliseconds.
+
+    `ready_ms` is from this module's import (the first thing server.py does) to
+    the server being ready; `process_ms` adds interpreter startup, when known.
+    """
+    with _phases_lock:
+        phases = dict(_phases)
+    process_ms = None
+    if _ready_ms is not None and _before_start_ms is not None:
+        process_ms = _before_start_ms + _ready_ms
+    return {
+        'lazy': KAYBEE_LAZY_STARTUP,
+        'warm_up': KAYBEE_WARMUP,
+        'ready_ms': _ready_ms,
+        'process_ms': process_ms,
+        'phases': phases,
+        'warm_up_errors': dict(_warm_up_errors),
+    }
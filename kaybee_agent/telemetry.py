@@ -0,0 +1,132 @@
+"""Per-turn latency breakdown: OpenTelemetry spans and a duration histogram per pipeline stage.
+
+Retrieval stages (graph fetch and parse, index build, entity match, subgraph,
+context serialization) are timed with `stage()`. Model calls and tool calls
+(MCP tools, and sub-agents such as internet_search_agent) are timed by the
+agent callbacks below; ADK already traces those as `call_llm` and
+`execute_tool` spans.
+
+Every stage is recorded in the `kb.stage.duration` histogram (attributes:
+stage, plus e.g. cache, tool, agent). Stage spans go to the global tracer
+provider, i.e. the one server.py configures, where the standard
+OTEL_TRACES_SAMPLER / OTEL_TRACES_SAMPLER_ARG variables control sampling;
+unsampled spans cost next to nothing. KG_STAGE_SPANS=0 turns stage spans off
+altogether, keeping the metrics.
+"""
+import contextvars
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from typing import Any, Iterator, Optional
+
+from opentelemetry import metrics, trace
+
+KG_STAGE_SPANS = os.environ.get('KG_STAGE_SPANS', '1').lower() not in ('0', 'false')
+
+_tracer = trace.get_tracer(__name__)
+_meter = metrics.get_meter(__name__)
+_stage_duration = _meter.create_histogram(
+        'kb.stage.duration', unit='ms', description='Time spent per agent pipeline stage.')
+
+
+class Stage:
+    """A running stage; attributes set on it go to its span and, unless span-only, its metric."""
+
+    def __init__(self, span: Optional[trace.Span]):
+        self.span = span
+        self.metric_attributes: dict[str, Any] = {}
+
+    def set(self, key: str, value: Any, span_only: bool = False) -> None:
+        if not span_only:
+            self.metric_attributes[key] = value
+        if self.span is not None:
+            self.span.set_attribute(f'kb.{key}', value)
+
+
+_current_stage: contextvars.ContextVar[Optional[Stage]] = contextvars.ContextVar(
+        'kb_current_stage', default=None)
+
+
+@contextmanager
+def stage(name: str, **span_attributes) -> Iterator[Stage]:
+    """Times the block as pipeline stage `name`.
+
+    `span_attributes` (e.g. graph IDs) go on the span only, to keep metric
+    cardinality low; use `annotate` for attributes the metric should carry.
+    """
+    start = time.perf_counter()
+    current = Stage(None)
+    with _tracer.start_as_current_span(f'kb.{name}') if KG_STAGE_SPANS else nullcontext() as span:
+        if span is not None and span.is_recording():
+            current.span = span
+            for key, value in span_attributes.items():
+                span.set_attribute(f'kb.{key}', value)
+        token = _current_stage.set(current)
+        try:
+            yield current
+        finally:
+            _current_stage.reset(token)
+            _stage_duration.record(
+                    1000 * (time.perf_counter() - start),
+                    {'stage': name, **current.metric_attributes})
+
+
+def annotate(**attributes) -> None:
+    '''Sets low-cardinality attributes on the innermost running stage, if any.'''
+    if (current := _current_stage.get()) is not None:
+        for key, value in attributes.items():
+            current.set(key, value)
+
+
+# Start times of model and tool calls in flight, matched up by the after_*
+# callbacks. Calls that fail never reach them, so the oldest are dropped.
+_MAX_IN_FLIGHT = 10_000
+_in_flight_lock = threading.Lock()
+_in_flight: OrderedDict[tuple, float] = OrderedDict()
+
+
+def _started(key: tuple) -> None:
+    with _in_flight_lock:
+        _in_flight[key] = time.perf_counter()
+        while len(_in_flight) > _MAX_IN_FLIGHT:
+            _in_flight.popitem(last=False)
+
+
+def _finished(key: tuple) -> Optional[float]:
+    with _in_flight_lock:
+        start = _in_flight.pop(key, None)
+    return None if start is None else 1000 * (time.perf_counter() - start)
+
+
+def before_model_callback(callback_context, llm_request) -> None:
+    _started(('model', callback_context.invocation_id, callback_context.agent_name))
+
+
+def after_model_callback(callback_context, llm_response) -> None:
+    if llm_response.partial:
+        return None
+    key = ('model', callback_context.invocation_id, callback_context.agent_name)
+    if (elapsed_ms := _finished(key)) is not None:
+        _stage_duration.record(elapsed_ms, {'stage': 'model', 'agent': callback_context.agent_name})
+    return None
+
+
+def before_tool_callback(tool, args, tool_context) -> None:
+    _started(('tool', tool_context.function_call_id))
+
+
+def after_tool_callback(tool, args, tool_context, tool_response) -> None:
+    if (elapsed_ms := _finished(('tool', tool_context.function_call_id))) is not None:
+        _stage_duration.record(elapsed_ms, {'stage': 'tool', 'tool': tool.name, 'kind': _tool_kind(tool)})
+    return None
+
+
+def _tool_kind(tool) -> str:
+    kind = type(tool).__name__
+    if kind.endswith('McpTool'):
+        return 'mcp'
+    if kind == 'AgentTool':
+        return 'agent'
+    return 'function'
@@ -1,37 +1,145 @@
-from typing import Optional
+import asyncio
+import contextvars
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Optional
 from floggit import flog
+from google.adk.tools.tool_context import ToolContext
 from google.genai import types
-from .kg_service import get_relevant_neighborhood
+from . import telemetry
+from .context_builder import KBContext, build_context
+from .kg_service import (
+        MemoizedNeighborhood, adescribe_entity_properties, aquery_entities,
+        astream_relevant_neighborhood, get_relevant_neighborhood)
+
+# How long a turn waits for knowledge graph context before going on without it.
+KG_RETRIEVAL_TIMEOUT_SECONDS = float(os.environ.get('KG_RETRIEVAL_TIMEOUT_SECONDS', 5))
+# Once the entities in the query are matched, how much longer a turn waits for
+# their full neighborhood before going on with only the matched entities' facts.
+KG_NEIGHBORHOOD_WAIT_SECONDS = float(os.environ.get('KG_NEIGHBORHOOD_WAIT_SECONDS', 0.2))
+
+# Called with each retrieval's progress as soon as the entities in the query are
+# matched, e.g. to tell the client before the model answers (see server.py).
+retrieval_listener: contextvars.ContextVar[Optional[Callable[[dict], Awaitable[None]]]] = (
+        contextvars.ContextVar('retrieval_listener', default=None))
 
 
 @flog
 def expand_query(query: str, graph_id: str) -> Optional[types.Part]:
     """Expands a query by fetching related entities from the knowledge graph and appending them to the query."""
     nbhd = get_relevant_neighborhood(query=query, graph_id=graph_id)
+    return _format_neighborhood(nbhd=nbhd, graph_id=graph_id)
+
+
+async def aexpand_query(
+        query: str, graph_id: str,
+        timeout: Optional[float] = KG_RETRIEVAL_TIMEOUT_SECONDS) -> Optional[types.Part]:
+    """Async version of `expand_query`, retrieving as a pipeline.
+
+    If matching the entities in the query takes longer than `timeout` seconds,
+    the query is expanded without knowledge graph context. A graph download
+    already under way still completes in the background and warms the graph
+    cache for later turns.
+
+    Once they're matched, the turn waits up to KG_NEIGHBORHOOD_WAIT_SECONDS
+    for their full neighborhood; if it isn't extracted by then, the query is
+    expanded with the facts of the matched entities (and the relationships
+    among them) alone, so the model is called sooner. The neighborhood is still
+    extracted and memoized, for later turns about the same entities.
+    """
+    start = time.perf_counter()
+    try:
+        seed_nbhd, nbhd_future = await asyncio.wait_for(
+                astream_relevant_neighborhood(query=query, graph_id=graph_id),
+                timeout=timeout)
+    except TimeoutError:
+        logging.warning(
+                f"Knowledge graph retrieval for graph {graph_id} timed out "
+                f"after {timeout}s; continuing without KB context.")
+        nbhd = {'entities': {}, 'relationships': [], 'seed_entity_ids': []}
+        return _format_neighborhood(nbhd=nbhd, graph_id=graph_id)
+
+    await _report_progress({
+        'graph_id': graph_id,
+        'entities': len(seed_nbhd['seed_entity_ids']),
+        'elapsed_ms': round(1000 * (time.perf_counter() - start), 1),
+    })
+    with telemetry.stage('neighborhood_wait', graph_id=graph_id) as stage:
+        try:
+            nbhd = await asyncio.wait_for(asyncio.shield(nbhd_future), KG_NEIGHBORHOOD_WAIT_SECONDS)
+            stage.set('context', 'full')
+        except Exception:
+            # Timed out, or failed (and logged by astream_relevant_neighborhood).
+            nbhd = seed_nbhd
+            stage.set('context', 'seeds')
+    return _format_neighborhood(nbhd=nbhd, graph_id=graph_id)
+
+
+async def query_entities(
+        tool_context: ToolContext,
+        filters: Optional[list[str]] = None,
+        sort_by: Optional[str] = None,
+        limit: Optional[int] = None,
+        group_by: Optional[str] = None,
+        aggregates: Optional[list[str]] = None) -> dict:
+    """Finds, ranks or counts the knowledge graph's entities by their properties, in a single call.
+
+    Use it for questions about many entities at once, e.g. "left-handed pitchers
+    under 22 with an ERA under 3", or "the average age per position", instead of
+    searching the knowledge graph for entities one by one.
+
+    Args:
+        filters: Conditions that every entity must meet, each one "property operator value". Operators are ==, !=, <, <=, >, >=, in and not in (with comma-separated values), contains, exists and missing, e.g. ["position == P", "throws == L", "age < 22", "era < 3"].
+        sort_by: The property to sort the entities by, ascending, or descending if prefixed with "-", e.g. "-era".
+        limit: The most entities, or groups, to return: 20 unless given, and at most 100.
+        group_by: A property to group the entities by, computing the aggregates per group.
+        aggregates: What to compute over the entities (or each group) instead of listing them: "count", or the count, sum, mean, min or max of a property, e.g. ["count", "mean(era)"].
+
+    Returns:
+        dict: The `count` of entities matching all filters, and either the `entities` themselves or the aggregate `values`. If the query can't be run, an `error` and the `properties` of the graph's entities.
+    """
+    graph_id = tool_context.state['graph_id']
+    descending = bool(sort_by) and sort_by.startswith('-')
+    try:
+        return await aquery_entities(
+                graph_id=graph_id, filters=filters or (), sort_by=sort_by.lstrip('-') if sort_by else None,
+                descending=descending, limit=max(1, min(limit or 20, 100)), group_by=group_by,
+                aggregates=aggregates or ())
+    except ValueError as e:
+        return {'error': str(e), 'properties': await adescribe_entity_properties(graph_id)}
 
-    relevant_entities_str = ""
-    for entity in nbhd['entities'].values():
-        entity_name = entity['entity_names'][0]
-        entity_str = ''
-        if entity.get('properties'):
-            entity_str += f"{entity_name} has properties: {str(entity['properties'])}. "
-        if len(entity['entity_names']) > 1:
-            entity_str += f"{entity_name} is also known as: {', '.join(entity['entity_names'][1:])}"
 
-        if entity_str:
-            relevant_entities_str += entity_str + "\n"
+async def _report_progress(progress: dict) -> None:
+    if (listener := retrieval_listener.get()) is None:
+        return
+    try:
+        await listener(progress)
+    except Exception as e:
+        logging.warning(f"Reporting retrieval progress failed: {e!r}")
 
-    relationships_str = ""
-    for rel in nbhd['relationships']:
-        source_name = nbhd['entities'][rel['source_entity_id']]['entity_names'][0]
-        target_name = nbhd['entities'][rel['target_entity_id']]['entity_names'][0]
-        relationships_str += f"{source_name} {rel['relationship']} {target_name}\n"
 
-    if relevant_entities_str or relationships_str:
-        relevant_subgraph_str = f"(FYI, according to the Knowledge Graph: {relevant_entities_str}\n{relationships_str}.)"
-    else:
-        relevant_subgraph_str = ''
+def _format_neighborhood(nbhd: dict, graph_id: str) -> types.Part:
+    context = _build_context(nbhd=nbhd, graph_id=graph_id)
+    logging.info(
+            f"KB context for graph {graph_id}: {context.facts} facts, "
+            f"~{context.tokens} tokens, {context.dropped} dropped by the budget.")
+    return types.Part(text=f'{context.text}\ngraph_id={graph_id}')
 
-    expanded_query = f'{relevant_subgraph_str}\ngraph_id={graph_id}'
 
-    return types.Part(text=expanded_query)
+def _build_context(nbhd: dict, graph_id: str) -> KBContext:
+    # Contexts of memoized neighborhoods are kept with them, for later turns about
+    # the same entities; ad-hoc ones (the matched entities alone, or none after a
+    # timeout) are built every time.
+    memoized = isinstance(nbhd, MemoizedNeighborhood)
+    with telemetry.stage('serialize', graph_id=graph_id) as stage:
+        if memoized and (context := nbhd.derived.get('context')) is not None:
+            stage.set('memo', 'hit')
+            return context
+        stage.set('memo', 'miss' if memoized else 'none')
+        context = build_context(nbhd)
+        stage.set('tokens', context.tokens, span_only=True)
+        stage.set('dropped_facts', context.dropped, span_only=True)
+    if memoized:
+        nbhd.derived['context'] = context
+    return context
@@ -14,6 +14,7 @@
 
 import json
 import os
+import random
 import time
 import uuid
 
@@ -22,6 +23,31 @@ from locust import HttpUser, between, task
 
 ENDPOINT = "/run_sse"
 
+# The graph sessions query, and optionally a local copy of it (e.g. the offline
+# graph store's {graph_id}.json) to draw questions about its entities from.
+GRAPH_ID = os.environ.get("LOAD_TEST_GRAPH_ID", os.environ.get("DEFAULT_GRAPH_ID", "offline"))
+GRAPH_PATH = os.environ.get("LOAD_TEST_GRAPH")
+
+SCOUTING_QUESTIONS = [
+    "Which shortstops under 23 have the best on-base percentage this season?",
+    "How does Shohei Ohtani's fastball velocity compare to last year?",
+    "Any left-handed pitchers in AA with an ERA under 3?",
+    "Who are the top catching prospects in the Dodgers system?",
+    "Compare Juan Soto and Aaron Judge as hitters.",
+]
+
+
+def _load_questions() -> list[str]:
+    if not GRAPH_PATH:
+        return SCOUTING_QUESTIONS
+    from benchmarks.synthetic import make_queries
+
+    with open(GRAPH_PATH) as f:
+        return make_queries(json.load(f), num_queries=1000)
+
+
+QUESTIONS = _load_questions()
+
 
 class ChatStreamUser(HttpUser):
     """Simulates a user interacting with the chat stream API."""
@@ -37,7 +63,8 @@ class ChatStreamUser(HttpUser):
         # Create session first
         user_id = f"user_{uuid.uuid4()}"
         session_id = f"session_{uuid.uuid4()}"
-        session_data = {"state": {"preferred_language": "English", "visit_count": 5}}
+        # The request body is the session's initial state.
+        session_data = {"graph_id": GRAPH_ID, "preferred_language": "English", "visit_count": 5}
         requests.post(
             f"{self.client.base_url}/apps/kaybee_agent/users/{user_id}/sessions/{session_id}",
             headers=headers,
@@ -52,7 +79,7 @@ class ChatStreamUser(HttpUser):
             "session_id": session_id,
             "new_message": {
                 "role": "user",
-                "parts": [{"text": "What's the weather in San Francisco?"}],
+                "parts": [{"text": random.choice(QUESTIONS)}],
             },
             "streaming": True,
         }
@@ -69,14 +96,27 @@ class ChatStreamUser(HttpUser):
         ) as response:
             if response.status_code == 200:
                 events = []
+                event_name = None
+                first_byte = True
                 for line in response.iter_lines():
-                    if line:
-                        # SSE format is "data: {json}"
-                        line_str = line.decode("utf-8")
-                        if line_str.startswith("data: "):
-                            event_json = line_str[6:]  # Remove "data: " prefix
-                            event = json.loads(event_json)
-                            events.append(event)
+                    if first_byte:
+                        # Time to first byte: a retrieval progress event, if the
+                        # server sends them (KAYBEE_SSE_PROGRESS), else the first agent event.
+                        self._fire_timing(f"{ENDPOINT} first byte", start_time, response)
+                        first_byte = False
+                    if not line:
+                        event_name = None  # a blank line ends an SSE event
+                        continue
+                    # SSE format is "data: {json}", after "event: {name}" for named events
+                    line_str = line.decode("utf-8")
+                    if line_str.startswith("event: "):
+                        event_name = line_str[7:]
+                    elif line_str.startswith("data: ") and event_name is None:
+                        event_json = line_str[6:]  # Remove "data: " prefix
+                        event = json.loads(event_json)
+                        if not events:
+                            self._fire_timing(f"{ENDPOINT} first event", start_time, response)
+                        events.append(event)
                 end_time = time.time()
                 total_time = end_time - start_time
                 self.environment.events.request.fire(
@@ -89,3 +129,14 @@ class ChatStreamUser(HttpUser):
                 )
             else:
                 response.failure(f"Unexpected status code: {response.status_code}")
+
+    def _fire_timing(self, name: str, start_time: float, response) -> None:
+        """Reports the time from sending the message to now as a request of its own."""
+        self.environment.events.request.fire(
+            request_type="POST",
+            name=name,
+            response_time=(time.time() - start_time) * 1000,
+            response_length=0,
+            response=response,
+            context={},
+        )
@@ -12,57 +12,226 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
+import json
+import logging
 import os
+import re
+from contextlib import asynccontextmanager
 
-from dotenv import load_dotenv
-from fastapi import FastAPI
-from google.adk.cli.fast_api import get_fast_api_app
-from pydantic import BaseModel
-from typing import Literal
-from google.cloud import logging as google_cloud_logging
-from tracing import CloudTraceLoggingSpanExporter
-from opentelemetry import trace
-from opentelemetry.sdk.trace import TracerProvider, export
+# First, to start the startup clock (see kaybee_agent.startup).
+from kaybee_agent import startup
+
+with startup.phase("imports"):
+    from dotenv import load_dotenv
+    from fastapi import FastAPI, Request
+    from google.adk.cli.fast_api import get_fast_api_app
+    from fastapi import HTTPException
+    from feedback import FeedbackBuffer, FeedbackQueueFull
+    from pydantic import BaseModel, Field
+    from typing import Literal
+    from tracing import CloudTraceLoggingSpanExporter, LazySpanExporter, MeteredBatchSpanProcessor
+    from opentelemetry import trace
+    from opentelemetry.sdk.trace import TracerProvider
 
 
 # Load environment variables from .env file
 load_dotenv()
 
-from kaybee_agent.agent import setup_environment
-setup_environment()
+with startup.phase("setup_environment"):
+    startup.setup_environment()
+
+from kaybee_agent import offline
+
+if offline.OFFLINE:
+    from kaybee_agent.local_backends import FakeLoggingClient, FakeStorageClient, FakeTraceClient
+
+
+def make_logger():
+    if offline.OFFLINE:
+        logging_client = FakeLoggingClient(keep_entries=False)
+    else:
+        # Here rather than at the top: in lazy mode, the client (and its import) waits for first use.
+        from google.cloud import logging as google_cloud_logging
+
+        logging_client = google_cloud_logging.Client()
+    return logging_client.logger(__name__)
+
 
-logging_client = google_cloud_logging.Client()
-logger = logging_client.logger(__name__)
+def make_span_exporter() -> CloudTraceLoggingSpanExporter:
+    if offline.OFFLINE:
+        return CloudTraceLoggingSpanExporter(
+            project_id="offline",
+            client=FakeTraceClient(),
+            logging_client=FakeLoggingClient(keep_entries=False),
+            storage_client=FakeStorageClient(),
+        )
+    return CloudTraceLoggingSpanExporter()
+
+
+# In lazy startup mode, the logger and span exporter are built on first use,
+# and the agents by the warm-up; otherwise, all of them are built right here.
+logger = startup.Lazy(make_logger, "logger")
+with startup.phase("span_exporter"):
+    span_exporter = (
+        LazySpanExporter(make_span_exporter)
+        if startup.KAYBEE_LAZY_STARTUP
+        else make_span_exporter()
+    )
+if not startup.KAYBEE_LAZY_STARTUP:
+    with startup.phase("logger"):
+        logger.get()
+    with startup.phase("agent"):
+        import kaybee_agent.agent  # noqa: F401
+
+# Feedback is queued by the request handlers and written in batches (see feedback.py).
+feedback_buffer = FeedbackBuffer(logger.get)
 
 AGENT_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # Get session service URI from environment variables
 session_uri = os.getenv("SESSION_SERVICE_URI", None)
 
+
+def log_startup() -> None:
+    """Logs the startup timing report, and any configuration warnings."""
+    logger.get().log_struct({"startup": startup.report()}, severity="INFO")
+    if not session_uri:
+        logger.get().log_text(
+            "SESSION_SERVICE_URI not provided. Using in-memory session service instead. "
+            "All sessions will be lost when the server restarts.",
+            severity="WARNING",
+        )
+
+
+def _log_startup_done(future: asyncio.Future) -> None:
+    # Nobody awaits the report, so log its failure here rather than lose it.
+    if not future.cancelled() and (e := future.exception()) is not None:
+        logging.error("Logging the startup report failed", exc_info=e)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Runs before the server accepts connections, so it holds off traffic
+    # (and Cloud Run's startup probe) until the warm-up is done.
+    feedback_buffer.start()
+    if startup.KAYBEE_WARMUP:
+        await startup.warm_up()
+    startup.mark_ready()
+    # Off the event loop: in lazy mode, this builds the logging client.
+    asyncio.get_running_loop().run_in_executor(None, log_startup).add_done_callback(
+        _log_startup_done
+    )
+    yield
+    await feedback_buffer.close()
+    from kaybee_agent.mcp_pool import close_pools
+    await close_pools()
+
+
 # Prepare arguments for get_fast_api_app
-app_args = {"agents_dir": AGENT_DIR, "web": True}
+app_args = {"agents_dir": AGENT_DIR, "web": True, "lifespan": lifespan}
 
 # Only include session_service_uri if it's provided
 if session_uri:
     app_args["session_service_uri"] = session_uri
-else:
-    logger.log_text(
-        "SESSION_SERVICE_URI not provided. Using in-memory session service instead. "
-        "All sessions will be lost when the server restarts.",
-        severity="WARNING",
-    )
 
 provider = TracerProvider()
-processor = export.BatchSpanProcessor(CloudTraceLoggingSpanExporter())
+processor = MeteredBatchSpanProcessor(span_exporter)
 provider.add_span_processor(processor)
 trace.set_tracer_provider(provider)
 
 # Create FastAPI app with appropriate arguments
-app: FastAPI = get_fast_api_app(**app_args)
+with startup.phase("app"):
+    app: FastAPI = get_fast_api_app(**app_args)
 
 app.title = "kaybee-agent"
 app.description = "API for interacting with the Agent"
 
+# Send a "retrieval" event on /run_sse as soon as the knowledge graph entities
+# in the turn are matched, before the model starts answering.
+KAYBEE_SSE_PROGRESS = os.environ.get("KAYBEE_SSE_PROGRESS", "").lower() in ("1", "true")
+
+
+class RetrievalProgressMiddleware:
+    """Sends retrieval progress (see kaybee_agent.tools.retrieval_listener) as named SSE events.
+
+    The events are named, so clients that only handle the default "message"
+    events (e.g. EventSource's onmessage) skip them.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] != "/run_sse":
+            await self.app(scope, receive, send)
+            return
+        from kaybee_agent.tools import retrieval_listener
+
+        streaming = None  # unknown until the response starts
+        pending: list[bytes] = []
+
+        async def send_message(message):
+            nonlocal streaming
+            if message["type"] == "http.response.start":
+                content_type = dict(message.get("headers", [])).get(b"content-type", b"")
+                streaming = content_type.startswith(b"text/event-stream")
+                await send(message)
+                for body in pending if streaming else []:
+                    await send({"type": "http.response.body", "body": body, "more_body": True})
+                pending.clear()
+                return
+            await send(message)
+
+        async def listener(progress: dict) -> None:
+            body = f"event: retrieval\ndata: {json.dumps(progress)}\n\n".encode()
+            if streaming is None:
+                pending.append(body)
+            elif streaming:
+                await send({"type": "http.response.body", "body": body, "more_body": True})
+
+        token = retrieval_listener.set(listener)
+        try:
+            await self.app(scope, receive, send_message)
+        finally:
+            retrieval_listener.reset(token)
+
+
+if KAYBEE_SSE_PROGRESS:
+    app.add_middleware(RetrievalProgressMiddleware)
+
+# Start loading a new session's graph (and building its index and matchers)
+# as soon as the session is created, rather than in its first turn.
+KAYBEE_SESSION_PREFETCH = os.environ.get("KAYBEE_SESSION_PREFETCH", "1").lower() not in ("0", "false")
+SESSION_PATH = re.compile(r"/apps/[^/]+/users/[^/]+/sessions(/[^/]+)?")
+
+
+@app.middleware("http")
+async def prefetch_session_graph(request: Request, call_next):
+    """Starts loading a new session's graph in the background, so it's ready for the first turn.
+
+    Only once the session is created: requests ADK rejects start nothing.
+    """
+    graph_id = None
+    if (
+        KAYBEE_SESSION_PREFETCH
+        and request.method == "POST"
+        and (match := SESSION_PATH.fullmatch(request.url.path))
+    ):
+        try:
+            body = json.loads(await request.body() or "null") or {}
+            # With a session ID, the body is the initial state; without, a CreateSessionRequest.
+            state = body if match[1] else body.get("state") or {}
+            graph_id = state.get("graph_id")
+        except (ValueError, AttributeError):
+            pass
+    response = await call_next(request)
+    if isinstance(graph_id, str) and graph_id and 200 <= response.status_code < 300:
+        from kaybee_agent.kg_service import prefetch_graph
+
+        prefetch_graph(graph_id)
+    return response
+
 
 class Feedback(BaseModel):
     """Represents feedback for a conversation."""
@@ -75,9 +244,22 @@ class Feedback(BaseModel):
     user_id: str = ""
 
 
+class FeedbackBatch(BaseModel):
+    """Many pieces of feedback, submitted at once."""
+
+    items: list[Feedback] = Field(max_length=1000)
+
+
+def _enqueue_feedback(items: list[Feedback]) -> None:
+    try:
+        feedback_buffer.submit([feedback.model_dump() for feedback in items])
+    except FeedbackQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+
 @app.post("/feedback")
-def collect_feedback(feedback: Feedback) -> dict[str, str]:
-    """Collect and log feedback.
+async def collect_feedback(feedback: Feedback) -> dict[str, str]:
+    """Collect feedback, to be logged in the next batch.
 
     Args:
         feedback: The feedback data to log
@@ -85,10 +267,30 @@ def collect_feedback(feedback: Feedback) -> dict[str, str]:
     Returns:
         Success message
     """
-    logger.log_struct(feedback.model_dump(), severity="INFO")
+    _enqueue_feedback([feedback])
     return {"status": "success"}
 
 
+@app.post("/feedback/batch")
+async def collect_feedback_batch(batch: FeedbackBatch) -> dict[str, str | int]:
+    """Collect many pieces of feedback at once; all are accepted, or none.
+
+    Args:
+        batch: The feedback data to log
+
+    Returns:
+        Success message and the number of items accepted
+    """
+    _enqueue_feedback(batch.items)
+    return {"status": "success", "accepted": len(batch.items)}
+
+
+@app.get("/startup")
+def get_startup_report() -> dict:
+    """Startup timings, in milliseconds (see kaybee_agent.startup)."""
+    return startup.report()
+
+
 # Main execution
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,4 @@
+import os
+
+# Run without Google Cloud credentials: floggit logs to stdout, graphs come from the filesystem.
+os.environ.setdefault('KAYBEE_OFFLINE', '1')
@@ -0,0 +1,52 @@
+import pytest
+
+from kaybee_agent.alias_index import AliasIndex, normalize
+
+ENTITIES = {
+    'acuna': {'entity_names': ['Ronald Acuña Jr.']},
+    'ohtani': {'entity_names': ['Shohei Ohtani', 'Sho-Time']},
+    'rodriguez': {'entity_names': ['Julio Rodríguez']},
+    'rodriguez2': {'entity_names': ['Alex Rodriguez']},
+    'team99': {'entity_names': ['Team 99']},
+}
+
+
+@pytest.fixture(scope='module')
+def index():
+    return AliasIndex(ENTITIES)
+
+
+def test_normalize():
+    assert normalize("Ronald Acuña Jr.'s") == 'ronald acuna jr'
+    assert normalize('Sho-Time') == 'sho time'
+
+
+def test_exact_matches_score_one(index):
+    assert index.match('How is Shohei Ohtani doing?') == {'ohtani': 1.0}
+    assert index.match('any news on ronald acuna jr') == {'acuna': 1.0}
+    assert index.match('is it sho time') == {'ohtani': 1.0}
+
+
+def test_fuzzy_matches(index):
+    found = index.match('How is Shohei Otani doing?')
+    assert set(found) == {'ohtani'} and 0.85 <= found['ohtani'] < 1.0
+    # A transposition is an edit too.
+    assert set(index.match('julio rodirguez')) == {'rodriguez'}
+
+
+def test_min_score(index):
+    assert index.match('shohi otani') == {}
+    assert set(index.match('shohi otani', min_score=0.8)) == {'ohtani'}
+
+
+def test_numbers_match_exactly(index):
+    assert index.match('team 99 roster') == {'team99': 1.0}
+    assert index.match('team 98 roster') == {}
+
+
+def test_add_and_remove():
+    index = AliasIndex({'a': {'entity_names': ['Nolan Arenado']}})
+    index.add('b', ['Nolan Ryan'])
+    assert set(index.match('nolan ryan and nolan arenado')) == {'a', 'b'}
+    index.remove('a')
+    assert set(index.match('nolan ryan and nolan arenado')) == {'b'}
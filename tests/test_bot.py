@@ -0,0 +1,73 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from kaybee_agent import bot, kg_service
+from kaybee_agent.graph_cache import GraphCache
+from kaybee_agent.graph_store import FilesystemBackend, GraphStore
+
+
+@pytest.fixture
+def graph(tmp_path, monkeypatch):
+    entities = {f'e{i}': {'entity_id': f'e{i}', 'entity_names': [f'E{i}'], 'properties': {}} for i in range(20)}
+    relationships = [
+        {'source_entity_id': f'e{i}', 'relationship': 'next', 'target_entity_id': f'e{i + 1}'}
+        for i in range(19)]
+    (tmp_path / 'g.json').write_text(json.dumps({'entities': entities, 'relationships': relationships}))
+    store = GraphStore(FilesystemBackend(str(tmp_path)))
+    monkeypatch.setattr(kg_service, 'get_graph_store', lambda: store)
+    monkeypatch.setattr(kg_service, '_graph_cache', GraphCache())
+    monkeypatch.setattr(bot, 'KG_CURATION_POLICY', 'uniform')
+    return 'g'
+
+
+class StubRunner:
+    '''Runs each session as one get_random_entity call, then fails, stalls or finishes.'''
+
+    def __init__(self, outcomes):
+        self.outcomes = iter(outcomes)
+
+    async def run_async(self, user_id, session_id, new_message):
+        outcome = next(self.outcomes)
+        tool_context = SimpleNamespace(_invocation_context=SimpleNamespace(
+                user_id=user_id, session=SimpleNamespace(id=session_id)))
+        sample = await bot.get_random_entity(tool_context)
+        assert 'entity' in sample
+        yield SimpleNamespace(get_function_calls=lambda: [SimpleNamespace(name='get_random_entity')])
+        if outcome == 'fail':
+            raise RuntimeError('boom')
+        if outcome == 'stall':
+            await asyncio.sleep(10)
+        yield SimpleNamespace(get_function_calls=lambda: [SimpleNamespace(name='curate_knowledge')] * 2)
+
+
+def test_curate_summarizes_sessions_and_releases_claims(graph, monkeypatch):
+    monkeypatch.setattr(bot, 'runner', StubRunner(['ok', 'fail', 'stall', 'ok']))
+
+    summary = asyncio.run(bot.curate(graph, num_sessions=4, concurrency=4, timeout=0.5))
+
+    assert summary.graph_id == graph
+    assert (summary.sessions, summary.failed, summary.timed_out) == (4, 2, 1)
+    # Every session claimed its own entity, failed or not.
+    assert len(summary.entities_touched) == 4
+    assert summary.tool_calls == {'get_random_entity': 4, 'curate_knowledge': 4}
+    assert not bot._in_flight[graph] and not bot._session_claims
+
+
+def test_concurrent_sessions_claim_distinct_entities(graph):
+    async def claim(session_id):
+        tool_context = SimpleNamespace(_invocation_context=SimpleNamespace(
+                user_id=graph, session=SimpleNamespace(id=session_id)))
+        return await bot.get_random_entity(tool_context)
+
+    async def main():
+        return await asyncio.gather(*(claim(f's{i}') for i in range(5)))
+
+    samples = asyncio.run(main())
+    claimed = {sample['entity']['entity_id'] for sample in samples}
+    assert len(claimed) == 5 and bot._in_flight[graph] == claimed
+    for i in range(5):
+        bot._release_claims(f's{i}')
+    assert not bot._in_flight[graph]
@@ -0,0 +1,83 @@
+from kaybee_agent.context_builder import build_context, estimate_tokens
+
+
+def entity(entity_id, *names, **properties):
+    return {'entity_id': entity_id, 'entity_names': list(names) or [entity_id], 'properties': properties}
+
+
+def rel(source, relationship, target):
+    return {'source_entity_id': source, 'relationship': relationship, 'target_entity_id': target}
+
+
+def chain_neighborhood():
+    # seed -> near -> far, plus a hub attached to the far end.
+    return {
+        'entities': {
+            'hub': entity('hub', 'Hub', kind='hub'),
+            'far': entity('far', 'Far Away', kind='far'),
+            'near': entity('near', 'Near By', kind='near'),
+            'seed': entity('seed', 'Seed', 'The Seed', kind='seed'),
+        },
+        'relationships': [
+            rel('far', 'links', 'hub'),
+            rel('near', 'leads_to', 'far'),
+            rel('seed', 'knows', 'near'),
+        ],
+        'seed_entity_ids': ['seed'],
+    }
+
+
+def test_seed_facts_come_first():
+    lines = build_context(chain_neighborhood()).text.splitlines()[1:]
+    assert lines[0] == 'Seed (aka The Seed): kind=seed'
+    assert lines.index('Seed knows Near By') < lines.index('Near By leads_to Far Away')
+    assert lines.index('Near By: kind=near') < lines.index('Far Away: kind=far')
+    assert lines[-1] == 'Far Away links Hub)'
+
+
+def test_output_stays_within_the_budget():
+    nbhd = chain_neighborhood()
+    full = build_context(nbhd, token_budget=10_000)
+    assert full.dropped == 0 and full.facts == 7
+    ranking = [line.rstrip(')') for line in full.text.splitlines()[1:]]
+
+    for budget in (5, 10, 20, 40):
+        context = build_context(nbhd, token_budget=budget)
+        assert context.facts and context.dropped
+        assert context.facts + context.dropped == full.facts
+        assert f'[{context.dropped} more facts omitted' in context.text
+        # Everything but the wrapper and the omission note is bounded by the budget.
+        kept = [line.rstrip(')') for line in context.text.splitlines()[1:1 + context.facts]]
+        assert sum(estimate_tokens(line) + 1 for line in kept) <= budget
+        # Kept facts keep their rank; a smaller, lower-ranked one may fill the room a bigger one left.
+        assert kept == sorted(kept, key=ranking.index)
+        if budget >= 10:
+            assert kept[0] == 'Seed (aka The Seed): kind=seed'
+
+
+def test_nothing_fits():
+    context = build_context(chain_neighborhood(), token_budget=1)
+    assert context.text == '' and context.tokens == 0
+    assert context.facts == 0 and context.dropped == 7
+
+
+def test_non_dict_properties():
+    nbhd = {
+        'entities': {
+            'a': {'entity_id': 'a', 'entity_names': ['Ann'], 'properties': 'retired pitcher'},
+            'b': {'entity_id': 'b', 'entity_names': ['Bob'], 'properties': ['x', 1]},
+            'c': {'entity_id': 'c', 'entity_names': ['Cy'], 'properties': None},
+        },
+        'relationships': [],
+        'seed_entity_ids': ['a', 'b', 'c'],
+    }
+    lines = build_context(nbhd).text.splitlines()[1:]
+    assert lines == ['Ann: retired pitcher', "Bob: ['x', 1])"]
+
+
+def test_without_seeds_every_entity_ranks_as_a_seed():
+    nbhd = chain_neighborhood()
+    del nbhd['seed_entity_ids']
+    lines = build_context(nbhd).text.splitlines()[1:]
+    # Entities before relationships, then by degree.
+    assert [line.split(':')[0] for line in lines[:4]] == ['Far Away', 'Near By', 'Hub', 'Seed (aka The Seed)']
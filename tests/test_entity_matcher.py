@@ -0,0 +1,40 @@
+import pytest
+
+from benchmarks.synthetic import make_queries, make_scouting_graph
+from kaybee_agent.entity_matcher import EntityMatcher
+
+
+def substring_match(query: str, entities: dict) -> set[str]:
+    '''The substring scan EntityMatcher replaced, kept as the reference.'''
+    return {
+        entity_id for entity_id, entity_data in entities.items()
+        if any(name.lower() in query.lower() for name in entity_data['entity_names'])
+    }
+
+
+@pytest.fixture(scope='module')
+def graph():
+    return make_scouting_graph(200, relationships_per_player=1)
+
+
+def test_match_agrees_with_substring_scan(graph):
+    matcher = EntityMatcher(graph['entities'])
+    for query in make_queries(graph, 50):
+        assert matcher.match(query) == substring_match(query, graph['entities'])
+
+
+def test_add_and_remove():
+    matcher = EntityMatcher({'a': {'entity_names': ['Ann']}})
+    assert matcher.match('ask ann') == {'a'}
+    matcher.add('a', ['Bea'])
+    matcher.add('c', ['Ann Lee'])
+    assert matcher.match('ann lee and bea') == {'a', 'c'}
+    matcher.remove('a')
+    assert matcher.match('ann lee and bea') == {'c'}
+
+
+def test_word_boundary():
+    matcher = EntityMatcher({'a': {'entity_names': ['Al']}}, word_boundary=True)
+    assert matcher.match('ask al') == {'a'}
+    assert matcher.match('also') == set()
+    assert matcher.match('also', word_boundary=False) == {'a'}
@@ -0,0 +1,67 @@
+import random
+import time
+from collections import Counter
+
+import pytest
+
+from benchmarks.synthetic import make_graph
+from kaybee_agent import entity_sampler
+from kaybee_agent.entity_sampler import KG_REVISIT_WEIGHT, EntitySampler
+from kaybee_agent.graph_index import GraphIndex
+
+
+@pytest.fixture(scope='module')
+def index():
+    return GraphIndex(make_graph(num_entities=50, num_relationships=200))
+
+
+def test_uniform_total(index):
+    assert EntitySampler(index).total() == pytest.approx(index.num_entities)
+
+
+def test_low_degree_weights(index):
+    sampler = EntitySampler(index, 'low_degree')
+    assert sampler.total() == pytest.approx(sum(1 / (1 + index.degree(i)) for i in range(index.num_entities)))
+
+
+def test_stale_reweights_visited(index):
+    first, second = index.entity_ids[:2]
+    sampler = EntitySampler(index, 'stale', visited={first: time.monotonic()})
+    n = index.num_entities
+    assert sampler.total() == pytest.approx(n - 1 + KG_REVISIT_WEIGHT)
+    sampler.mark_visited(second)
+    assert sampler.total() == pytest.approx(n - 2 + 2 * KG_REVISIT_WEIGHT)
+    # Not under the "stale" policy: weights stay.
+    uniform = EntitySampler(index)
+    uniform.mark_visited(first)
+    assert uniform.total() == pytest.approx(n)
+
+
+def test_samples_follow_weights(index):
+    sampler = EntitySampler(index, 'stale', visited=dict.fromkeys(index.entity_ids[1:], time.monotonic()))
+    counts = Counter(sampler.sample(random.Random(i)) for i in range(2000))
+    unvisited_share = 1 / (1 + (index.num_entities - 1) * KG_REVISIT_WEIGHT)
+    assert counts[index.entity_ids[0]] / 2000 == pytest.approx(unvisited_share, abs=0.05)
+
+
+def test_visits_expire(index, monkeypatch):
+    monkeypatch.setattr(entity_sampler, 'KG_REVISIT_AFTER_SECONDS', 60)
+    first, second = index.entity_ids[:2]
+    now = time.monotonic()
+    sampler = EntitySampler(index, 'stale', visited={first: now - 120, second: now - 30})
+    n = index.num_entities
+    # The first visit is already stale.
+    assert sampler.total() == pytest.approx(n - 1 + KG_REVISIT_WEIGHT)
+
+    monkeypatch.setattr(entity_sampler, 'KG_REVISIT_AFTER_SECONDS', 10)
+    sampler.sample()
+    assert sampler.total() == pytest.approx(n)
+
+
+def test_unknown_policy(index):
+    with pytest.raises(ValueError):
+        EntitySampler(index, 'stale+popular')
+
+
+def test_empty_graph():
+    assert EntitySampler(GraphIndex({'entities': {}, 'relationships': []})).sample() is None
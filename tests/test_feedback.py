@@ -0,0 +1,146 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from kaybee_agent.local_backends import FakeLoggingClient
+from feedback import FeedbackBuffer
+
+
+class FlakyLogger:
+    """A logger whose writes fail while `down` is set."""
+
+    def __init__(self, latency: float = 0.0):
+        self.client = FakeLoggingClient(latency=latency)
+        self.logger = self.client.logger('feedback')
+        self.down = False
+
+    def batch(self):
+        if self.down:
+            raise ConnectionError('Cloud Logging unavailable')
+        return self.logger.batch()
+
+    @property
+    def records(self) -> list[dict]:
+        return [entry['payload'] for entry in self.client.entries]
+
+
+def make_buffer(tmp_path, logger, **kwargs) -> FeedbackBuffer:
+    return FeedbackBuffer(
+            lambda: logger, batch_size=2, flush_seconds=0.01, spill_dir=str(tmp_path),
+            retry_seconds=0, **kwargs)
+
+
+def test_records_are_written_in_batches(tmp_path):
+    logger = FlakyLogger()
+
+    async def run():
+        buffer = make_buffer(tmp_path, logger)
+        buffer.start()
+        buffer.submit([{'score': i} for i in range(5)])
+        await buffer.close()
+        return buffer
+
+    buffer = asyncio.run(run())
+    assert logger.records == [{'score': i} for i in range(5)]
+    assert logger.client.calls == 3 and buffer.stats['written'] == 5
+
+
+def test_failed_writes_are_spilled_and_replayed(tmp_path):
+    logger = FlakyLogger()
+
+    async def run():
+        buffer = make_buffer(tmp_path, logger)
+        buffer.start()
+        logger.down = True
+        buffer.submit([{'score': 1}, {'score': 2}])
+        while not buffer.stats['spilled']:
+            await asyncio.sleep(0.01)
+        logger.down = False
+        buffer.submit([{'score': 3}, {'score': 4}])
+        await buffer.close()
+        return buffer
+
+    buffer = asyncio.run(run())
+    assert sorted(r['score'] for r in logger.records) == [1, 2, 3, 4]
+    assert buffer.stats['replayed'] == 2
+    assert not list(tmp_path.glob('*.jsonl'))
+
+
+def test_corrupt_spill_files_are_quarantined(tmp_path):
+    logger = FlakyLogger()
+    (tmp_path / '00000000000000000001-bad.jsonl').write_text('{"score": 1}\n{not json\n')
+    (tmp_path / '00000000000000000002-good.jsonl').write_text('{"score": 2}\n')
+
+    async def run():
+        buffer = make_buffer(tmp_path, logger)
+        buffer.start()
+        buffer.submit([{'score': 3}])
+        await buffer.close()
+        return buffer
+
+    buffer = asyncio.run(run())
+    assert sorted(r['score'] for r in logger.records) == [2, 3]
+    assert buffer.stats['quarantined'] == 1
+    assert [p.name for p in tmp_path.iterdir()] == ['00000000000000000001-bad.bad']
+
+
+def test_flusher_survives_replay_errors(tmp_path, monkeypatch):
+    logger = FlakyLogger()
+
+    def fail():
+        raise PermissionError('spill directory unreadable')
+
+    async def run():
+        buffer = make_buffer(tmp_path, logger)
+        monkeypatch.setattr(buffer, '_replay', fail)
+        buffer.start()
+        buffer.submit([{'score': 1}, {'score': 2}])
+        await asyncio.sleep(0.1)
+        assert not buffer._task.done()
+        buffer.submit([{'score': 3}])
+        await buffer.close()
+        return buffer
+
+    buffer = asyncio.run(run())
+    assert [r['score'] for r in logger.records] == [1, 2, 3]
+    assert buffer.stats['written'] == 3
+
+
+def test_workers_sharing_a_spill_dir_replay_each_file_once(tmp_path):
+    logger = FlakyLogger(latency=0.01)
+    for i in range(20):
+        (tmp_path / f'{i:020d}-spill.jsonl').write_text(f'{{"score": {i}}}\n')
+    buffers = [make_buffer(tmp_path, logger) for _ in range(4)]
+
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(lambda buffer: buffer._replay(), buffers))
+    assert sorted(r['score'] for r in logger.records) == list(range(20))
+    assert sum(buffer.stats['replayed'] for buffer in buffers) == 20
+    assert not list(tmp_path.iterdir())
+
+
+def test_claims_of_dead_workers_are_released_at_startup(tmp_path):
+    logger = FlakyLogger()
+    # No process has this ID (it is above the kernel's limit), while the parent is alive.
+    (tmp_path / '00000000000000000001-dead.999999999.replaying').write_text('{"score": 1}\n')
+    alive = tmp_path / f'00000000000000000002-alive.{os.getppid()}.replaying'
+    alive.write_text('{"score": 2}\n')
+
+    async def run():
+        buffer = make_buffer(tmp_path, logger)
+        buffer.start()
+        await buffer.close()
+
+    asyncio.run(run())
+    assert [r['score'] for r in logger.records] == [1]
+    assert list(tmp_path.iterdir()) == [alive]
+
+
+def test_failed_replays_release_their_claims(tmp_path):
+    logger = FlakyLogger()
+    spilled = tmp_path / '00000000000000000001-spill.jsonl'
+    spilled.write_text('{"score": 1}\n')
+    logger.down = True
+
+    make_buffer(tmp_path, logger)._replay()
+    assert list(tmp_path.iterdir()) == [spilled]
@@ -0,0 +1,67 @@
+import json
+import os
+import random
+
+import pytest
+
+from benchmarks.synthetic import make_scouting_graph
+from kaybee_agent import kg_service
+from kaybee_agent.graph_binary import BinaryGraph, write_binary_graph
+from kaybee_agent.graph_cache import GraphCache
+from kaybee_agent.graph_index import GraphIndex
+from kaybee_agent.graph_store import FilesystemBackend, GraphStore
+
+
+@pytest.fixture(scope='module')
+def graph():
+    return make_scouting_graph(200, relationships_per_player=2)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch, graph):
+    (tmp_path / 'g.json').write_text(json.dumps(graph))
+    store = GraphStore(FilesystemBackend(str(tmp_path)))
+    monkeypatch.setattr(kg_service, 'get_graph_store', lambda: store)
+    monkeypatch.setattr(kg_service, '_graph_cache', GraphCache())
+    return store
+
+
+def test_round_trip(graph, tmp_path):
+    path = str(tmp_path / 'g.kbg')
+    write_binary_graph(graph, path)
+    g = BinaryGraph(path)
+    assert dict(g['entities'].items()) == graph['entities']
+    assert list(g['relationships']) == graph['relationships']
+    assert {e: d['entity_names'] for e, d in g.aliases.items()} == {
+        e: d['entity_names'] for e, d in graph['entities'].items()}
+    assert not [name for name in os.listdir(tmp_path) if '.tmp-' in name]
+
+
+def test_binary_index_matches_json_index(graph, tmp_path):
+    path = str(tmp_path / 'g.kbg')
+    write_binary_graph(graph, path)
+    binary, index = BinaryGraph(path).index(), GraphIndex(graph)
+    rng = random.Random(0)
+    for _ in range(10):
+        entity_ids = set(rng.sample(list(graph['entities']), 3))
+        assert binary.subgraph(entity_ids, num_hops=2) == index.subgraph(entity_ids, num_hops=2)
+
+
+def test_binary_fetch_serves_the_published_graph(store, tmp_path, graph):
+    write_binary_graph(graph, str(tmp_path / 'g.kbg'))
+    entry = kg_service._fetch_binary_graph('g')
+    assert isinstance(entry.graph, BinaryGraph)
+    assert len(entry.graph['entities']) == len(graph['entities'])
+
+
+def test_binary_fetch_falls_back_to_a_newer_json(store, tmp_path, graph):
+    write_binary_graph(graph, str(tmp_path / 'g.kbg'))
+    kbg_mtime = (tmp_path / 'g.kbg').stat().st_mtime_ns
+    # Curation rewrites the JSON graph after the binary one was published.
+    updated = {**graph, 'entities': {**graph['entities'], 'new': {'entity_id': 'new', 'entity_names': ['New']}}}
+    (tmp_path / 'g.json').write_text(json.dumps(updated))
+    os.utime(tmp_path / 'g.json', ns=(kbg_mtime + 10**9, kbg_mtime + 10**9))
+
+    entry = kg_service._fetch_binary_graph('g')
+    assert not isinstance(entry.graph, BinaryGraph)
+    assert 'new' in entry.graph['entities']
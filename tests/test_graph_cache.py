@@ -0,0 +1,94 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from kaybee_agent.graph_cache import GraphCache, ResultCache
+
+
+def test_graph_cache_generations():
+    cache = GraphCache()
+    entry = cache.put('g', 1, {'entities': {}}, size=10)
+    assert cache.get('g', 1) is entry
+    assert cache.get('g', 2) is None
+    assert cache.peek('g') is entry
+    assert entry.derive('n', lambda graph: object()) is entry.derive('n', lambda graph: object())
+    cache.invalidate('g')
+    assert cache.peek('g') is None
+
+
+def test_graph_cache_max_entries():
+    cache = GraphCache(max_entries=2)
+    for graph_id in 'abc':
+        cache.put(graph_id, 1, {}, size=1)
+    assert cache.stats()['entries'] == 2 and cache.peek('c') is not None
+
+
+def test_graph_cache_keeps_an_oversized_entry():
+    cache = GraphCache(max_bytes=10)
+    cache.put('g', 1, {}, size=100)
+    assert cache.peek('g') is not None
+
+
+def test_concurrent_first_uses_build_once():
+    entry = GraphCache().put('g', 1, {}, size=1)
+    builds = []
+
+    def build(graph):
+        builds.append(graph)
+        time.sleep(0.05)
+        return object()
+
+    with ThreadPoolExecutor(8) as pool:
+        values = list(pool.map(lambda _: entry.derive('index', build), range(8)))
+    assert len(builds) == 1 and all(v is values[0] for v in values)
+
+
+def test_result_cache_versions():
+    cache = ResultCache()
+    cache.put('g', 1, 'k', 'v1')
+    assert cache.get('g', 1, 'k') == 'v1'
+    assert cache.get('g', 2, 'k') is None
+    cache.put('g', 2, 'other', 'v2')
+    # Storing a result of version 2 drops those of version 1.
+    assert cache.get('g', 1, 'k') is None
+    assert cache.stats()['invalidations'] == 1
+
+
+def test_result_cache_lru():
+    cache = ResultCache(max_entries=2)
+    cache.put('g', 1, 'a', 1)
+    cache.put('g', 1, 'b', 2)
+    cache.get('g', 1, 'a')
+    cache.put('g', 1, 'c', 3)
+    assert cache.get('g', 1, 'b') is None
+    assert cache.get('g', 1, 'a') == 1 and cache.get('g', 1, 'c') == 3
+    assert cache.stats()['evictions'] == 1
+
+
+def test_graph_cache_evicts_rarely_used_large_graphs_first():
+    cache = GraphCache(max_entries=10, max_bytes=100)
+    cache.put('small', 1, {}, size=10)
+    cache.put('large', 1, {}, size=60)
+    for _ in range(3):
+        cache.get('small', 1)
+    cache.put('new', 1, {}, size=40)
+    assert cache.peek('large') is None
+    assert cache.peek('small') is not None and cache.peek('new') is not None
+    assert cache.stats()['bytes'] == 50
+
+
+def test_graph_cache_tenant_quotas():
+    cache = GraphCache(
+            max_bytes=1000, tenant_max_bytes=50, tenant_quotas={'big': 200},
+            tenant_of=lambda graph_id: graph_id.split('/')[0])
+    cache.put('other/a', 1, {}, size=40)
+    for i in range(5):
+        cache.put(f'small/{i}', 1, {}, size=20)
+    for i in range(5):
+        cache.put(f'big/{i}', 1, {}, size=60)
+
+    tenants = cache.tenant_stats()
+    assert tenants['small']['bytes'] <= 50 and tenants['small']['quota'] == 50
+    assert tenants['big']['bytes'] <= 200 and tenants['big']['quota'] == 200
+    # Over-quota tenants evict their own graphs, not other tenants'.
+    assert cache.peek('other/a') is not None
+    assert cache.stats()['quota_evictions'] == cache.stats()['evictions'] > 0
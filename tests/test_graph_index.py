@@ -0,0 +1,51 @@
+import random
+
+import pytest
+
+from benchmarks.graph_index import _same, networkx_subgraph
+from benchmarks.synthetic import make_graph
+from kaybee_agent.graph_index import GraphIndex
+
+
+@pytest.fixture(scope='module')
+def graph():
+    return make_graph(num_entities=300, num_relationships=1200)
+
+
+@pytest.mark.parametrize('num_hops', [1, 2])
+def test_subgraph_matches_networkx(graph, num_hops):
+    index = GraphIndex(graph)
+    rng = random.Random(0)
+    for _ in range(10):
+        entity_ids = set(rng.sample(list(graph['entities']), 3))
+        expected = networkx_subgraph(entity_ids=entity_ids, graph=graph, num_hops=num_hops)
+        assert _same(index.subgraph(entity_ids=entity_ids, num_hops=num_hops), expected)
+
+
+def test_subgraph_ignores_unknown_entities(graph):
+    index = GraphIndex(graph)
+    assert index.subgraph(entity_ids={'nobody'}) == {'entities': {}, 'relationships': []}
+
+
+def test_subgraph_budgets(graph):
+    index = GraphIndex(graph)
+    hub = max(range(index.num_entities), key=index.degree)
+    seeds = {index.entity_ids[hub]}
+
+    result = index.subgraph(entity_ids=seeds, num_hops=2, max_nodes=10, max_edges=15)
+    assert len(result['entities']) <= 10
+    assert len(result['relationships']) <= 15
+
+    result = index.subgraph(entity_ids=seeds, num_hops=1, max_fanout=5)
+    assert len(result['entities']) <= 6
+    # The hub kept some neighbors out, so it still has neighbors outside the subgraph.
+    assert result['entities'][index.entity_ids[hub]]['has_external_neighbor']
+
+
+def test_subgraph_relationship_types(graph):
+    index = GraphIndex(graph)
+    kind = graph['relationships'][0]['relationship']
+    seeds = {graph['relationships'][0]['source_entity_id']}
+    result = index.subgraph(entity_ids=seeds, num_hops=2, relationship_types=[kind])
+    assert result['relationships']
+    assert {r['relationship'] for r in result['relationships']} == {kind}
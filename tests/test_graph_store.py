@@ -0,0 +1,76 @@
+import pytest
+
+from kaybee_agent.graph_store import FilesystemBackend, GraphStore, apply_ops, empty_graph
+
+
+def entity(entity_id: str, *names: str) -> dict:
+    return {'entity_id': entity_id, 'entity_names': list(names) or [entity_id], 'properties': {}}
+
+
+def relationship(source: str, target: str, kind: str = 'knows') -> dict:
+    return {'source_entity_id': source, 'target_entity_id': target, 'relationship': kind}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return GraphStore(FilesystemBackend(str(tmp_path)))
+
+
+def test_apply_ops():
+    graph = empty_graph()
+    result = apply_ops(graph, [
+        {'op': 'upsert_entity', 'entity': entity('a')},
+        {'op': 'upsert_entity', 'entity': entity('b')},
+        {'op': 'upsert_entity', 'entity': entity('c')},
+        {'op': 'upsert_relationship', 'relationship': relationship('a', 'b')},
+        {'op': 'upsert_relationship', 'relationship': relationship('a', 'b')},
+        {'op': 'upsert_relationship', 'relationship': relationship('b', 'c')},
+        {'op': 'upsert_relationship', 'relationship': relationship('c', 'a')},
+        {'op': 'delete_relationship', 'relationship': relationship('b', 'c')},
+        {'op': 'delete_entity', 'entity_id': 'c'},
+    ])
+    assert graph == empty_graph()
+    assert set(result['entities']) == {'a', 'b'}
+    assert result['relationships'] == [relationship('a', 'b')]
+
+
+def test_apply_ops_rejects_unknown_ops():
+    with pytest.raises(ValueError):
+        apply_ops(empty_graph(), [{'op': 'rename_entity'}])
+
+
+def test_append_and_read_deltas(store):
+    assert store.load('g') == (empty_graph(), 0, 0)
+    v1 = store.append('g', [{'op': 'upsert_entity', 'entity': entity('a')}])
+    v2 = store.append('g', [{'op': 'upsert_entity', 'entity': entity('b')}])
+    assert (v1, v2) == (1, 2)
+    assert [seq for seq, _, _ in store.read_deltas('g', after=0)] == [1, 2]
+    assert [seq for seq, _, _ in store.read_deltas('g', after=1)] == [2]
+    assert store.read_deltas('g', after=2) == []
+
+    graph, version, _ = store.load('g')
+    assert set(graph['entities']) == {'a', 'b'} and version == 2 == store.latest_version('g')
+
+
+@pytest.mark.parametrize('prune', [False, True])
+def test_compact(store, prune):
+    for entity_id in 'abc':
+        store.append('g', [{'op': 'upsert_entity', 'entity': entity(entity_id)}])
+    expected = store.load('g')[0]
+
+    assert store.compact('g', prune=prune) == 3
+    assert store.load('g')[:2] == (expected, 3)
+    assert store.latest_version('g') == 3
+    # Pruning drops the deltas the snapshot covers.
+    assert len(store.read_deltas('g', after=0)) == (0 if prune else 3)
+
+    store.append('g', [{'op': 'delete_entity', 'entity_id': 'a'}])
+    graph, version, _ = store.load('g')
+    assert set(graph['entities']) == {'b', 'c'} and version == 4
+
+
+def test_migrate(store, tmp_path):
+    (tmp_path / 'g.json').write_text('{"entities": {"a": {"entity_id": "a"}}, "relationships": []}')
+    assert store.migrate('g') == 0
+    store.append('g', [{'op': 'upsert_entity', 'entity': entity('b')}])
+    assert set(store.load('g')[0]['entities']) == {'a', 'b'}
@@ -0,0 +1,174 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from kaybee_agent import kg_service
+from kaybee_agent.graph_cache import GraphCache
+from kaybee_agent.graph_store import FilesystemBackend, GraphStore
+
+
+def upsert(entity_id: str, *names: str) -> list[dict]:
+    return [{'op': 'upsert_entity', 'entity': {
+        'entity_id': entity_id, 'entity_names': list(names) or [entity_id], 'properties': {}}}]
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = GraphStore(FilesystemBackend(str(tmp_path)))
+    monkeypatch.setattr(kg_service, 'get_graph_store', lambda: store)
+    monkeypatch.setattr(kg_service, '_graph_cache', GraphCache())
+    return store
+
+
+def test_concurrent_misses_load_once(store, tmp_path, monkeypatch):
+    (tmp_path / 'g.json').write_text(json.dumps({'entities': {}, 'relationships': []}))
+    backend, reads = store.backend, []
+    read = backend.read
+
+    def slow_read(*args, **kwargs):
+        reads.append(args)
+        time.sleep(0.05)
+        return read(*args, **kwargs)
+    monkeypatch.setattr(backend, 'read', slow_read)
+
+    with ThreadPoolExecutor(8) as pool:
+        entries = list(pool.map(lambda _: kg_service._fetch_json_graph('g'), range(8)))
+    assert len(reads) == 1 and all(e is entries[0] for e in entries)
+
+
+def test_concurrent_versioned_misses_load_once(store, monkeypatch):
+    store.append('g', upsert('a'))
+    loads = []
+    load = store.load
+
+    def slow_load(graph_id):
+        loads.append(graph_id)
+        time.sleep(0.05)
+        return load(graph_id)
+    monkeypatch.setattr(store, 'load', slow_load)
+
+    with ThreadPoolExecutor(8) as pool:
+        entries = list(pool.map(lambda _: kg_service._fetch_versioned_graph('g'), range(8)))
+    assert len(loads) == 1 and all(e is entries[0] for e in entries)
+
+
+def test_versioned_fetch_catches_up_on_deltas(store):
+    store.append('g', upsert('a', 'Ann'))
+    entry = kg_service._fetch_versioned_graph('g')
+    matcher = kg_service.get_entity_matcher(entry)
+    assert kg_service._fetch_versioned_graph('g') is entry
+
+    store.append('g', upsert('b', 'Bea'))
+    caught_up = kg_service._fetch_versioned_graph('g')
+    assert caught_up.generation == 2 and set(caught_up.graph['entities']) == {'a', 'b'}
+    # The matcher was carried over and updated, not rebuilt.
+    assert kg_service.get_entity_matcher(caught_up) is matcher
+    assert matcher.match('ann and bea') == {'a', 'b'}
+
+
+@pytest.mark.parametrize('new_deltas', [0, 1])
+def test_versioned_fetch_reloads_after_pruning(store, new_deltas):
+    store.append('g', upsert('a'))
+    assert kg_service._fetch_versioned_graph('g').generation == 1
+
+    # Another writer appends and compacts with pruning: the cached version's successors are gone.
+    store.append('g', upsert('b'))
+    store.compact('g', prune=True)
+    for i in range(new_deltas):
+        store.append('g', upsert(f'c{i}'))
+
+    entry = kg_service._fetch_versioned_graph('g')
+    assert entry.generation == 2 + new_deltas
+    assert {'a', 'b'} <= set(entry.graph['entities'])
+
+
+def test_sample_entity_forgets_stale_visits(store, monkeypatch):
+    for entity_id in 'abc':
+        store.append('g', upsert(entity_id))
+    monkeypatch.setattr(kg_service, 'KG_STORE_FORMAT', 'delta')
+    monkeypatch.setattr(kg_service, '_visited_entities', type(kg_service._visited_entities)(dict))
+
+    sampled = {kg_service.sample_entity('g', policy='stale')['entity']['entity_id'] for _ in range(3)}
+    assert set(kg_service._visited_entities['g']) == sampled
+
+    monkeypatch.setattr(kg_service, 'KG_REVISIT_AFTER_SECONDS', 0)
+    kg_service.sample_entity('g', policy='stale')
+    assert not kg_service._visited_entities['g']
+
+
+def test_sample_entity_neighborhood_is_bounded(store, monkeypatch):
+    store.append('g', upsert('hub') + [
+        op for i in range(20) for op in upsert(f'n{i}') + [{'op': 'upsert_relationship', 'relationship': {
+            'source_entity_id': 'hub', 'target_entity_id': f'n{i}', 'relationship': 'knows'}}]])
+    monkeypatch.setattr(kg_service, 'KG_STORE_FORMAT', 'delta')
+    monkeypatch.setattr(kg_service, 'KG_MAX_NODES', 5)
+    sample = kg_service.sample_entity('g')
+    assert len(sample['entity_neighborhood']['entities']) <= 5
+
+
+def test_streamed_extraction_holds_a_retrieval_slot(store, monkeypatch):
+    store.append('g', upsert('a', 'Ann'))
+    monkeypatch.setattr(kg_service, 'KG_STORE_FORMAT', 'delta')
+
+    async def stream():
+        semaphore = asyncio.Semaphore(1)
+        monkeypatch.setattr(kg_service, '_retrieval_semaphore', semaphore)
+        seeds, future = await kg_service.astream_relevant_neighborhood('ann', 'g')
+        assert seeds['seed_entity_ids'] == ['a']
+        # Until the full neighborhood is extracted, no other retrieval starts.
+        assert semaphore.locked() or future.done()
+        nbhd = await future
+        assert not semaphore.locked()
+        return nbhd
+
+    assert set(asyncio.run(stream())['entities']) == {'a'}
+
+
+@pytest.fixture
+def prefetches(store, monkeypatch):
+    monkeypatch.setattr(kg_service, 'KG_STORE_FORMAT', 'delta')
+    monkeypatch.setattr(kg_service, '_prefetches', {})
+    monkeypatch.setattr(kg_service, '_prefetch_stats', dict.fromkeys(kg_service._prefetch_stats, 0))
+    store.append('g', upsert('a', 'Ann'))
+    return kg_service._prefetches
+
+
+def test_prefetch_is_used_once_without_keeping_the_graph(prefetches):
+    async def prefetch_and_retrieve():
+        await kg_service.prefetch_graph('g')
+        prefetch = prefetches['g']
+        assert prefetch.task is None and prefetch.generation == 1
+        return await kg_service.aget_relevant_neighborhood('ann', 'g')
+
+    assert set(asyncio.run(prefetch_and_retrieve())['entities']) == {'a'}
+    assert not prefetches
+    assert kg_service.prefetch_stats()['ready'] == 1
+
+
+def test_prefetch_of_a_replaced_graph_saves_nothing(prefetches, store):
+    async def prefetch_update_and_retrieve():
+        await kg_service.prefetch_graph('g')
+        store.append('g', upsert('b', 'Bea'))
+        await kg_service.aget_relevant_neighborhood('ann', 'g')
+
+    asyncio.run(prefetch_update_and_retrieve())
+    stats = kg_service.prefetch_stats()
+    assert stats['ready'] == 0 and stats['missed'] == 1 and stats['saved_ms'] == 0
+
+
+@pytest.mark.parametrize('reason', ['ttl', 'eviction'])
+def test_unused_prefetch_expires(prefetches, monkeypatch, reason):
+    async def prefetch():
+        await kg_service.prefetch_graph('g')
+
+    asyncio.run(prefetch())
+    assert 'g' in prefetches
+    if reason == 'ttl':
+        monkeypatch.setattr(kg_service, 'KG_PREFETCH_TTL_SECONDS', 0)
+    else:
+        kg_service._graph_cache.invalidate('g')
+    assert kg_service.prefetch_stats()['expired'] == 1
+    assert not prefetches
@@ -0,0 +1,136 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from benchmarks.mcp_pool import _free_port, _wait_for_server
+from kaybee_agent.mcp_pool import GRAPH_ID_HEADER, McpSessionPool
+
+
+def start_server(root) -> tuple[subprocess.Popen, str]:
+    '''Starts the offline MCP stand-in on graphs in `root`, returning it and its URL once it answers.'''
+    port = _free_port()
+    env = {**os.environ, 'KG_STORE': 'fs', 'KG_STORE_ROOT': str(root), 'DEFAULT_GRAPH_ID': 'g0'}
+    server = subprocess.Popen(
+            [sys.executable, '-m', 'kaybee_agent.offline_mcp', '--port', str(port)],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{port}/mcp'
+    try:
+        asyncio.run(_wait_for_server(url))
+    except BaseException:
+        server.terminate()
+        raise
+    return server, url
+
+
+@pytest.fixture(scope='module')
+def server(tmp_path_factory):
+    root = tmp_path_factory.mktemp('graphs')
+    for graph_id in ('g0', 'g1'):
+        player = f'{graph_id} Prospect'
+        graph = {'entities': {player: {'entity_id': player, 'entity_names': [player], 'properties': {}}},
+                 'relationships': []}
+        (root / f'{graph_id}.json').write_text(json.dumps(graph))
+    server, url = start_server(root)
+    yield root, url
+    server.terminate()
+    server.wait()
+
+
+def test_sessions_are_pooled_per_graph(server):
+    _, url = server
+
+    async def run():
+        pool = McpSessionPool(url, headers={GRAPH_ID_HEADER: 'g0'})
+        try:
+            default = await pool.session()
+            assert await pool.session({GRAPH_ID_HEADER: 'g0'}) is default
+            other = await pool.session({GRAPH_ID_HEADER: 'g1'})
+            assert other is not default
+            for graph_id, session in (('g0', default), ('g1', other)):
+                result = await session.call_tool('search_knowledge_graph', {'query': f'{graph_id} prospect'})
+                assert f'{graph_id} Prospect' in result.content[0].text
+            assert pool.stats() == {'hits': 1, 'opened': 2, 'failed': 0, 'dropped': 0, 'sessions': 2}
+        finally:
+            await pool.close()
+        assert pool.stats()['sessions'] == 0
+
+    asyncio.run(run())
+
+
+def test_tools_are_cached(server):
+    _, url = server
+
+    async def run():
+        pool = McpSessionPool(url, tools_ttl_seconds=60)
+        try:
+            tools = await pool.list_tools()
+            assert 'search_knowledge_graph' in {tool.name for tool in tools}
+            assert await pool.list_tools() is tools
+        finally:
+            await pool.close()
+
+    asyncio.run(run())
+
+
+def test_least_recently_used_sessions_are_evicted(server):
+    _, url = server
+
+    async def run():
+        pool = McpSessionPool(url, max_sessions=1)
+        try:
+            first = await pool.session({GRAPH_ID_HEADER: 'g0'})
+            await pool.session({GRAPH_ID_HEADER: 'g1'})
+            assert pool.stats()['sessions'] == 1
+            assert await pool.session({GRAPH_ID_HEADER: 'g0'}) is not first
+        finally:
+            await pool.close()
+
+    asyncio.run(run())
+
+
+def test_sessions_whose_keeper_ended_are_replaced(server):
+    _, url = server
+
+    async def run():
+        pool = McpSessionPool(url)
+        try:
+            first = await pool.session()
+            (conn,) = pool._connections.values()
+            conn.task.cancel()
+            await asyncio.gather(conn.task, return_exceptions=True)
+            assert not conn.alive
+            assert await pool.session() is not first
+        finally:
+            await pool.close()
+
+    asyncio.run(run())
+
+
+def test_lost_server_is_found_by_pings(tmp_path):
+    (tmp_path / 'g0.json').write_text('{"entities": {}, "relationships": []}')
+    server, url = start_server(tmp_path)
+
+    async def run():
+        pool = McpSessionPool(url, ping_seconds=0.2, timeout=2)
+        try:
+            await pool.session()
+            (conn,) = pool._connections.values()
+            server.terminate()
+            server.wait()
+            await asyncio.wait_for(conn.task, 10)
+            assert not conn.alive
+            assert pool.stats()['sessions'] == 0 and pool.stats()['dropped'] == 1
+            with pytest.raises(Exception):
+                await pool.session()
+        finally:
+            await pool.close()
+
+    try:
+        asyncio.run(run())
+    finally:
+        server.kill()
+        server.wait()
@@ -0,0 +1,128 @@
+import json
+
+import pytest
+
+from benchmarks.property_index import QUERIES, _agree, add_throwing_hands, run_index, run_scan
+from benchmarks.synthetic import make_scouting_graph
+from kaybee_agent.property_index import PropertyIndex, parse_aggregate, parse_filter
+
+
+@pytest.fixture(scope='module')
+def graph():
+    graph = make_scouting_graph(2000, relationships_per_player=1)
+    add_throwing_hands(graph)
+    return graph
+
+
+@pytest.mark.parametrize('name', QUERIES)
+def test_queries_agree_with_scan(graph, name):
+    index = PropertyIndex(graph['entities'])
+    query = QUERIES[name]
+    assert _agree(query, run_index(index, query, 20), run_scan(graph['entities'], query, 20), graph['entities'])
+
+
+def test_parse_filter():
+    assert parse_filter('age < 22') == ('age', '<', '22')
+    assert parse_filter('position = P') == ('position', '==', 'P')
+    assert parse_filter('position == P') == ('position', '==', 'P')
+    assert parse_filter('age <= 22') == ('age', '<=', '22')
+    assert parse_filter('position in P, "SS"') == ('position', 'in', ['P', 'SS'])
+    assert parse_filter('throws missing') == ('throws', 'missing', None)
+    for text in ['age', 'age <', 'throws exists L']:
+        with pytest.raises(ValueError):
+            parse_filter(text)
+
+
+def test_parse_aggregate():
+    assert parse_aggregate('count') == ('count', None)
+    assert parse_aggregate('AVG(era)') == ('mean', 'era')
+    for text in ['median(era)', 'sum']:
+        with pytest.raises(ValueError):
+            parse_aggregate(text)
+
+
+def test_column_types_and_filters():
+    index = PropertyIndex({
+        'a': {'properties': {'age': 20, 'active': True, 'city': 'New York'}},
+        'b': {'properties': {'age': '31', 'active': False, 'city': 'york'}},
+        'c': {'properties': {'age': 25.5, 'city': None}},
+    })
+    assert {name: c.kind for name, c in index.columns.items()} == {
+        'active': 'bool', 'age': 'number', 'city': 'category'}
+
+    def ids(*filters):
+        return index.query([parse_filter(f) for f in filters], limit=None)[1]
+
+    assert ids('age >= 25') == ['b', 'c']
+    assert ids('Active == true') == ['a']
+    assert ids('city contains YORK') == ['a', 'b']
+    assert ids('city == York') == ['b']
+    assert ids('city missing') == ['c']
+    assert ids('age not in 20, 31') == ['c']
+    with pytest.raises(ValueError, match='age'):
+        ids('age < young')
+    with pytest.raises(ValueError, match='Unknown property'):
+        ids('height > 2')
+
+
+@pytest.mark.parametrize('values', [
+    [[1, 2], [3, 4], [5, 6]],
+    [[1], [2, 3], []],
+    [{'ops': 0.9}, {'ops': 0.7}, {'ops': 0.9}],
+    [1, [2], {'x': 3}],
+])
+def test_lists_and_dicts_are_json_categories(values):
+    index = PropertyIndex({e: {'properties': {'stats': v}} for e, v in zip('abc', values)})
+    column = index.columns['stats']
+    assert column.kind == 'category'
+    assert [column.value(row) for row in range(3)] == [json.dumps(v) for v in values]
+    assert index.describe()['stats']['entities'] == 3
+    assert index.query([parse_filter(f'stats == {json.dumps(values[0])}')], limit=None)[1][0] == 'a'
+
+
+def test_sort_and_limit(graph):
+    index = PropertyIndex(graph['entities'])
+    count, ids = index.query([parse_filter('era exists')], sort_by='era', descending=True, limit=5)
+    eras = sorted((e['properties']['era'] for e in graph['entities'].values() if 'era' in e['properties']), reverse=True)
+    assert count == len(eras)
+    assert [graph['entities'][i]['properties']['era'] for i in ids] == eras[:5]
+
+
+def test_aggregate_groups():
+    index = PropertyIndex({
+        'a': {'properties': {'team': 'x', 'age': 20}},
+        'b': {'properties': {'team': 'x', 'age': 30}},
+        'c': {'properties': {'team': 'y'}},
+        'd': {'properties': {'age': 40}},
+    })
+    result = index.aggregate(aggregates=[('count', None), ('min', 'age'), ('mean', 'age')], group_by='team')
+    assert result == {'count': 4, 'groups': 3, 'values': [
+        {'team': 'x', 'count': 2, 'min(age)': 20, 'mean(age)': 25.0},
+        {'team': 'y', 'count': 1, 'min(age)': None, 'mean(age)': None},
+        {'team': None, 'count': 1, 'min(age)': 40, 'mean(age)': 40.0},
+    ]}
+    with pytest.raises(ValueError):
+        index.aggregate(aggregates=[('sum', 'team')])
+
+
+def test_non_dict_properties_are_indexed_as_none():
+    index = PropertyIndex({
+        'a': {'properties': {'age': 20}},
+        'b': {'properties': 'retired pitcher'},
+        'c': {'properties': ['x', 'y']},
+        'd': {},
+    })
+    assert len(index) == 4
+    assert index.query([parse_filter('age missing')]) == (3, ['b', 'c', 'd'])
+
+
+def test_describe_is_json_without_nan():
+    index = PropertyIndex({
+        'a': {'properties': {'era': 'nan', 'age': 20}},
+        'b': {'properties': {'era': float('nan'), 'age': float('nan')}},
+        'c': {'properties': {'age': 30}},
+    })
+    summary = index.describe()
+    assert summary['era'] == {'type': 'number', 'entities': 2, 'min': None, 'max': None}
+    assert summary['age'] == {'type': 'number', 'entities': 3, 'min': 20, 'max': 30}
+    json.dumps(summary, allow_nan=False)
@@ -0,0 +1,26 @@
+from kaybee_agent import tools
+from kaybee_agent.kg_service import MemoizedNeighborhood
+
+
+def neighborhood(cls=dict):
+    return cls({
+        'entities': {'a': {'entity_id': 'a', 'entity_names': ['Ann'], 'properties': {'age': 20}}},
+        'relationships': [],
+        'seed_entity_ids': ['a'],
+    })
+
+
+def test_context_is_kept_with_a_memoized_neighborhood():
+    nbhd = neighborhood(MemoizedNeighborhood)
+    context = tools._build_context(nbhd, 'g')
+    assert nbhd.derived['context'] is context
+    assert tools._build_context(nbhd, 'g') is context
+    # Another version's neighborhood, even if equal, gets its own context.
+    assert tools._build_context(neighborhood(MemoizedNeighborhood), 'g') is not context
+
+
+def test_ad_hoc_neighborhoods_are_not_memoized():
+    nbhd = neighborhood()
+    first = tools._build_context(nbhd, 'g')
+    assert tools._build_context(nbhd, 'g') is not first
+    assert first.text == tools._build_context(nbhd, 'g').text
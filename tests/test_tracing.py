@@ -0,0 +1,70 @@
+import json
+
+import pytest
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SpanExportResult
+
+from kaybee_agent.local_backends import FakeBlob, FakeLoggingClient, FakeStorageClient, FakeTraceClient
+from tracing import MAX_LOG_ATTRIBUTES_BYTES, TRUNCATED_ATTRIBUTE_BYTES, CloudTraceLoggingSpanExporter
+
+
+@pytest.fixture
+def exporter():
+    return CloudTraceLoggingSpanExporter(
+        project_id='test', client=FakeTraceClient(),
+        logging_client=FakeLoggingClient(), storage_client=FakeStorageClient())
+
+
+def make_span():
+    tracer = TracerProvider().get_tracer(__name__)
+    with tracer.start_as_current_span('parent'):
+        span = tracer.start_span('child', attributes={'query': 'who', 'ids': ['a', 'b'], 'n': 2})
+        span.add_event('matched', {'entities': 3})
+        span.end()
+    return span
+
+
+def span_dict(**attributes) -> dict:
+    return {'span_id': '1', 'attributes': attributes}
+
+
+def test_small_attributes_stay(exporter):
+    assert exporter._process_large_attributes(span_dict(a='x'), '1')['attributes'] == {'a': 'x'}
+
+
+def test_largest_attributes_are_offloaded(exporter):
+    big, small = 'x' * MAX_LOG_ATTRIBUTES_BYTES, 'y' * 1000
+    attributes = exporter._process_large_attributes(span_dict(big=big, small=small), '1')['attributes']
+    assert attributes['small'] == small
+    assert attributes['big']['uri_payload'].startswith('gs://')
+    assert attributes['big']['bytes'] == len(json.dumps(big))
+    assert exporter.storage_client.bytes_uploaded > 0
+
+
+def test_failed_uploads_keep_a_truncated_attribute(exporter, monkeypatch):
+    def fail(self, *args, **kwargs):
+        raise ConnectionError('GCS unavailable')
+
+    monkeypatch.setattr(FakeBlob, 'upload_from_string', fail)
+    big = 'x' * MAX_LOG_ATTRIBUTES_BYTES
+    attributes = exporter._process_large_attributes(span_dict(big=big), '1')['attributes']
+    assert 'uri_payload' not in attributes['big']
+    assert attributes['big']['truncated_payload'] == json.dumps(big)[:TRUNCATED_ATTRIBUTE_BYTES]
+    assert len(json.dumps(attributes)) < MAX_LOG_ATTRIBUTES_BYTES
+
+
+def test_span_dicts_match_the_sdk_json(exporter):
+    span = make_span()
+    expected = json.loads(span.to_json())
+    context = span.get_span_context()
+    expected.update(
+        trace=f'projects/test/traces/{context.trace_id:x}', span_id=f'{context.span_id:x}')
+    assert exporter._span_to_dict(span) == expected
+
+
+def test_export_after_shutdown_runs_inline(exporter):
+    # As at interpreter exit, when the batch processor flushes its last spans.
+    exporter._executor.shutdown()
+    assert exporter.export([make_span()]) == SpanExportResult.SUCCESS
+    assert exporter.logging_client.num_entries == 1
+    assert exporter.client.num_spans == 1
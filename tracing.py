@@ -12,16 +12,71 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import gzip
+import hashlib
 import json
 import logging
-from collections.abc import Sequence
-from typing import Any
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque
+from collections.abc import Callable, Sequence
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any
 
-import google.cloud.storage as storage
-from google.cloud import logging as google_cloud_logging
+from google.api_core.exceptions import PreconditionFailed
+from opentelemetry import metrics
+from opentelemetry import trace as trace_api
 from opentelemetry.exporter.cloud_trace import CloudTraceSpanExporter
 from opentelemetry.sdk.trace import ReadableSpan
-from opentelemetry.sdk.trace.export import SpanExportResult
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter, SpanExportResult
+from opentelemetry.sdk.util import ns_to_iso_str
+
+from kaybee_agent import gcs
+
+if TYPE_CHECKING:
+    # Built by the exporter (on the first export, with LazySpanExporter), not at import.
+    import google.cloud.storage as storage
+    from google.cloud import logging as google_cloud_logging
+
+_meter = metrics.get_meter(__name__)
+_export_duration = _meter.create_histogram(
+    "span_export.duration", unit="ms", description="Time to export one batch of spans."
+)
+_exported_spans = _meter.create_counter(
+    "span_export.spans", unit="1", description="Spans exported, by result."
+)
+_log_write_calls = _meter.create_counter(
+    "span_export.log_writes", unit="1", description="Cloud Logging write calls made."
+)
+_dropped_spans = _meter.create_counter(
+    "span_export.dropped", unit="1", description="Spans dropped because the export queue was full."
+)
+_offload_bytes = _meter.create_counter(
+    "span_export.offload.bytes", unit="By", description="Compressed bytes written to GCS for offloaded attributes."
+)
+_offload_dedup_hits = _meter.create_counter(
+    "span_export.offload.dedup_hits", unit="1", description="Offloaded attributes already stored in GCS."
+)
+_log_entry_attributes_bytes = _meter.create_histogram(
+    "span_export.log_entry.attributes_size", unit="By", description="Size of span attributes as logged."
+)
+_processors: "weakref.WeakSet[MeteredBatchSpanProcessor]" = weakref.WeakSet()
+_meter.create_observable_gauge(
+    "span_export.queue_depth",
+    callbacks=[
+        lambda options: [metrics.Observation(sum(p.queue_depth() for p in list(_processors)))]
+    ],
+    unit="1",
+    description="Spans waiting in the export queue.",
+)
+
+# Cloud Logging entries are limited to 256 KB; leave room for the rest of the entry.
+MAX_LOG_ATTRIBUTES_BYTES = 250 * 1024
+# What is kept of an oversized attribute that could not be stored in GCS.
+TRUNCATED_ATTRIBUTE_BYTES = 8 * 1024
+# Content hashes known to be stored in GCS, to skip re-uploading repeated payloads.
+_MAX_STORED_HASHES = 10_000
 
 
 class CloudTraceLoggingSpanExporter(CloudTraceSpanExporter):
@@ -35,115 +90,368 @@ class CloudTraceLoggingSpanExporter(CloudTraceSpanExporter):
 
     def __init__(
         self,
-        logging_client: google_cloud_logging.Client | None = None,
-        storage_client: storage.Client | None = None,
+        logging_client: "google_cloud_logging.Client | None" = None,
+        storage_client: "storage.Client | None" = None,
         bucket_name: str | None = None,
         debug: bool = False,
+        max_batch_entries: int = 32,
+        max_workers: int = 8,
         **kwargs: Any,
     ) -> None:
         """
         Initialize the exporter with Google Cloud clients and configuration.
 
         :param logging_client: Google Cloud Logging client
-        :param storage_client: Google Cloud Storage client
+        :param storage_client: Google Cloud Storage client (defaults to the process-wide shared client)
         :param bucket_name: Name of the GCS bucket to store large payloads
         :param debug: Enable debug mode for additional logging
+        :param max_batch_entries: Maximum number of log entries per Cloud Logging write call
+            (entries are at most 256 KB, so the default stays under the 10 MB request limit)
+        :param max_workers: Threads used for the Cloud Trace export and concurrent GCS offloads
         :param kwargs: Additional arguments to pass to the parent class
         """
         super().__init__(**kwargs)
         self.debug = debug
-        self.logging_client = logging_client or google_cloud_logging.Client(
-            project=self.project_id
-        )
+        if logging_client is None:
+            from google.cloud import logging as google_cloud_logging
+
+            logging_client = google_cloud_logging.Client(project=self.project_id)
+        self.logging_client = logging_client
         self.logger = self.logging_client.logger(__name__)
-        self.storage_client = storage_client or storage.Client(project=self.project_id)
+        self.storage_client = storage_client or gcs.get_client(project=self.project_id)
         self.bucket_name = bucket_name or f"{self.project_id}-kaybee-agent-logs-data"
-        self.bucket = self.storage_client.bucket(self.bucket_name)
+        self.bucket = gcs.get_bucket(self.bucket_name, client=self.storage_client)
+        self.max_batch_entries = max_batch_entries
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="span-export"
+        )
+        self._stored_hashes: OrderedDict[str, None] = OrderedDict()
+        self._stored_hashes_lock = threading.Lock()
 
     def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
         """
         Export the spans to Google Cloud Logging and Cloud Trace.
 
+        The Cloud Trace export runs concurrently with preparing the log entries,
+        large attributes of different spans are offloaded to GCS concurrently, and
+        the entries are written in batched Cloud Logging calls.
+
         :param spans: A sequence of spans to export
         :return: The result of the export operation
         """
-        for span in spans:
-            span_context = span.get_span_context()
-            trace_id = format(span_context.trace_id, "x")
-            span_id = format(span_context.span_id, "x")
-            span_dict = json.loads(span.to_json())
+        start = time.perf_counter()
 
-            span_dict["trace"] = f"projects/{self.project_id}/traces/{trace_id}"
-            span_dict["span_id"] = span_id
+        # Export spans to Google Cloud Trace using the parent class method
+        trace_export = self._submit(super().export, spans)
 
-            span_dict = self._process_large_attributes(
-                span_dict=span_dict, span_id=span_id
+        offloads = [
+            self._submit(
+                self._process_large_attributes,
+                span_dict=span_dict,
+                span_id=span_dict["span_id"],
             )
+            for span_dict in map(self._span_to_dict, spans)
+        ]
+        span_dicts = [offload.result() for offload in offloads]
+        logged = self._write_log_entries(span_dicts)
+        result = trace_export.result()
+        if not logged:
+            result = SpanExportResult.FAILURE
 
-            if self.debug:
-                print(span_dict)
-
-            # Log the span data to Google Cloud Logging
-            self.logger.log_struct(
-                span_dict,
-                labels={
-                    "type": "agent_telemetry",
-                    "service_name": "kaybee-agent",
-                },
-                severity="INFO",
-            )
-        # Export spans to Google Cloud Trace using the parent class method
-        return super().export(spans)
+        _export_duration.record(1000 * (time.perf_counter() - start))
+        _exported_spans.add(len(spans), {"result": result.name})
+        return result
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
+        super().shutdown()
+
+    def _submit(self, fn: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Future:
+        """
+        Run `fn` on the exporter's pool, or inline once the pool no longer takes
+        work: after `shutdown`, or at interpreter exit, when the batch processor
+        flushes its last spans.
 
-    def store_in_gcs(self, content: str, span_id: str) -> str:
+        :return: A future of the result
         """
-        Initiate storing large content in Google Cloud Storage/
+        try:
+            return self._executor.submit(fn, *args, **kwargs)
+        except RuntimeError:
+            future: Future = Future()
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            return future
 
-        :param content: The content to store
-        :param span_id: The ID of the span
-        :return: The  GCS URI of the stored content
+    def _span_to_dict(self, span: ReadableSpan) -> dict:
         """
-        if not self.storage_client.bucket(self.bucket_name).exists():
+        Build the log entry for a span, in the format of `ReadableSpan.to_json`,
+        plus its trace and span IDs, without serializing it to JSON and back.
+
+        :param span: The span to convert
+        :return: The span data dictionary
+        """
+        context = span.get_span_context()
+        status = {"status_code": span.status.status_code.name}
+        if span.status.description:
+            status["description"] = span.status.description
+        span_dict = {
+            "name": span.name,
+            "context": _format_context(context) if context else None,
+            "kind": str(span.kind),
+            "parent_id": (
+                f"0x{trace_api.format_span_id(span.parent.span_id)}" if span.parent else None
+            ),
+            "start_time": ns_to_iso_str(span.start_time) if span.start_time else None,
+            "end_time": ns_to_iso_str(span.end_time) if span.end_time else None,
+            "status": status,
+            "attributes": _format_attributes(span.attributes),
+            "events": [
+                {
+                    "name": event.name,
+                    "timestamp": ns_to_iso_str(event.timestamp),
+                    "attributes": _format_attributes(event.attributes),
+                }
+                for event in span.events
+            ],
+            "links": [
+                {
+                    "context": _format_context(link.context),
+                    "attributes": _format_attributes(link.attributes),
+                }
+                for link in span.links
+            ],
+            "resource": {
+                "attributes": _format_attributes(span.resource.attributes),
+                "schema_url": span.resource.schema_url,
+            },
+        }
+        span_dict["trace"] = f"projects/{self.project_id}/traces/{format(context.trace_id, 'x')}"
+        span_dict["span_id"] = format(context.span_id, "x")
+        return span_dict
+
+    def _write_log_entries(self, span_dicts: list[dict]) -> bool:
+        """
+        Log the span data to Google Cloud Logging, in batches of `max_batch_entries`.
+
+        :param span_dicts: The span data dictionaries to log
+        :return: Whether all batches were written
+        """
+        ok = True
+        for i in range(0, len(span_dicts), self.max_batch_entries):
+            batch = self.logger.batch()
+            for span_dict in span_dicts[i : i + self.max_batch_entries]:
+                if self.debug:
+                    print(span_dict)
+                batch.log_struct(
+                    span_dict,
+                    labels={
+                        "type": "agent_telemetry",
+                        "service_name": "kaybee-agent",
+                    },
+                    severity="INFO",
+                )
+            try:
+                # With partial success, one bad entry doesn't drop the rest of the batch.
+                batch.commit(partial_success=True)
+            except Exception:
+                logging.exception("Failed to write span log entries to Cloud Logging")
+                ok = False
+            _log_write_calls.add(1)
+        return ok
+
+    def store_in_gcs(self, content: bytes, content_hash: str) -> str | None:
+        """
+        Initiate storing large content in Google Cloud Storage, gzip-compressed and
+        named by its content hash, so that identical payloads are stored only once.
+
+        :param content: The (uncompressed) content to store
+        :param content_hash: The SHA-256 hex digest of the content
+        :return: The GCS URI of the stored content, or None if it could not be stored
+        """
+        if not gcs.bucket_exists(self.bucket, call_site="tracing.store_in_gcs"):
             logging.warning(
                 f"Bucket {self.bucket_name} not found. "
                 "Unable to store span attributes in GCS."
             )
-            return "GCS bucket not found"
+            return None
+
+        blob_name = f"spans/sha256/{content_hash}.json.gz"
+        uri = f"gs://{self.bucket_name}/{blob_name}"
+        with self._stored_hashes_lock:
+            if content_hash in self._stored_hashes:
+                self._stored_hashes.move_to_end(content_hash)
+                _offload_dedup_hits.add(1)
+                return uri
 
-        blob_name = f"spans/{span_id}.json"
         blob = self.bucket.blob(blob_name)
+        # Served decompressed to clients that don't accept gzip.
+        blob.content_encoding = "gzip"
+        compressed = gzip.compress(content, compresslevel=6)
+        try:
+            with gcs.track("tracing.store_in_gcs", "upload"):
+                blob.upload_from_string(
+                    compressed, "application/json", if_generation_match=0
+                )
+            _offload_bytes.add(len(compressed))
+        except PreconditionFailed:
+            # Another process already stored this payload.
+            _offload_dedup_hits.add(1)
+        except Exception:
+            logging.exception(f"Failed to store span attributes in {uri}")
+            return None
 
-        blob.upload_from_string(content, "application/json")
-        return f"gs://{self.bucket_name}/{blob_name}"
+        with self._stored_hashes_lock:
+            self._stored_hashes[content_hash] = None
+            if len(self._stored_hashes) > _MAX_STORED_HASHES:
+                self._stored_hashes.popitem(last=False)
+        return uri
 
     def _process_large_attributes(self, span_dict: dict, span_id: str) -> dict:
         """
         Process large attribute values by storing them in GCS if they exceed the size
         limit of Google Cloud Logging.
 
+        Only the largest attributes are offloaded, just enough of them for the rest
+        to fit within the limit; each is replaced by a small reference to its
+        content in GCS, or if it could not be stored, by its first
+        TRUNCATED_ATTRIBUTE_BYTES serialized bytes.
+
         :param span_dict: The span data dictionary
-        :param trace_id: The trace ID
         :param span_id: The span ID
         :return: The updated span dictionary
         """
-        attributes = span_dict["attributes"]
-        if len(json.dumps(attributes).encode()) > 255 * 1024:  # 250 KB
-            # Separate large payload from other attributes
-            attributes_payload = dict(attributes.items())
-            attributes_retain = dict(attributes.items())
-
-            # Store large payload in GCS
-            gcs_uri = self.store_in_gcs(json.dumps(attributes_payload), span_id)
-            attributes_retain["uri_payload"] = gcs_uri
-            attributes_retain["url_payload"] = (
-                f"https://storage.mtls.cloud.google.com/"
-                f"{self.bucket_name}/spans/{span_id}.json"
-            )
+        attributes = span_dict["attributes"] or {}
+        # Serialize each value once; the sizes decide what to offload and the
+        # bytes are what gets stored.
+        serialized = {
+            key: json.dumps(value).encode() for key, value in attributes.items()
+        }
+        # Each attribute also costs its quoted key, a colon and a comma.
+        sizes = {key: len(data) + len(key) + 4 for key, data in serialized.items()}
+        total_size = sum(sizes.values()) + 2
+
+        if total_size > MAX_LOG_ATTRIBUTES_BYTES:
+            attributes_retain = dict(attributes)
+            for key in sorted(sizes, key=sizes.get, reverse=True):
+                if total_size <= MAX_LOG_ATTRIBUTES_BYTES:
+                    break
+                content_hash = hashlib.sha256(serialized[key]).hexdigest()
+                gcs_uri = self.store_in_gcs(serialized[key], content_hash)
+                if gcs_uri is None:
+                    reference = {
+                        "truncated_payload": serialized[key][:TRUNCATED_ATTRIBUTE_BYTES].decode(
+                            errors="ignore"
+                        ),
+                    }
+                else:
+                    reference = {
+                        "uri_payload": gcs_uri,
+                        "url_payload": (
+                            f"https://storage.mtls.cloud.google.com/"
+                            f"{gcs_uri.removeprefix('gs://')}"
+                        ),
+                    }
+                reference.update(sha256=content_hash, bytes=len(serialized[key]))
+                attributes_retain[key] = reference
+                total_size += len(json.dumps(reference)) + len(key) + 4 - sizes[key]
 
             span_dict["attributes"] = attributes_retain
             logging.info(
-                "Length of payload span above 250 KB, storing attributes in GCS "
-                "to avoid large log entry errors"
+                f"Length of payload span {span_id} above 250 KB, storing its largest "
+                "attributes in GCS to avoid large log entry errors"
             )
 
+        _log_entry_attributes_bytes.record(total_size)
         return span_dict
+
+
+def _format_context(context: trace_api.SpanContext) -> dict:
+    return {
+        "trace_id": f"0x{trace_api.format_trace_id(context.trace_id)}",
+        "span_id": f"0x{trace_api.format_span_id(context.span_id)}",
+        "trace_state": repr(context.trace_state),
+    }
+
+
+def _format_attributes(attributes: Any) -> dict | None:
+    # Sequence values are tuples in the SDK; as JSON they are lists.
+    if attributes is None:
+        return None
+    return {
+        key: list(value) if isinstance(value, tuple) else value
+        for key, value in attributes.items()
+    }
+
+
+class LazySpanExporter(SpanExporter):
+    """
+    A span exporter that builds the exporter it delegates to on the first export,
+    so its clients (and their credential lookups) are built by the batch
+    processor's worker thread rather than at server startup.
+    """
+
+    def __init__(self, factory: Callable[[], SpanExporter]) -> None:
+        self._factory = factory
+        self._exporter: SpanExporter | None = None
+        self._lock = threading.Lock()
+
+    def _get(self) -> SpanExporter:
+        with self._lock:
+            if self._exporter is None:
+                self._exporter = self._factory()
+            return self._exporter
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        return self._get().export(spans)
+
+    def shutdown(self) -> None:
+        if self._exporter is not None:
+            self._exporter.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self._exporter.force_flush(timeout_millis) if self._exporter is not None else True
+
+
+class MeteredBatchSpanProcessor(BatchSpanProcessor):
+    """
+    A BatchSpanProcessor that reports its queue depth and the spans it drops
+    because the queue is full (which BatchSpanProcessor does silently).
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.dropped_spans = 0
+        self._span_queue = self._find_queue()
+        if self._span_queue is None:
+            logging.warning(
+                "Span export queue not found in this OpenTelemetry SDK; "
+                "not reporting its depth or dropped spans."
+            )
+        _processors.add(self)
+
+    def _find_queue(self) -> deque | None:
+        # The queue is internal to the SDK: it moved from BatchSpanProcessor.queue
+        # to BatchProcessor._queue in 1.28. Only trust a bounded deque.
+        for owner, name in ((getattr(self, "_batch_processor", None), "_queue"), (self, "queue")):
+            queue = getattr(owner, name, None)
+            if isinstance(queue, deque) and queue.maxlen is not None:
+                return queue
+        return None
+
+    def queue_depth(self) -> int:
+        queue = self._span_queue
+        return len(queue) if queue is not None else 0
+
+    def on_end(self, span: ReadableSpan) -> None:
+        queue = self._span_queue
+        if (
+            span.context.trace_flags.sampled
+            and queue is not None
+            and len(queue) >= queue.maxlen
+        ):
+            self.dropped_spans += 1
+            _dropped_spans.add(1)
+        super().on_end(span)
+